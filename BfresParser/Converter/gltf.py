@@ -0,0 +1,265 @@
+import io
+import json
+import struct
+
+import numpy as np
+
+from BfresParser.buffers import get_bytes, hash_array
+from BfresParser.FMDL.fskl import get_bone_arrays, get_bone_quaternions, get_world_matrices
+
+
+# glTF component types
+COMPONENT_TYPES = {
+    np.dtype(np.int8): 5120,
+    np.dtype(np.uint8): 5121,
+    np.dtype(np.int16): 5122,
+    np.dtype(np.uint16): 5123,
+    np.dtype(np.uint32): 5125,
+    np.dtype(np.float32): 5126
+}
+
+ACCESSOR_TYPES = {1: "SCALAR", 2: "VEC2", 3: "VEC3", 4: "VEC4", 16: "MAT4"}
+
+# Primitive size --> glTF mode, vertices kept from every primitive
+PRIMITIVE_MODES = {
+    1: [0, [0]],
+    2: [1, [0, 1]],
+    3: [4, [0, 1, 2]],
+    4: [4, [0, 1, 2, 0, 2, 3]],
+    6: [4, [0, 2, 4]]
+}
+
+
+class GlbConverter:
+    def __init__(self, data):
+        self.data = data
+
+    def create_glb(self):
+        file = io.BytesIO()
+        self.write_glb(file)
+        return file.getvalue()
+
+    def write_glb(self, file):
+        gltf, chunks = self.build()
+        json_chunk = json.dumps(gltf, separators=(",", ":")).encode("utf-8")
+        json_chunk += b" " * (-len(json_chunk) % 4)
+        binary_length = sum(len(chunk) for chunk in chunks)
+
+        file.write(struct.pack("<4sII", b"glTF", 2, 12 + 8 + len(json_chunk) + 8 + binary_length))
+        file.write(struct.pack("<I4s", len(json_chunk), b"JSON"))
+        file.write(json_chunk)
+        file.write(struct.pack("<I4s", binary_length, b"BIN\0"))
+        # Arrays are written as they are, never joined into a single buffer
+        for chunk in chunks:
+            file.write(chunk)
+
+    def build(self):
+        self.gltf = {
+            "asset": {"version": "2.0", "generator": "bfres_parser"},
+            "scene": 0,
+            "scenes": [{"name": self.data["header"]["name"], "nodes": []}],
+            "nodes": [],
+            "meshes": [],
+            "materials": [],
+            "skins": [],
+            "accessors": [],
+            "bufferViews": [],
+            "buffers": []
+        }
+        self.chunks = []
+        self.length = 0
+        self.accessors = {}
+
+        for model in self.data["fmdl"]:
+            self.gltf["scenes"][0]["nodes"].append(self.add_model(model))
+
+        self.gltf["buffers"].append({"byteLength": self.length})
+        for key in ("meshes", "materials", "skins"):
+            if not self.gltf[key]:
+                del self.gltf[key]
+        return self.gltf, self.chunks
+
+    def add_model(self, model):
+        model_node = self.add_node({"name": model["header"]["name"], "children": []})
+
+        first_material = len(self.gltf["materials"])
+        for material in model["header"]["fmat_dict"] or []:
+            self.gltf["materials"].append({"name": material[0]})
+
+        fskl = model["fskl"] or {"bones": [], "smooth_indices": []}
+        joints, inverse_matrices = self.add_skeleton(fskl)
+        for root in joints:
+            if self.gltf["nodes"][root].pop("root", False):
+                self.gltf["nodes"][model_node]["children"].append(root)
+        # Skins are only added once a shape uses them, by whether they are rigid
+        skins = {}
+
+        # Vertex buffers by index, some can be filtered out
+        fvtx_sections = {fvtx["header"]["section_index"]: fvtx for fvtx in model["fvtx"]}
+        for shape in model["fshp"]:
+            if shape["header"]["fvtx_index"] not in fvtx_sections:
+                continue
+            mesh = self.add_mesh(shape, fvtx_sections[shape["header"]["fvtx_index"]], first_material,
+                                 fskl["smooth_indices"])
+            if mesh is None:
+                continue
+            node = self.add_node({"name": shape["header"]["poly_name"], "mesh": mesh})
+            skin_count = shape["header"]["vtx_skin_count"]
+            parent = model_node
+            if joints and "JOINTS_0" in self.gltf["meshes"][mesh]["primitives"][0]["attributes"]:
+                # Rigid vertices are in the space of their bone, their joints have no inverse bind matrix
+                rigid = skin_count == 1
+                if rigid not in skins:
+                    skins[rigid] = self.add_skin(joints, np.tile(np.identity(4), (len(joints), 1, 1)) if rigid
+                                                 else inverse_matrices)
+                self.gltf["nodes"][node]["skin"] = skins[rigid]
+            elif joints and (skin_count == 0 or not len(fskl["smooth_indices"])):
+                # Shapes without skinning follow their bone
+                parent = joints[min(shape["header"]["fskl_bone_skin_index"], len(joints) - 1)]
+            self.gltf["nodes"][parent].setdefault("children", []).append(node)
+        return model_node
+
+    def add_skeleton(self, fskl):
+        bones = get_bone_arrays(fskl["bones"])
+        if not len(bones):
+            return [], None
+        first_node = len(self.gltf["nodes"])
+        rotations = get_bone_quaternions(bones)
+        for b, bone in enumerate(bones):
+            node = {
+                "name": bone["name"],
+                "translation": [float(value) for value in bone["translation"]],
+                "rotation": rotations[b].tolist(),
+                "scale": [float(value) for value in bone["scale"]]
+            }
+            if bone["parent_index"] >= len(bones):
+                node["root"] = True
+            self.add_node(node)
+        for b, parent_index in enumerate(bones.parent_index.tolist()):
+            if parent_index < len(bones):
+                self.gltf["nodes"][first_node + parent_index].setdefault("children", []).append(first_node + b)
+        world_matrices = get_world_matrices(bones)
+
+        joints = list(range(first_node, first_node + len(bones)))
+        # Bones of smooth matrices use the inverse bind matrices of the archive, like skinning does
+        inverse_matrices = np.linalg.inv(world_matrices)
+        smooth_indices = np.asarray(fskl["smooth_indices"], dtype=np.int64)
+        file_matrices = np.asarray(fskl.get("inverse_matrices", []), dtype=np.float64).reshape(-1, 3, 4)
+        smooth_count = min(len(file_matrices), len(smooth_indices))
+        inverse_matrices[np.clip(smooth_indices[:smooth_count], 0, len(bones) - 1), :3] = file_matrices[:smooth_count]
+        return joints, inverse_matrices
+
+    def add_skin(self, joints, inverse_matrices):
+        # glTF matrices are column major
+        self.gltf["skins"].append({
+            "joints": joints,
+            "inverseBindMatrices": self.add_accessor(
+                inverse_matrices.transpose(0, 2, 1).reshape(-1, 16).astype(np.float32), "MAT4")
+        })
+        return len(self.gltf["skins"]) - 1
+
+    def add_mesh(self, shape, fvtx, first_material, smooth_indices):
+        if not shape["lod_models"]:
+            return None
+        # The most detailed LOD that was kept by the filters
+        lod = shape["lod_models"][0]
+        groups = [np.asarray(vis["primitives"]) for vis in lod["vis_groups"]]
+        groups = [group for group in groups if group.ndim == 2 and len(group)]
+        if not groups or groups[0].shape[1] not in PRIMITIVE_MODES:
+            return None
+        mode, corners = PRIMITIVE_MODES[groups[0].shape[1]]
+        indices = np.concatenate([group[:, corners] for group in groups]).ravel()
+        indices = indices.astype(np.uint16 if indices.max() < 0xFFFF else np.uint32)
+
+        attributes = self.add_attributes(fvtx["attributes"], shape["header"]["vtx_skin_count"], smooth_indices)
+        if "POSITION" not in attributes:
+            return None
+        primitive = {"attributes": attributes, "indices": self.add_accessor(indices, target=34963), "mode": mode}
+        if first_material + shape["header"]["fmat_index"] < len(self.gltf["materials"]):
+            primitive["material"] = first_material + shape["header"]["fmat_index"]
+        self.gltf["meshes"].append({"name": shape["header"]["poly_name"], "primitives": [primitive]})
+        return len(self.gltf["meshes"]) - 1
+
+    def add_attributes(self, fvtx_attributes, skin_count, smooth_indices):
+        attributes = {}
+        texture_coordinates = 0
+        for name, attribute in fvtx_attributes.items():
+            vertices = np.asarray(attribute["vertices"])
+            if vertices.ndim != 2:
+                continue
+            if name == "_p0":
+                positions = np.ascontiguousarray(vertices[:, :3], dtype=np.float32)
+                attributes["POSITION"] = self.add_accessor(positions, target=34962, bounds=True)
+            elif name == "_n0":
+                # Copied, cached vertices are read-only memory maps
+                normals = vertices[:, :3].astype(np.float32)
+                lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+                attributes["NORMAL"] = self.add_accessor(np.divide(normals, lengths, out=normals, where=lengths > 0),
+                                                         target=34962)
+            elif name.startswith("_u") and vertices.shape[1] == 2:
+                attributes[f"TEXCOORD_{texture_coordinates}"] = self.add_accessor(vertices.astype(np.float32),
+                                                                                  target=34962)
+                texture_coordinates += 1
+            elif name == "_c0":
+                colors = np.ones((len(vertices), 4), dtype=np.float32)
+                colors[:, :min(vertices.shape[1], 4)] = vertices[:, :4]
+                attributes["COLOR_0"] = self.add_accessor(colors, target=34962)
+            elif name == "_i0" and skin_count > 0 and len(smooth_indices):
+                joints = np.zeros((len(vertices), 4), dtype=np.uint16)
+                used = min(vertices.shape[1], skin_count, 4)
+                # Skinning matrix indices are mapped back to the bones they belong to, broken indices are clamped
+                joints[:, :used] = np.take(np.asarray(smooth_indices), vertices[:, :used].astype(np.int64), mode="clip")
+                attributes["JOINTS_0"] = self.add_accessor(joints, target=34962)
+                if skin_count == 1 or "_w0" not in fvtx_attributes:
+                    weights = np.zeros((len(vertices), 4), dtype=np.float32)
+                    weights[:, 0] = 1
+                    attributes["WEIGHTS_0"] = self.add_accessor(weights, target=34962)
+            elif name == "_w0" and skin_count > 1:
+                weights = np.zeros((len(vertices), 4), dtype=np.float32)
+                used = min(vertices.shape[1], skin_count, 4)
+                weights[:, :used] = vertices[:, :used]
+                totals = weights.sum(axis=1, keepdims=True)
+                attributes["WEIGHTS_0"] = self.add_accessor(np.divide(weights, totals, out=weights, where=totals > 0),
+                                                            target=34962)
+            elif name not in ("_i0", "_w0") and vertices.shape[1] <= 4:
+                # Other attributes are kept as application specific ones, like _T0 for tangents
+                attributes["_" + name[1:].upper()] = self.add_accessor(vertices.astype(np.float32), target=34962)
+        if "JOINTS_0" not in attributes:
+            attributes.pop("WEIGHTS_0", None)
+        return attributes
+
+    def add_node(self, node):
+        self.gltf["nodes"].append(node)
+        return len(self.gltf["nodes"]) - 1
+
+    def add_accessor(self, array, accessor_type=None, target=None, bounds=False):
+        array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<"))
+        # Identical arrays, like buffers shared by several shapes, reuse the same accessor
+        key = (hash_array(array), accessor_type, target, bounds)
+        if key in self.accessors:
+            return self.accessors[key]
+        components = 1 if array.ndim == 1 else array.shape[1]
+        view = {"buffer": 0, "byteOffset": self.length, "byteLength": array.nbytes}
+        if target is not None:
+            view["target"] = target
+        self.gltf["bufferViews"].append(view)
+        self.chunks.append(get_bytes(array))
+        self.length += array.nbytes
+        # Every view starts on 4 bytes
+        padding = -self.length % 4
+        if padding:
+            self.chunks.append(bytes(padding))
+            self.length += padding
+
+        accessor = {
+            "bufferView": len(self.gltf["bufferViews"]) - 1,
+            "componentType": COMPONENT_TYPES[array.dtype.newbyteorder("=")],
+            "count": len(array),
+            "type": accessor_type or ACCESSOR_TYPES[components]
+        }
+        if bounds:
+            accessor["min"] = array.min(axis=0).tolist()
+            accessor["max"] = array.max(axis=0).tolist()
+        self.gltf["accessors"].append(accessor)
+        self.accessors[key] = len(self.gltf["accessors"]) - 1
+        return self.accessors[key]
@@ -0,0 +1,93 @@
+import base64
+import io
+import json
+import os
+
+import numpy as np
+
+from BfresParser.buffers import get_array_key, get_bytes
+
+
+class JsonConverter:
+    # Arrays are replaced by {"__array__": {"dtype", "shape", and "offset" in the sidecar, "blob" in the blob
+    # directory or "base64"}}, identical arrays are only written once
+    alignment = 16
+
+    def __init__(self, data):
+        self.data = data
+
+    def create_json(self):
+        file = io.StringIO()
+        self.write_json(file)
+        return file.getvalue()
+
+    def write_json(self, file, sidecar_file=None, blob_directory=None):
+        # Chunks are written as they are encoded, arrays go to the sidecar as they are met, or to the blob directory
+        # shared by several exports as files named by their content key
+        self.sidecar_file = sidecar_file
+        self.sidecar_length = 0
+        self.blob_directory = blob_directory
+        self.references = {}
+        encoder = json.JSONEncoder(separators=(",", ":"), default=self.encode_array)
+        for chunk in encoder.iterencode(self.data):
+            file.write(chunk)
+
+    def encode_array(self, array):
+        if not isinstance(array, np.ndarray):
+            # Index groups and NumPy scalars
+            return array.tolist()
+        key = get_array_key(array)
+        if key in self.references:
+            return self.references[key]
+        array = np.ascontiguousarray(array)
+        # Structured arrays like the vis tree keep their fields
+        dtype = array.dtype.descr if array.dtype.names else array.dtype.str
+        reference = {"dtype": dtype, "shape": list(array.shape)}
+        if self.blob_directory is not None:
+            reference["blob"] = key
+            path = os.path.join(self.blob_directory, f"{key}.bin")
+            if not os.path.exists(path):
+                # Renamed once written, another export never reads a partial blob
+                temporary_path = f"{path}.{os.getpid()}.tmp"
+                with open(temporary_path, "wb") as blob_file:
+                    blob_file.write(get_bytes(array))
+                os.replace(temporary_path, path)
+        elif self.sidecar_file is None:
+            reference["base64"] = base64.b64encode(get_bytes(array)).decode("ascii")
+        else:
+            padding = -self.sidecar_length % self.alignment
+            self.sidecar_file.write(bytes(padding))
+            reference["offset"] = self.sidecar_length + padding
+            self.sidecar_file.write(get_bytes(array))
+            self.sidecar_length += padding + array.nbytes
+        self.references[key] = {"__array__": reference}
+        return self.references[key]
+
+
+def load_json(file, sidecar_path=None, blob_directory=None):
+    # Sidecar and blob arrays are memory mapped views, base64 arrays are decoded
+    # Empty files can not be memory mapped, a sidecar of empty arrays only is one
+    sidecar = None
+    if sidecar_path is not None:
+        sidecar = np.memmap(sidecar_path, np.uint8, "r") if os.path.getsize(sidecar_path) else b""
+
+    def decode_array(value):
+        if len(value) != 1 or "__array__" not in value:
+            return value
+        reference = value["__array__"]
+        dtype = reference["dtype"]
+        if isinstance(dtype, list):
+            dtype = [tuple(tuple(value) if isinstance(value, list) else value for value in field) for field in dtype]
+        dtype = np.dtype(dtype)
+        count = int(np.prod(reference["shape"]))
+        if "base64" in reference:
+            array = np.frombuffer(base64.b64decode(reference["base64"]), dtype, count)
+        elif "blob" in reference:
+            path = os.path.join(blob_directory, f"{reference['blob']}.bin")
+            # Empty files can not be memory mapped
+            array = np.memmap(path, dtype, "r", shape=(count,)) if count else np.empty(0, dtype)
+        else:
+            array = np.frombuffer(sidecar, dtype, count, reference["offset"])
+        return array.reshape(reference["shape"])
+
+    return json.load(file, object_hook=decode_array)
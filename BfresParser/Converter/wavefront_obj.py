@@ -1,14 +1,29 @@
+import io
+
+import numpy as np
+
+
 class ObjConverter:
+    # Number of vertices or faces formatted at once
+    block_size = 65536
+
     def __init__(self, data):
         self.data = data
 
     def create_wavefront(self):
-        file = ""
+        file = io.StringIO()
+        self.write_wavefront(file)
+        return file.getvalue()
 
+    def write_wavefront(self, file):
+        for chunk in self.iter_wavefront():
+            file.write(chunk)
+
+    def iter_wavefront(self):
         total_vertices = 0
         for models in self.data["models"]:
             for obj in models["objects"]:
-                file += f"\no {obj['infos']['name']}\ns 1"
+                yield f"\no {obj['infos']['name']}\ns 1"
                 attributes = [
                     {"name": "_p0", "obj_prefix": "v", "allow_negative": True},
                     {"name": "_u0", "obj_prefix": "vt", "allow_negative": False},
@@ -16,23 +31,32 @@ class ObjConverter:
                 # Attributes
                 for attr in attributes:
                     if attr["name"] in obj["vertex_buffer"].keys():
-                        for vertex in obj["vertex_buffer"][attr["name"]]["vertices"]:
-                            file += f"\n{attr['obj_prefix']}"
-                            for value in vertex:
-                                if not attr["allow_negative"]:
-                                    value = value * 0.5 + 0.5
-                                file += f" {value}"
-
-                # Primitives
-                for primitives_group in obj["lod_models"][0]["primitives"]:
-                    for primitive in primitives_group:
-                        file += "\nf"
-                        for index in primitive:
-                            file += " "
-                            if attributes[0]["name"] in obj["vertex_buffer"].keys():
-                                file += f"{index + total_vertices + 1}"
-                                file += "/"
-                                if "_u0" in obj["vertex_buffer"].keys():
-                                    file += f"{index + total_vertices + 1}"
+                        vertices = np.asarray(obj["vertex_buffer"][attr["name"]]["vertices"])
+                        if not attr["allow_negative"]:
+                            vertices = vertices * 0.5 + 0.5
+                        if vertices.ndim == 2:
+                            yield from self.__format_blocks(vertices,
+                                                            f"\n{attr['obj_prefix']}" + " %s" * vertices.shape[1])
+
+                # Primitives of the most detailed LOD that was kept by the filters
+                primitives_groups = obj["lod_models"][0]["primitives"] if obj["lod_models"] else []
+                for primitives_group in primitives_groups:
+                    primitives_group = np.asarray(primitives_group, dtype=np.int64) + total_vertices + 1
+                    if primitives_group.ndim != 2:
+                        continue
+                    size = primitives_group.shape[1]
+                    if attributes[0]["name"] not in obj["vertex_buffer"].keys():
+                        yield from self.__format_blocks(primitives_group[:, :0], "\nf" + " " * size)
+                    elif "_u0" in obj["vertex_buffer"].keys():
+                        yield from self.__format_blocks(np.repeat(primitives_group, 2, axis=1), "\nf" + " %d/%d" * size)
+                    else:
+                        yield from self.__format_blocks(primitives_group, "\nf" + " %d/" * size)
                 total_vertices += obj["infos"]["vertex_count"]
-        return file
+
+    def __format_blocks(self, rows, line_format):
+        for start in range(0, len(rows), self.block_size):
+            block = rows[start:start + self.block_size]
+            if block.dtype == np.float32:
+                # Shortest text that round trips to the same single precision value, one block at a time
+                block = block.astype(str)
+            yield (line_format * len(block)) % tuple(block.ravel().tolist())
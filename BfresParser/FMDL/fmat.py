@@ -1,12 +1,77 @@
 from BfresParser.cursor import Cursor
-from BfresParser.tools import read_string
-from BfresParser.index_group import search_index_group
+from BfresParser.records import Record
+from BfresParser.schema import Schema, VersionedSchema
+
+
+HEADER = Schema([
+    ("magic", "4char"),
+    ("mat_name", "sint32", True),
+    ("mat_flags", "uint32"),
+    ("section_index", "uint16"),
+    ("render_info_count", "uint16"),
+    ("tex_ref_count", "uint8"),
+    ("tex_sampler_count", "uint8"),
+    ("mat_param_count", "uint16"),
+    ("volatile_param_count", "uint16"),
+    ("mat_param_length", "uint16"),
+    ("raw_param_length", "uint16"),
+    ("user_data_entry_count", "uint16"),
+    ("render_info_param_dict", "sint32", True),
+    ("render_state_offset", "sint32", True),
+    ("shader_assign_offset", "sint32", True),
+    ("tex_ref_offset", "sint32", True),
+    ("tex_sampler_offset", "sint32", True),
+    ("tex_sampler_dict", "sint32", True),
+    ("mat_param_offset", "sint32", True),
+    ("mat_param_dict", "sint32", True),
+    ("mat_param_data_offset", "sint32", True),
+    ("user_data_dict", "sint32", True),
+    ("volatile_flags_offset", "sint32", True),
+    ("user_pointer", "sint32")
+])
+
+MAT_PARAM = VersionedSchema({
+    0: Schema([
+        ("type", "uint8"),
+        ("size", "uint8"),
+        ("offset", "uint16"),
+        ("variable_name", "sint32", True)
+    ]),
+    3300: Schema([
+        ("type", "uint8"),
+        ("size", "uint8"),
+        ("offset", "uint16"),
+        (None, "4uint32"),
+        ("variable_name", "sint32", True)
+    ]),
+    3400: Schema([
+        ("type", "uint8"),
+        ("size", "uint8"),
+        ("offset", "uint16"),
+        (None, "3uint32"),
+        ("variable_name", "sint32", True)
+    ])
+})
+
+
+class RenderInfo(Record):
+    __slots__ = ("array_length", "type", "name", "data")
+
+
+class TextureSampler(Record):
+    __slots__ = ("GX2Sampler_struct1", "GX2Sampler_struct2", "GX2Sampler_struct3", "handle", "attribute_name", "index")
+
+
+class MatParam(Record):
+    __slots__ = ("type", "size", "offset", "variable_name", "value")
 
 
 class Fmat:
-    def __init__(self, binary, version, offset):
-        self.binary = binary
-        self.version = version
+    def __init__(self, context, offset):
+        self.context = context
+        self.binary = context.binary
+        self.strings = context.strings
+        self.version = context.header["version"]
         self.offset = offset
         self.header = self.parse_header()
 
@@ -20,32 +85,10 @@ class Fmat:
         }
 
     def parse_header(self):
-        cursor = Cursor(self.binary, self.offset)
-        header = {}
-        header["magic"] = cursor.read_chars(4)
-        header["mat_name"] = read_string(self.binary, cursor.read_offset())
-        header["mat_flags"] = cursor.read_uint32()
-        header["section_index"] = cursor.read_uint16()
-        header["render_info_count"] = cursor.read_uint16()
-        header["tex_ref_count"] = cursor.read_uint8()
-        header["tex_sampler_count"] = cursor.read_uint8()
-        header["mat_param_count"] = cursor.read_uint16()
-        header["volatile_param_count"] = cursor.read_uint16()
-        header["mat_param_length"] = cursor.read_uint16()
-        header["raw_param_length"] = cursor.read_uint16()
-        header["user_data_entry_count"] = cursor.read_uint16()
-        header["render_info_param_dict"] = search_index_group(self.binary, cursor.read_offset())
-        header["render_state_offset"] = cursor.read_offset()
-        header["shader_assign_offset"] = cursor.read_offset()
-        header["tex_ref_offset"] = cursor.read_offset()
-        header["tex_sampler_offset"] = cursor.read_offset()
-        header["tex_sampler_dict"] = search_index_group(self.binary, cursor.read_offset())
-        header["mat_param_offset"] = cursor.read_offset()
-        header["mat_param_dict"] = search_index_group(self.binary, cursor.read_offset())
-        header["mat_param_data_offset"] = cursor.read_offset()
-        header["user_data_dict"] = search_index_group(self.binary, cursor.read_offset())
-        header["volatile_flags_offset"] = cursor.read_offset()
-        header["user_pointer"] = cursor.read_sint32()
+        header = HEADER.read(self.binary, self.offset)
+        header["mat_name"] = self.strings.get(header["mat_name"])
+        for dict_name in ["render_info_param_dict", "tex_sampler_dict", "mat_param_dict", "user_data_dict"]:
+            header[dict_name] = self.context.get_index_group(header[dict_name])
 
         return header
 
@@ -53,28 +96,28 @@ class Fmat:
         params = []
         for e in self.header["render_info_param_dict"]:
             cursor = Cursor(self.binary, e[1])
-            render_info = {}
-            render_info["array_length"] = cursor.read_uint16()
-            render_info["type"] = cursor.read_uint8()
+            array_length = cursor.read_uint16()
+            info_type = cursor.read_uint8()
             cursor.skip_bytes()
-            render_info["name"] = read_string(self.binary, cursor.read_offset())
-            render_info["data"] = []
-            for i in range(render_info["array_length"]):
-                if render_info["type"] == 0:
-                    render_info["data"].append([
+            name = self.strings.get(cursor.read_offset())
+            data = []
+            for i in range(array_length):
+                if info_type == 0:
+                    data.append([
                         cursor.read_sint32(),
                         cursor.read_sint32()
                     ])
-                if render_info["type"] == 1:
-                    render_info["data"].append([
+                if info_type == 1:
+                    data.append([
                         cursor.read_float32(),
                         cursor.read_float32()
                     ])
-                if render_info["type"] == 2:
-                    render_info["data"].append(
-                        read_string(self.binary, cursor.read_offset())
+                if info_type == 2:
+                    data.append(
+                        self.strings.get(cursor.read_offset())
                     )
-            params.append(render_info)
+            params.append(self.context.record(RenderInfo, array_length=array_length, type=info_type, name=name,
+                                              data=data))
 
         return params
 
@@ -82,14 +125,15 @@ class Fmat:
         samplers = []
         for e in self.header["tex_sampler_dict"]:
             cursor = Cursor(self.binary, e[1])
-            samplers.append({
-                "GX2Sampler_struct1": cursor.read_uint32(),
-                "GX2Sampler_struct2": cursor.read_uint32(),
-                "GX2Sampler_struct3": cursor.read_uint32(),
-                "handle": cursor.read_uint32(),
-                "attribute_name": read_string(self.binary, cursor.read_offset()),
-                "index": cursor.read_uint8()
-            })
+            samplers.append(self.context.record(
+                TextureSampler,
+                GX2Sampler_struct1=cursor.read_uint32(),
+                GX2Sampler_struct2=cursor.read_uint32(),
+                GX2Sampler_struct3=cursor.read_uint32(),
+                handle=cursor.read_uint32(),
+                attribute_name=self.strings.get(cursor.read_offset()),
+                index=cursor.read_uint8()
+            ))
 
         return samplers
 
@@ -131,20 +175,14 @@ class Fmat:
         for i in range(len(self.version)):
             version += 10 ** (len(self.version) - 1 - i) * self.version[i]
 
+        mat_param_schema = MAT_PARAM.get(version)
         for e in self.header["mat_param_dict"]:
-            cursor = Cursor(self.binary, e[1])
-            mat_param = {}
-            mat_param["type"] = cursor.read_uint8()
-            mat_param["size"] = cursor.read_uint8()
-            mat_param["offset"] = cursor.read_uint16() + self.header["mat_param_data_offset"]
-            if version >= 3400:
-                cursor.skip_bytes(12)
-            elif 3300 <= version < 3400:
-                cursor.skip_bytes(16)
-            mat_param["variable_name"] = read_string(self.binary, cursor.read_offset())
-            cursor.go_to(mat_param["offset"])
+            mat_param = mat_param_schema.read(self.binary, e[1])
+            mat_param["offset"] += self.header["mat_param_data_offset"]
+            mat_param["variable_name"] = self.strings.get(mat_param["variable_name"])
+            cursor = Cursor(self.binary, mat_param["offset"])
             mat_param["value"] = cursor.read_custom(variable_format[mat_param["type"]])
-            params.append(mat_param)
+            params.append(self.context.record(MatParam, **mat_param))
 
         return params
 
@@ -175,14 +213,14 @@ class Fmat:
     def parse_shader_assign(self):
         cursor = Cursor(self.binary, self.header["shader_assign_offset"])
         shader_assign = {}
-        shader_assign["archive_name"] = read_string(self.binary, cursor.read_offset())
-        shader_assign["model_name"] = read_string(self.binary, cursor.read_offset())
+        shader_assign["archive_name"] = self.strings.get(cursor.read_offset())
+        shader_assign["model_name"] = self.strings.get(cursor.read_offset())
         shader_assign["revision"] = cursor.read_uint32()
         shader_assign["vtx_shader_input_count"] = cursor.read_uint8()
         shader_assign["fragment_shader_input_count"] = cursor.read_uint8()
         shader_assign["param_count"] = cursor.read_uint16()
-        shader_assign["vtx_shader_input_dict"] = search_index_group(self.binary, cursor.read_offset())
-        shader_assign["fragment_shader_input_dict"] = search_index_group(self.binary, cursor.read_offset())
-        shader_assign["param_dict"] = [[shader_option[0], read_string(self.binary, shader_option[1])] for shader_option in search_index_group(self.binary, cursor.read_offset())]
+        shader_assign["vtx_shader_input_dict"] = self.context.get_index_group(cursor.read_offset())
+        shader_assign["fragment_shader_input_dict"] = self.context.get_index_group(cursor.read_offset())
+        shader_assign["param_dict"] = [[shader_option[0], self.strings.get(shader_option[1])] for shader_option in self.context.get_index_group(cursor.read_offset())]
 
         return shader_assign
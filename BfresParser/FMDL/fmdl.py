@@ -1,70 +1,114 @@
-from BfresParser.cursor import Cursor
-from BfresParser.tools import read_string
-from BfresParser.index_group import search_index_group
+from functools import cached_property
+
+from BfresParser.schema import Schema
+from BfresParser.tools import LazyList
 from BfresParser.FMDL.fvtx import Fvtx
 from BfresParser.FMDL.fmat import Fmat
-from BfresParser.FMDL.fskl import Fskl
-from BfresParser.FMDL.fshp import Fshp
+from BfresParser.FMDL.fskl import Fskl, BONE
+from BfresParser.FMDL.fshp import Fshp, HEADER as FSHP_HEADER
+
+
+HEADER = Schema([
+    ("magic", "4char"),
+    ("name", "sint32", True),
+    ("file_path_offset", "sint32"),
+    ("fskl_offset", "sint32", True),
+    ("fvtx_array_offset", "sint32", True),
+    ("fshp_dict", "sint32", True),
+    ("fmat_dict", "sint32", True),
+    ("user_data", "sint32", True),
+    ("fvtx_count", "uint16"),
+    ("fshp_count", "uint16"),
+    ("fmat_count", "uint16"),
+    ("user_data_entry_count", "uint16"),
+    ("vertex_count", "uint32"),
+    ("user_pointer", "uint32")
+])
 
 
 class Fmdl:
-    def __init__(self, binary, bfres_header, offset):
-        self.binary = binary
-        self.bfres_header = bfres_header
+    def __init__(self, context, offset, lazy=False):
+        self.context = context
+        self.binary = context.binary
+        self.bfres_header = context.header
         self.offset = offset
-        self.header = self.parse_header()
+        with context.measure("fmdl") as record:
+            self.header = self.parse_header()
+            record["model"] = self.header["name"]
+            record["elements"] = self.header["vertex_count"]
 
-        self.fvtx_sections = self.parse_fvtx()
-        self.fmat_sections = self.parse_fmat()
-        self.fskl_section = self.parse_fskl()
-        self.fshp_sections = self.parse_fshp()
+        # Sections are parsed when first accessed, or right away when not lazy
+        self.fvtx_sections = LazyList(self.header["fvtx_count"], self.parse_fvtx)
+        self.fmat_sections = LazyList(len(self.header["fmat_dict"]), self.parse_fmat)
+        self.fshp_sections = LazyList(len(self.header["fshp_dict"]), self.parse_fshp)
+        self.select_sections()
+        if not lazy:
+            self.get_parsed_data()
+
+    def select_sections(self):
+        # Indices of the sections kept by the filters, only those are part of the parsed data
+        filters = self.context.filters
+        self.fshp_indices = [s for s, entry in enumerate(self.header["fshp_dict"]) if filters.keep_shape(entry[0])]
+        if filters.shapes is None:
+            self.fvtx_indices = list(range(self.header["fvtx_count"]))
+        else:
+            # Only the FSHP headers are read to find the vertex buffers of the kept shapes
+            self.fvtx_indices = sorted({FSHP_HEADER.read(self.binary, self.header["fshp_dict"][s][1])["fvtx_index"]
+                                        for s in self.fshp_indices})
+        self.fmat_indices = list(range(len(self.fmat_sections))) if filters.materials else []
 
     def get_parsed_data(self):
         return {
             "header": self.header,
-            "fvtx": self.fvtx_sections,
-            "fmat": self.fmat_sections,
-            "fskl": self.fskl_section,
-            "fshp": self.fshp_sections
+            "fvtx": [self.fvtx_sections[i] for i in self.fvtx_indices],
+            "fmat": [self.fmat_sections[i] for i in self.fmat_indices],
+            "fskl": self.fskl_section if self.context.filters.skeleton else None,
+            "fshp": [self.fshp_sections[i] for i in self.fshp_indices]
         }
 
+    def get_fmat(self, name):
+        return self.fmat_sections[self.header["fmat_dict"].get_index(name)]
+
+    def get_fshp(self, name):
+        return self.fshp_sections[self.header["fshp_dict"].get_index(name)]
+
     def parse_header(self):
-        cursor = Cursor(self.binary, self.offset)
-        header = {}
-        header["magic"] = cursor.read_chars(4)
-        header["name"] = read_string(self.binary, cursor.read_offset())
-        header["file_path_offset"] = cursor.read_sint32()
-        header["fskl_offset"] = cursor.read_offset()
-        header["fvtx_array_offset"] = cursor.read_offset()
-        header["fshp_dict"] = search_index_group(self.binary, cursor.read_offset())
-        header["fmat_dict"] = search_index_group(self.binary, cursor.read_offset())
-        header["user_data"] = read_string(self.binary, cursor.read_offset())
-        header["fvtx_count"] = cursor.read_uint16()
-        header["fshp_count"] = cursor.read_uint16()
-        header["fmat_count"] = cursor.read_uint16()
-        header["user_data_entry_count"] = cursor.read_uint16()
-        header["vertex_count"] = cursor.read_uint32()
-        header["user_pointer"] = cursor.read_uint32()
+        header = HEADER.read(self.binary, self.offset)
+        strings = self.context.strings
+        header["name"] = strings.get(header["name"])
+        header["fshp_dict"] = self.context.get_index_group(header["fshp_dict"])
+        header["fmat_dict"] = self.context.get_index_group(header["fmat_dict"])
+        header["user_data"] = strings.get(header["user_data"])
 
         return header
 
-    def parse_fvtx(self):
-        fvtx_sections = []
-        for e in range(self.header["fvtx_count"]):
-            fvtx_sections.append(Fvtx(self.binary, self.header["fvtx_array_offset"] + e * 0x20).parsed_data)
-        return fvtx_sections
-
-    def parse_fmat(self):
-        fmat_sections = []
-        for section in self.header["fmat_dict"]:
-            fmat_sections.append(Fmat(self.binary, self.bfres_header["version"], section[1]).parsed_data)
-        return fmat_sections
-
-    def parse_fskl(self):
-        return Fskl(self.binary, self.header["fskl_offset"]).parsed_data
-
-    def parse_fshp(self):
-        fshp_sections = []
-        for section in self.header["fshp_dict"]:
-            fshp_sections.append(Fshp(self.binary, section[1]).parsed_data)
-        return fshp_sections
+    def parse_fvtx(self, index):
+        with self.context.measure("fvtx", model=self.header["name"], index=index) as record:
+            fvtx = Fvtx(self.context, self.header["fvtx_array_offset"] + index * 0x20).parsed_data
+            buffers = {attribute["buffer_header"]["data_offset"]: attribute["buffer_header"]["size"]
+                       for attribute in fvtx["attributes"].values()}
+            record["bytes"] = sum(buffers.values())
+            record["elements"] = fvtx["header"]["vertex_count"]
+        return fvtx
+
+    def parse_fmat(self, index):
+        with self.context.measure("fmat", model=self.header["name"], index=index) as record:
+            fmat = Fmat(self.context, self.header["fmat_dict"][index][1]).parsed_data
+            record["bytes"] = fmat["header"]["mat_param_length"]
+            record["elements"] = len(fmat["mat_param"])
+        return fmat
+
+    @cached_property
+    def fskl_section(self):
+        with self.context.measure("fskl", model=self.header["name"]) as record:
+            fskl = Fskl(self.context, self.header["fskl_offset"]).parsed_data
+            record["bytes"] = len(fskl["bones"]) * BONE.size
+            record["elements"] = len(fskl["bones"])
+        return fskl
+
+    def parse_fshp(self, index):
+        with self.context.measure("fshp", model=self.header["name"], index=index) as record:
+            fshp = Fshp(self.context, self.header["fshp_dict"][index][1]).parsed_data
+            record["bytes"] = sum(lod["index_buffer"]["size"] for lod in fshp["lod_models"])
+            record["elements"] = sum(len(vis["primitives"]) for lod in fshp["lod_models"] for vis in lod["vis_groups"])
+        return fshp
@@ -1,12 +1,101 @@
+from functools import partial
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from BfresParser.buffers import BufferKeys, hash_buffer
 from BfresParser.cursor import Cursor
-from BfresParser.index_group import search_index_group
-from BfresParser.tools import read_string
+from BfresParser.records import Record
+from BfresParser.schema import Schema, BUFFER_HEADER
+
+
+HEADER = Schema([
+    ("magic", "4char"),
+    ("poly_name", "sint32", True),
+    ("flags", "uint32"),
+    ("section_index", "uint16"),
+    ("fmat_index", "uint16"),
+    ("fskl_index", "uint16"),
+    ("fvtx_index", "uint16"),
+    ("fskl_bone_skin_index", "uint16"),
+    ("vtx_skin_count", "uint8"),
+    ("lod_mdl_count", "uint8"),
+    ("key_shape_count", "uint8"),
+    ("target_attr_count", "uint8"),
+    ("vis_tree_node_count", "uint16"),
+    ("radius", "float32"),
+    ("fvtx_offset", "sint32", True),
+    ("lod_mdl_offset", "sint32", True),
+    ("fskl_index_offset", "sint32", True),
+    ("key_shape_dict", "sint32", True),
+    ("vis_tree_nodes_offset", "sint32", True),
+    ("vis_tree_ranges_offset", "sint32", True),
+    ("vis_tree_indices_offset", "sint32", True),
+    ("user_pointer", "uint32")
+])
+
+# Format --> [name, element type]
+INDEX_FORMATS = {
+    0: ["GX2_INDEX_FORMAT_U16_LE", "<u2"],
+    1: ["GX2_INDEX_FORMAT_U32_LE", "<u4"],
+    4: ["GX2_INDEX_FORMAT_U16", ">u2"],
+    9: ["GX2_INDEX_FORMAT_U32", ">u4"]
+}
+
+VIS_NODE = np.dtype({
+    "names": ["left_child_index", "right_child_index", "next_sibling_index", "vis_group_index", "vis_group_count"],
+    "formats": [">u2"] * 5,
+    "offsets": [0, 2, 6, 8, 10],
+    "itemsize": 12
+})
+
+VIS_RANGE = np.dtype([("center", ">f4", 3), ("extent", ">f4", 3)])
+
+# Decoded copies are packed and in native byte order
+VIS_NODE_ARRAY = np.dtype([(name, np.uint16) for name in VIS_NODE.names])
+VIS_RANGE_ARRAY = VIS_RANGE.newbyteorder("=")
+
+
+class LodModel(Record):
+    __slots__ = ("index", "primitive_type", "primitive_type_name", "index_format", "index_format_name", "point_count",
+                 "vis_group_count", "vis_group_offset", "index_buffer_offset", "skip_vertices", "index_buffer",
+                 "vis_groups")
+
+
+class VisGroup(Record):
+    __slots__ = ("offset", "count", "primitives")
+
+
+def build_primitives(indices, primitive_name, size, step):
+    if primitive_name == "GX2_PRIMITIVE_TRIANGLE_FAN":
+        # Every triangle shares the first vertex
+        if len(indices) < size:
+            return np.empty((0, size), dtype=indices.dtype)
+        edges = sliding_window_view(indices[1:], 2)
+        return np.column_stack([np.full(len(edges), indices[0], dtype=indices.dtype), edges])
+    if primitive_name == "GX2_PRIMITIVE_LINE_LOOP" and len(indices) >= size:
+        indices = np.append(indices, indices[0])
+    if len(indices) < size:
+        return np.empty((0, size), dtype=indices.dtype)
+    if step == size:
+        return indices[:len(indices) - len(indices) % size].reshape(-1, size)
+
+    primitives = sliding_window_view(indices, size)[::step].copy()
+    if primitive_name == "GX2_PRIMITIVE_TRIANGLE_STRIP":
+        # Every other triangle of a strip has a reversed winding
+        primitives[1::2, [0, 1]] = primitives[1::2, [1, 0]]
+    elif primitive_name == "GX2_PRIMITIVE_QUAD_STRIP":
+        primitives = primitives[:, [0, 1, 3, 2]]
+    return primitives
 
 
 class Fshp:
-    def __init__(self, binary, offset):
-        self.binary = binary
+    def __init__(self, context, offset):
+        self.context = context
+        self.binary = context.binary
         self.offset = offset
+        self.as_lists = context.as_lists
+        self.buffer_keys = BufferKeys(self.binary)
         self.header = self.parse_header()
 
         self.parsed_data = {
@@ -16,30 +105,9 @@ class Fshp:
         }
 
     def parse_header(self):
-        cursor = Cursor(self.binary, self.offset)
-        header = {}
-        header["magic"] = cursor.read_chars(4)
-        header["poly_name"] = read_string(self.binary, cursor.read_offset())
-        header["flags"] = cursor.read_uint32()
-        header["section_index"] = cursor.read_uint16()
-        header["fmat_index"] = cursor.read_uint16()
-        header["fskl_index"] = cursor.read_uint16()
-        header["fvtx_index"] = cursor.read_uint16()
-        header["fskl_bone_skin_index"] = cursor.read_uint16()
-        header["vtx_skin_count"] = cursor.read_uint8()
-        header["lod_mdl_count"] = cursor.read_uint8()
-        header["key_shape_count"] = cursor.read_uint8()
-        header["target_attr_count"] = cursor.read_uint8()
-        header["vis_tree_node_count"] = cursor.read_uint16()
-        header["radius"] = cursor.read_float32()
-        header["fvtx_offset"] = cursor.read_offset()
-        header["lod_mdl_offset"] = cursor.read_offset()
-        header["fskl_index_offset"] = cursor.read_offset()
-        header["key_shape_dict"] = search_index_group(self.binary, cursor.read_offset())
-        header["vis_tree_nodes_offset"] = cursor.read_offset()
-        header["vis_tree_ranges_offset"] = cursor.read_offset()
-        header["vis_tree_indices_offset"] = cursor.read_offset()
-        header["user_pointer"] = cursor.read_uint32()
+        header = HEADER.read(self.binary, self.offset)
+        header["poly_name"] = self.context.strings.get(header["poly_name"])
+        header["key_shape_dict"] = self.context.get_index_group(header["key_shape_dict"])
 
         return header
 
@@ -66,21 +134,18 @@ class Fshp:
             0x93: ["GX2_PRIMITIVE_TESSELLATE_QUADS", 4, 4],
             0x94: ["GX2_PRIMITIVE_TESSELLATE_QUAD_STRIP", 4, 2]
         }
-        index_format = {
-            0: ["GX2_INDEX_FORMAT_U16_LE", "<H"],
-            1: ["GX2_INDEX_FORMAT_U32_LE", "<I"],
-            4: ["GX2_INDEX_FORMAT_U16", ">H"],
-            9: ["GX2_INDEX_FORMAT_U32", ">I"]
-        }
-
         lod_models = []
         for m in range(self.header["lod_mdl_count"]):
+            if not self.context.filters.keep_lod(m):
+                continue
             cursor = Cursor(self.binary, self.header["lod_mdl_offset"] + m * 0x1C)
-            lod = {}
+            lod = self.context.record(LodModel)
+            # Filtered out LODs are skipped, the index keeps the LOD number of the archive
+            lod["index"] = m
             lod["primitive_type"] = cursor.read_uint32()
             lod["primitive_type_name"] = primitive_type[lod["primitive_type"]][0]
             lod["index_format"] = cursor.read_uint32()
-            lod["index_format_name"] = index_format[lod["index_format"]][0]
+            lod["index_format_name"] = INDEX_FORMATS[lod["index_format"]][0]
             lod["point_count"] = cursor.read_uint32()
             lod["vis_group_count"] = cursor.read_uint16()
             cursor.skip_bytes(2)
@@ -91,63 +156,111 @@ class Fshp:
             vis_groups = []
             for g in range(lod["vis_group_count"]):
                 cursor.go_to(lod["vis_group_offset"] + g * 0x08)
-                vis_groups.append({
-                    "offset": cursor.read_uint32(),
-                    "count": cursor.read_uint32()
-                })
-
-            cursor.go_to(lod["index_buffer_offset"])
-            lod["index_buffer"] = {
-                "data_pointer": cursor.read_uint32(),
-                "size": cursor.read_uint32(),
-                "handle": cursor.read_uint32(),
-                "stride": cursor.read_uint16(),
-                "buffering_count": cursor.read_uint16(),
-                "context_pointer": cursor.read_uint32(),
-                "data_offset": cursor.read_offset()
-            }
+                vis_groups.append(self.context.record(
+                    VisGroup,
+                    offset=cursor.read_uint32(),
+                    count=cursor.read_uint32()
+                ))
+
+            lod["index_buffer"] = BUFFER_HEADER.read(self.binary, lod["index_buffer_offset"])
             lod["vis_groups"] = []
+            index_type = INDEX_FORMATS[lod["index_format"]][1]
             for vis in vis_groups:
-                cursor.go_to(lod["index_buffer"]["data_offset"] + vis["offset"])
-                vertices = []
-                for v in range(vis["count"]):
-                    vertices.append(cursor.read_custom(index_format[lod["index_format"]][1])[0])
-                vis["primitives"] = [vertices[x:x + primitive_type[lod["primitive_type"]][1]] for x in
-                                     range(0, len(vertices), primitive_type[lod["primitive_type"]][1])]
+                offset = lod["index_buffer"]["data_offset"] + vis["offset"]
+                parse = partial(self.parse_primitives, index_type, offset, vis["count"],
+                                primitive_type[lod["primitive_type"]])
+                if self.context.buffers is not None and not self.as_lists:
+                    # Keyed by the index buffer and how primitives are assembled from it, identical ones are only
+                    # built once
+                    length = vis["count"] * np.dtype(index_type).itemsize
+                    key = hash_buffer("fshp", self.buffer_keys.get(lod["index_buffer"], vis["offset"], length),
+                                      lod["primitive_type"], index_type, vis["offset"], vis["count"])
+                    vis["primitives"] = self.context.buffers.get(key, parse)
+                else:
+                    vis["primitives"] = parse()
+                if self.as_lists:
+                    vis["primitives"] = vis["primitives"].tolist()
                 lod["vis_groups"].append(vis)
             lod_models.append(lod)
 
         return lod_models
 
+    def parse_primitives(self, index_type, offset, count, primitive):
+        indices = np.frombuffer(self.binary, index_type, count, offset).astype(np.uint32)
+        return build_primitives(indices, *primitive)
+
     def parse_vis_group_tree(self):
-        vis_tree_nodes = []
-        vis_tree_ranges = []
-        for n in range(self.header["vis_tree_node_count"]):
-            cursor = Cursor(self.binary, self.header["vis_tree_nodes_offset"])
-            vis_node = {}
-            vis_node["left_child_index"] = cursor.read_uint16()
-            vis_node["right_child_index"] = cursor.read_uint16()
-            cursor.skip_bytes(2)
-            vis_node["next_sibling_index"] = cursor.read_uint16()
-            vis_node["vis_group_index"] = cursor.read_uint16()
-            vis_node["vis_group_count"] = cursor.read_uint16()
-            vis_tree_nodes.append(vis_node)
-            
-            cursor.go_to(self.header["vis_tree_ranges_offset"])
-            vis_range = {}
-            vis_range["center"] = [
-                cursor.read_float32(),  # X
-                cursor.read_float32(),  # Y
-                cursor.read_float32()   # Z
-            ]
-            vis_range["extent"] = [
-                cursor.read_float32(),  # X
-                cursor.read_float32(),  # Y
-                cursor.read_float32()   # Z
-            ]
-            vis_tree_ranges.append(vis_range)
+        count = self.header["vis_tree_node_count"]
+        if self.header["vis_tree_nodes_offset"] == 0 or self.header["vis_tree_ranges_offset"] == 0:
+            count = 0
+        # Copied to native byte order, the arrays no longer depend on the archive buffer
+        nodes = np.frombuffer(self.binary, VIS_NODE, count, self.header["vis_tree_nodes_offset"])
+        nodes = nodes.astype(VIS_NODE_ARRAY)
+        ranges = np.frombuffer(self.binary, VIS_RANGE, count, self.header["vis_tree_ranges_offset"])
+        ranges = ranges.astype(VIS_RANGE_ARRAY)
+        if self.as_lists:
+            return {
+                "nodes": [dict(zip(VIS_NODE.names, node)) for node in nodes.tolist()],
+                "ranges": [{"center": center, "extent": extent}
+                           for center, extent in zip(ranges["center"].tolist(), ranges["extent"].tolist())]
+            }
 
         return {
-            "nodes": vis_tree_nodes,
-            "ranges": vis_tree_ranges
+            "nodes": nodes,
+            "ranges": ranges
         }
+
+
+def get_vis_tree_arrays(vis_tree):
+    # Plain lists from as_lists mode are turned back into arrays
+    nodes, ranges = vis_tree["nodes"], vis_tree["ranges"]
+    if isinstance(nodes, np.ndarray):
+        return nodes, ranges["center"], ranges["extent"]
+    nodes = np.array([tuple(node[name] for name in VIS_NODE.names) for node in nodes],
+                     dtype=VIS_NODE_ARRAY)
+    centers = np.array([vis_range["center"] for vis_range in ranges], dtype=np.float32).reshape(-1, 3)
+    extents = np.array([vis_range["extent"] for vis_range in ranges], dtype=np.float32).reshape(-1, 3)
+    return nodes, centers, extents
+
+
+def query_vis_groups(shape, aabb=None, frustum=None, lod=0):
+    # Visible vis groups of a parsed shape for an AABB (minimum, maximum) and/or a frustum given as planes
+    # (a, b, c, d) with the inside where a * x + b * y + c * z + d >= 0, along with their index ranges
+    nodes, centers, extents = get_vis_tree_arrays(shape["vis_tree"])
+    visible = np.ones(len(nodes), dtype=bool)
+    if aabb is not None:
+        minimum, maximum = np.asarray(aabb, dtype=np.float64)
+        visible &= (np.abs(centers - (minimum + maximum) / 2) <= extents + (maximum - minimum) / 2).all(axis=1)
+    if frustum is not None:
+        planes = np.asarray(frustum, dtype=np.float64).reshape(-1, 4)
+        # A box is outside when it is entirely behind one of the planes
+        distances = centers @ planes[:, :3].T + planes[:, 3] + extents @ np.abs(planes[:, :3]).T
+        visible &= (distances >= 0).all(axis=1)
+
+    # Culled nodes hide their whole subtree
+    vis_groups = []
+    stack = [0] if len(nodes) else []
+    while stack:
+        n = stack.pop()
+        if not visible[n]:
+            continue
+        left, right = int(nodes[n]["left_child_index"]), int(nodes[n]["right_child_index"])
+        children = [child for child in (left, right) if n < child < len(nodes)]
+        if children:
+            stack.extend(reversed(children))
+        else:
+            start = int(nodes[n]["vis_group_index"])
+            vis_groups.extend(range(start, start + int(nodes[n]["vis_group_count"])))
+
+    index_ranges = []
+    # LODs are found by their number, filtered out ones are not in the list
+    lod_model = next((lod_model for lod_model in shape["lod_models"] if lod_model["index"] == lod), None)
+    if lod_model is not None:
+        index_size = np.dtype(INDEX_FORMATS[lod_model["index_format"]][1]).itemsize
+        vis_groups = [g for g in vis_groups if g < len(lod_model["vis_groups"])]
+        index_ranges = [(lod_model["vis_groups"][g]["offset"] // index_size, lod_model["vis_groups"][g]["count"])
+                        for g in vis_groups]
+    return {
+        "vis_groups": vis_groups,
+        "index_ranges": index_ranges
+    }
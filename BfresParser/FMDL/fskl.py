@@ -1,66 +1,257 @@
-from BfresParser.cursor import Cursor
-from BfresParser.index_group import search_index_group
-from BfresParser.tools import read_string
+import numpy as np
+
+from BfresParser.records import Record, Table
+from BfresParser.schema import Schema
+
+
+HEADER = Schema([
+    ("magic", "4char"),
+    ("flags", "uint32"),
+    ("bone_count", "uint16"),
+    ("smooth_index_count", "uint16"),
+    ("rigid_index_count", "uint16"),
+    (None, "uint16"),
+    ("bone_dict", "sint32", True),
+    ("bones_offset", "sint32", True),
+    ("smooth_index_offset", "sint32", True),
+    ("smooth_matrix_offset", "sint32", True),
+    ("user_pointer", "uint32")
+])
+
+BONE = Schema([
+    ("name", "sint32", True),
+    ("index", "uint16"),
+    ("parent_index", "uint16"),
+    ("smooth_matrix_index", "sint16"),
+    ("rigid_matrix_index", "sint16"),
+    ("billboard_index", "sint16"),
+    ("user_data_count", "uint16"),
+    ("flags", "uint32"),
+    ("scale", "3float32"),
+    ("rotation", "4float32"),
+    ("translation", "3float32"),
+    ("user_data_dict", "sint32", True)
+])
+
+# Same layout as BONE, every bone of a skeleton is gathered at once
+BONE_ARRAY = np.dtype([
+    ("name", ">i4"),
+    ("index", ">u2"),
+    ("parent_index", ">u2"),
+    ("smooth_matrix_index", ">i2"),
+    ("rigid_matrix_index", ">i2"),
+    ("billboard_index", ">i2"),
+    ("user_data_count", ">u2"),
+    ("flags", ">u4"),
+    ("scale", ">f4", 3),
+    ("rotation", ">f4", 4),
+    ("translation", ">f4", 3),
+    ("user_data_dict", ">i4")
+])
+
+# Bone flags --> rotation mode, quaternions (x, y, z, w) otherwise
+ROTATION_MODE_MASK = 0x7000
+ROTATION_EULER_XYZ = 0x1000
+
+
+class Bone(Record):
+    __slots__ = ("name", "index", "parent_index", "smooth_matrix_index", "rigid_matrix_index", "billboard_index",
+                 "user_data_count", "flags", "scale", "rotation", "translation", "user_data_dict")
+
+
+class BoneTable(Table):
+    # Names and user data dicts are lists, scale, rotation and translation are (N, 3), (N, 4) and (N, 3) arrays
+    __slots__ = Bone.__slots__
+    row_type = Bone
 
 
 class Fskl:
-    def __init__(self, binary, offset):
-        self.binary = binary
+    def __init__(self, context, offset):
+        self.context = context
+        self.binary = context.binary
         self.offset = offset
+        self.as_lists = context.as_lists
         self.header = self.parse_header()
 
         self.parsed_data = {
             "header": self.header,
-            "bones": self.parse_bones()
+            "bones": self.parse_bones(),
+            "smooth_indices": self.parse_smooth_indices(),
+            "inverse_matrices": self.parse_inverse_matrices()
         }
 
     def parse_header(self):
-        cursor = Cursor(self.binary, self.offset)
-        header = {}
-        header["magic"] = cursor.read_chars(4)
-        header["flags"] = cursor.read_uint32()
-        header["bone_count"] = cursor.read_uint16()
-        header["smooth_index_count"] = cursor.read_uint16()
-        header["rigid_index_count"] = cursor.read_uint16()
-        cursor.skip_bytes(2)
-        header["bone_dict"] = search_index_group(self.binary, cursor.read_offset())
-        header["bones_offset"] = cursor.read_offset()
-        header["smooth_index_offset"] = cursor.read_offset()
-        header["smooth_matrix_offset"] = cursor.read_offset()
-        header["user_pointer"] = cursor.read_uint32()
+        header = HEADER.read(self.binary, self.offset)
+        header["bone_dict"] = self.context.get_index_group(header["bone_dict"])
 
         return header
 
     def parse_bones(self):
-        bones = []
-        for b in self.header["bone_dict"]:
-            cursor = Cursor(self.binary, b[1])
-            bone = {}
-            bone["name"] = read_string(self.binary, cursor.read_offset())
-            bone["index"] = cursor.read_uint16()
-            bone["parent_index"] = cursor.read_uint16()
-            bone["smooth_matrix_index"] = cursor.read_sint16()
-            bone["rigid_matrix_index"] = cursor.read_sint16()
-            bone["billboard_index"] = cursor.read_sint16()
-            bone["user_data_count"] = cursor.read_uint16()
-            bone["flags"] = cursor.read_uint32()
-            bone["scale"] = [
-                cursor.read_float32(),  # X
-                cursor.read_float32(),  # Y
-                cursor.read_float32()   # Z
-            ]
-            bone["rotation"] = [
-                cursor.read_float32(),  # X
-                cursor.read_float32(),  # Y
-                cursor.read_float32(),  # Z
-                cursor.read_float32()
-            ]
-            bone["translation"] = [
-                cursor.read_float32(),  # X
-                cursor.read_float32(),  # Y
-                cursor.read_float32()   # Z
-            ]
-            bone["user_data_dict"] = search_index_group(self.binary, cursor.read_offset())
-            bones.append(bone)
+        offsets = np.array([b[1] for b in self.header["bone_dict"]], dtype=np.int64)
+        binary = np.frombuffer(self.binary, np.uint8)
+        rows = binary[offsets[:, None] + np.arange(BONE_ARRAY.itemsize)].view(BONE_ARRAY).reshape(-1)
+        # Relative offsets are resolved from their own position, like in BONE
+        names = np.where(rows["name"] != 0, rows["name"] + offsets, 0)
+        user_data_dicts = np.where(rows["user_data_dict"] != 0,
+                                   rows["user_data_dict"] + offsets + BONE_ARRAY.fields["user_data_dict"][1], 0)
+        bones = BoneTable(
+            name=[self.context.strings.get(name) for name in names.tolist()],
+            user_data_dict=[self.context.get_index_group(offset) for offset in user_data_dicts.tolist()],
+            **{name: rows[name].astype(BONE_ARRAY.fields[name][0].base.newbyteorder("="))
+               for name in BONE_ARRAY.names if name not in ("name", "user_data_dict")}
+        )
+        if self.as_lists:
+            return bones.tolist()
+        return bones
+
+    def parse_smooth_indices(self):
+        # Bone index of every skinning matrix, the vertex _i0 attribute indexes this array, rigid matrices last
+        count = self.header["smooth_index_count"] + self.header["rigid_index_count"]
+        if self.header["smooth_index_offset"] == 0:
+            count = 0
+        smooth_indices = np.frombuffer(self.binary, ">u2", count, self.header["smooth_index_offset"]).astype(np.uint16)
+        if self.as_lists:
+            return smooth_indices.tolist()
+        return smooth_indices
 
+    def parse_inverse_matrices(self):
+        # Inverse bind matrices (3x4, row major) of the smooth skinning matrices, rigid vertices are already in the
+        # space of their bone
+        count = self.header["smooth_index_count"]
+        if self.header["smooth_matrix_offset"] == 0:
+            count = 0
+        matrices = np.frombuffer(self.binary, ">f4", count * 12, self.header["smooth_matrix_offset"])
+        matrices = matrices.astype(np.float32).reshape(-1, 3, 4)
+        if self.as_lists:
+            return matrices.tolist()
+        return matrices
+
+
+def get_bone_arrays(bones):
+    # Row dicts from as_lists mode are turned back into a table
+    if isinstance(bones, BoneTable):
         return bones
+    columns = {key: [bone[key] for bone in bones] for key in Bone.__slots__}
+    for key, dtype in BONE_ARRAY.fields.items():
+        if key not in ("name", "user_data_dict"):
+            shape = (len(bones),) + dtype[0].shape
+            columns[key] = np.array(columns[key], dtype=dtype[0].base.newbyteorder("=")).reshape(shape)
+    return BoneTable(**columns)
+
+
+def quaternions_to_matrices(rotation):
+    x, y, z, w = np.asarray(rotation, dtype=np.float64).T
+    return np.stack([
+        np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)], axis=-1),
+        np.stack([2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)], axis=-1),
+        np.stack([2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)], axis=-1)
+    ], axis=-2)
+
+
+def euler_to_matrices(rotation):
+    # Rotations are applied around X, then Y, then Z
+    cx, cy, cz = np.cos(np.asarray(rotation, dtype=np.float64)[:, :3]).T
+    sx, sy, sz = np.sin(np.asarray(rotation, dtype=np.float64)[:, :3]).T
+    return np.stack([
+        np.stack([cy * cz, sx * sy * cz - cx * sz, cx * sy * cz + sx * sz], axis=-1),
+        np.stack([cy * sz, sx * sy * sz + cx * cz, cx * sy * sz - sx * cz], axis=-1),
+        np.stack([-sy, sx * cy, cx * cy], axis=-1)
+    ], axis=-2)
+
+
+def matrices_to_quaternions(matrices):
+    # x, y, z, w of rotation matrices, solved from the largest of the trace and the diagonal for precision
+    m = np.asarray(matrices, dtype=np.float64)[:, :3, :3]
+    quaternions = np.empty((len(m), 4))
+    diagonal = np.stack([m[:, 0, 0], m[:, 1, 1], m[:, 2, 2]], axis=-1)
+    largest = np.argmax(np.column_stack([diagonal.sum(axis=1), diagonal]), axis=1)
+    for case in range(4):
+        rows = largest == case
+        r = m[rows]
+        if case == 0:
+            s = np.sqrt(1 + r[:, 0, 0] + r[:, 1, 1] + r[:, 2, 2]) * 2
+            quaternion = [(r[:, 2, 1] - r[:, 1, 2]) / s, (r[:, 0, 2] - r[:, 2, 0]) / s, (r[:, 1, 0] - r[:, 0, 1]) / s,
+                          s / 4]
+        elif case == 1:
+            s = np.sqrt(1 + r[:, 0, 0] - r[:, 1, 1] - r[:, 2, 2]) * 2
+            quaternion = [s / 4, (r[:, 0, 1] + r[:, 1, 0]) / s, (r[:, 0, 2] + r[:, 2, 0]) / s,
+                          (r[:, 2, 1] - r[:, 1, 2]) / s]
+        elif case == 2:
+            s = np.sqrt(1 - r[:, 0, 0] + r[:, 1, 1] - r[:, 2, 2]) * 2
+            quaternion = [(r[:, 0, 1] + r[:, 1, 0]) / s, s / 4, (r[:, 1, 2] + r[:, 2, 1]) / s,
+                          (r[:, 0, 2] - r[:, 2, 0]) / s]
+        else:
+            s = np.sqrt(1 - r[:, 0, 0] - r[:, 1, 1] + r[:, 2, 2]) * 2
+            quaternion = [(r[:, 0, 2] + r[:, 2, 0]) / s, (r[:, 1, 2] + r[:, 2, 1]) / s, s / 4,
+                          (r[:, 1, 0] - r[:, 0, 1]) / s]
+        quaternions[rows] = np.stack(quaternion, axis=-1)
+    return quaternions
+
+
+def get_bone_quaternions(bones):
+    # Rotation of every bone as a quaternion, euler rotations go through the same matrices as the skeleton
+    bones = get_bone_arrays(bones)
+    quaternions = bones.rotation.astype(np.float64)
+    euler = (bones.flags & ROTATION_MODE_MASK) == ROTATION_EULER_XYZ
+    quaternions[euler] = matrices_to_quaternions(euler_to_matrices(bones.rotation[euler]))
+    return quaternions
+
+
+def get_local_matrices(bones):
+    # 4x4 matrices of every bone relative to its parent, scale then rotation then translation
+    bones = get_bone_arrays(bones)
+    matrices = np.zeros((len(bones), 4, 4))
+    euler = (bones.flags & ROTATION_MODE_MASK) == ROTATION_EULER_XYZ
+    matrices[~euler, :3, :3] = quaternions_to_matrices(bones.rotation[~euler])
+    matrices[euler, :3, :3] = euler_to_matrices(bones.rotation[euler])
+    matrices[:, :3, :3] *= bones.scale[:, None, :]
+    matrices[:, :3, 3] = bones.translation
+    matrices[:, 3, 3] = 1
+    return matrices
+
+
+def get_bone_depths(parent_indices):
+    # Roots have a depth of 0, broken parents make a bone a root and cycles are cut after every bone was visited
+    parent_indices = np.asarray(parent_indices, dtype=np.int64)
+    depths = np.zeros(len(parent_indices), dtype=np.int64)
+    parents = np.where(parent_indices < len(parent_indices), parent_indices, -1)
+    current = parents.copy()
+    for _ in range(len(parent_indices)):
+        linked = current >= 0
+        if not linked.any():
+            break
+        depths[linked] += 1
+        current[linked] = parents[current[linked]]
+    return depths, parents
+
+
+def get_world_matrices(bones, local_matrices=None):
+    # Every bone of a depth is placed at once from the already placed bones of the previous depth
+    bones = get_bone_arrays(bones)
+    if local_matrices is None:
+        local_matrices = get_local_matrices(bones)
+    world_matrices = local_matrices.copy()
+    depths, parents = get_bone_depths(bones.parent_index)
+    for depth in range(1, int(depths.max(initial=0)) + 1):
+        level = np.flatnonzero(depths == depth)
+        world_matrices[level] = world_matrices[parents[level]] @ local_matrices[level]
+    return world_matrices
+
+
+def get_skinning_matrices(fskl, world_matrices=None):
+    # 3x4 matrix of every skinning matrix index used by the _i0 attribute, smooth matrices bring bind pose
+    # vertices to the current pose and rigid ones are the world matrix of their bone
+    bones = get_bone_arrays(fskl["bones"])
+    if world_matrices is None:
+        world_matrices = get_world_matrices(bones)
+    smooth_indices = np.asarray(fskl["smooth_indices"], dtype=np.int64)
+    matrices = np.tile(np.identity(4), (len(smooth_indices), 1, 1))
+    if len(bones):
+        # Broken indices are clamped like in the glTF exporter
+        matrices = world_matrices[np.clip(smooth_indices, 0, len(bones) - 1)]
+    inverse_matrices = np.asarray(fskl.get("inverse_matrices", []), dtype=np.float64).reshape(-1, 3, 4)
+    smooth_count = min(len(inverse_matrices), len(smooth_indices))
+    inverse = np.tile(np.identity(4), (smooth_count, 1, 1))
+    inverse[:, :3] = inverse_matrices[:smooth_count]
+    matrices[:smooth_count] = matrices[:smooth_count] @ inverse
+    return matrices[:, :3]
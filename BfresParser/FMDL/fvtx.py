@@ -1,12 +1,92 @@
-from BfresParser.cursor import Cursor
-from BfresParser.index_group import search_index_group
-from BfresParser.tools import read_string
+from functools import partial
+
+import numpy as np
+
+from BfresParser.buffers import BufferKeys, hash_buffer
+from BfresParser.schema import Schema, BUFFER_HEADER
+
+
+# Format --> [name, big endian element type, component count]
+ATTRIBUTE_FORMATS = {
+    0x0000: ["unorm_8", ">u1", 1],
+    0x0004: ["unorm_8_8", ">u1", 2],
+    0x0007: ["unorm_16_16", ">u2", 2],
+    0x000A: ["unorm_8_8_8_8", ">u1", 4],
+    0x0100: ["uint_8", ">u1", 1],
+    0x0104: ["uint_8_8", ">u1", 2],
+    0x010A: ["uint_8_8_8_8", ">u1", 4],
+    0x0200: ["snorm_8", ">i1", 1],
+    0x0204: ["snorm_8_8", ">i1", 2],
+    0x0207: ["snorm_16_16", ">i2", 2],
+    0x020A: ["snorm_8_8_8_8", ">i1", 4],
+    0x020B: ["snorm_10_10_10_2", ">u4", 1],
+    0x0300: ["sint_8", ">i1", 1],
+    0x0304: ["sint_8_8", ">i1", 2],
+    0x030A: ["sint_8_8_8_8", ">i1", 4],
+    0x0806: ["float_32", ">f4", 1],
+    0x0808: ["float_16_16", ">f2", 2],
+    0x080D: ["float_32_32", ">f4", 2],
+    0x080F: ["float_16_16_16_16", ">f2", 4],
+    0x0811: ["float_32_32_32", ">f4", 3],
+    0x0813: ["float_32_32_32_32", ">f4", 4]
+}
+
+HEADER = Schema([
+    ("magic", "4char"),
+    ("attribute_count", "uint8"),
+    ("buffer_count", "uint8"),
+    ("section_index", "uint16"),
+    ("vertex_count", "uint32"),
+    ("vertex_skin_count", "uint8"),
+    (None, "3uint8"),
+    ("attribute_array_offset", "sint32", True),
+    ("attributes_dict", "sint32", True),
+    ("buffer_array_offset", "sint32", True),
+    ("user_pointer", "uint32")
+])
+
+ATTRIBUTE = Schema([
+    ("name", "sint32", True),
+    ("buffer_index", "uint8"),
+    (None, "uint8"),
+    ("buffer_offset", "uint16"),
+    ("format", "uint32")
+])
+
+
+def decode_vertices(binary, attribute_format, offset, stride, count, float_type=np.float32):
+    name, element_type, components = ATTRIBUTE_FORMATS[attribute_format]
+    element_type = np.dtype(element_type)
+    raw = np.ndarray((count, components), element_type, binary, offset, (stride, element_type.itemsize))
+
+    if name == "snorm_10_10_10_2":
+        # X, Y and Z are packed from the least significant bit, the 2 bits of W are dropped
+        parts = ((raw.astype(np.uint32) >> np.array([0, 10, 20], dtype=np.uint32)) & 0x3FF).astype(np.int16)
+        return (parts - ((parts & 0x200) << 1)).astype(float_type) / 511
+    if name.startswith(("unorm", "snorm")):
+        return raw.astype(float_type) / np.iinfo(element_type).max
+    if name.startswith("float"):
+        return raw.astype(np.float32)
+    return raw.astype(element_type.newbyteorder("="))
+
+
+def get_vertex_length(attribute_format, stride, count):
+    # Bytes from the first element of the first vertex to the end of the last one
+    _, element_type, components = ATTRIBUTE_FORMATS[attribute_format]
+    if count == 0:
+        return 0
+    return (count - 1) * stride + np.dtype(element_type).itemsize * components
 
 
 class Fvtx:
-    def __init__(self, binary, offset):
-        self.binary = binary
+    def __init__(self, context, offset):
+        self.context = context
+        self.binary = context.binary
         self.offset = offset
+        self.as_lists = context.as_lists
+        # Lists keep the same precision as the previous per vertex decoding
+        self.float_type = np.float64 if self.as_lists else np.float32
+        self.buffer_keys = BufferKeys(self.binary)
         self.header = self.parse_header()
 
         self.parsed_data = {
@@ -15,179 +95,32 @@ class Fvtx:
         }
 
     def parse_header(self):
-        cursor = Cursor(self.binary, self.offset)
-        data = {}
-        data["magic"] = cursor.read_chars(4)
-        data["attribute_count"] = cursor.read_uint8()
-        data["buffer_count"] = cursor.read_uint8()
-        data["section_index"] = cursor.read_uint16()
-        data["vertex_count"] = cursor.read_uint32()
-        data["vertex_skin_count"] = cursor.read_uint8()
-        cursor.skip_bytes(3)
-        data["attribute_array_offset"] = cursor.read_offset()
-        data["attributes_dict"] = search_index_group(self.binary, cursor.read_offset())
-        data["buffer_array_offset"] = cursor.read_offset()
-        data["user_pointer"] = cursor.read_uint32()
+        data = HEADER.read(self.binary, self.offset)
+        data["attributes_dict"] = self.context.get_index_group(data["attributes_dict"])
 
         return data
 
     def parse_attribute(self, offset):
-        attr_cursor = Cursor(self.binary, offset)
-        attr = {}
-        name = read_string(self.binary, attr_cursor.read_offset())
-        attr["buffer_index"] = attr_cursor.read_uint8()
-        attr_cursor.skip_bytes()
-        attr["buffer_offset"] = attr_cursor.read_uint16()
-        attr["format"] = attr_cursor.read_uint32()
-
-        buff_cursor = Cursor(self.binary, self.header["buffer_array_offset"] + attr["buffer_index"] * 0x18)
-        buff_header = {
-            "data_pointer": buff_cursor.read_uint32(),
-            "size": buff_cursor.read_uint32(),
-            "handle": buff_cursor.read_uint32(),
-            "stride": buff_cursor.read_uint16(),
-            "buffering_count": buff_cursor.read_uint16(),
-            "context_pointer": buff_cursor.read_uint32(),
-            "data_offset": buff_cursor.read_offset()
-        }
+        attr = ATTRIBUTE.read(self.binary, offset)
+        name = self.context.strings.get(attr.pop("name"))
+        buff_header = BUFFER_HEADER.read(self.binary, self.header["buffer_array_offset"] + attr["buffer_index"] * 0x18)
+
+        attr["format_name"] = ATTRIBUTE_FORMATS[attr["format"]][0]
+        offset = buff_header["data_offset"] + attr["buffer_offset"]
+        count = self.header["vertex_count"]
+        decode = partial(decode_vertices, self.binary, attr["format"], offset, buff_header["stride"], count,
+                         self.float_type)
+        if self.context.buffers is not None and not self.as_lists:
+            # Keyed by the buffer and how the attribute is decoded from it, identical ones are only decoded once
+            length = get_vertex_length(attr["format"], buff_header["stride"], count)
+            key = hash_buffer("fvtx", self.buffer_keys.get(buff_header, attr["buffer_offset"], length),
+                              attr["format"], attr["buffer_offset"], buff_header["stride"], count)
+            vertices = self.context.buffers.get(key, decode)
+        else:
+            vertices = decode()
+        if self.as_lists:
+            vertices = vertices.tolist()
 
-        vertices = []
-        for v in range(self.header["vertex_count"]):
-            buff_cursor.go_to(attr["buffer_offset"] + buff_header["data_offset"] + v * buff_header["stride"])
-            if attr["format"] == 0x0000:
-                attr["format_name"] = "unorm_8"
-                vertices.append([float(buff_cursor.read_uint8()) / 255])
-            elif attr["format"] == 0x0004:
-                attr["format_name"] = "unorm_8_8"
-                vertices.append([
-                    float(buff_cursor.read_uint8()) / 255,
-                    float(buff_cursor.read_uint8()) / 255
-                ])
-            elif attr["format"] == 0x0007:
-                attr["format_name"] = "unorm_16_16"
-                vertices.append([
-                    float(buff_cursor.read_uint16()) / 65535,
-                    float(buff_cursor.read_uint16()) / 65535
-                ])
-            elif attr["format"] == 0x000A:
-                attr["format_name"] = "unorm_8_8_8_8"
-                vertices.append([
-                    buff_cursor.read_uint8() / 255,
-                    buff_cursor.read_uint8() / 255,
-                    buff_cursor.read_uint8() / 255,
-                    buff_cursor.read_uint8() / 255
-                ])
-            elif attr["format"] == 0x0100:
-                attr["format_name"] = "uint_8"
-                vertices.append([
-                    int(buff_cursor.read_uint8()),
-                ])
-            elif attr["format"] == 0x0104:
-                attr["format_name"] = "uint_8_8"
-                vertices.append([
-                    int(buff_cursor.read_uint8()),
-                    int(buff_cursor.read_uint8())
-                ])
-            elif attr["format"] == 0x010A:
-                attr["format_name"] = "uint_8_8_8_8"
-                vertices.append([
-                    int(buff_cursor.read_uint8()),
-                    int(buff_cursor.read_uint8()),
-                    int(buff_cursor.read_uint8()),
-                    int(buff_cursor.read_uint8())
-                ])
-            elif attr["format"] == 0x0200:
-                attr["format_name"] = "snorm_8"
-                vertices.append([
-                    float(buff_cursor.read_sint8()) / 127
-                ])
-            elif attr["format"] == 0x0204:
-                attr["format_name"] = "snorm_8_8"
-                vertices.append([
-                    float(buff_cursor.read_sint8()) / 127,
-                    float(buff_cursor.read_sint8()) / 127
-                ])
-            elif attr["format"] == 0x0207:
-                attr["format_name"] = "snorm_16_16"
-                vertices.append([
-                    float(buff_cursor.read_sint16()) / 32767,
-                    float(buff_cursor.read_sint16()) / 32767
-                ])
-            elif attr["format"] == 0x020A:
-                attr["format_name"] = "snorm_8_8_8_8"
-                vertices.append([
-                    float(buff_cursor.read_sint8()) / 127,
-                    float(buff_cursor.read_sint8()) / 127,
-                    float(buff_cursor.read_sint8()) / 127,
-                    float(buff_cursor.read_sint8()) / 127
-                ])
-            elif attr["format"] == 0x020B:
-                attr["format_name"] = "snorm_10_10_10_2"
-                normals_bytes = f"{buff_cursor.read_sint32():032b}"
-                parts = [buff_cursor.to_signed(int(normals_bytes[x:x + 10], 2), 1024) / 1000 for x in
-                         range(0, len(normals_bytes) - 2, 10)]
-                vertices.append(
-                    parts
-                )
-            elif attr["format"] == 0x0300:
-                attr["format_name"] = "sint_8"
-                vertices.append([
-                    int(buff_cursor.read_sint8()),
-                ])
-            elif attr["format"] == 0x0304:
-                attr["format_name"] = "sint_8_8"
-                vertices.append([
-                    int(buff_cursor.read_sint8()),
-                    int(buff_cursor.read_sint8()),
-                ])
-            elif attr["format"] == 0x030A:
-                attr["format_name"] = "sint_8_8_8_8"
-                vertices.append([
-                    int(buff_cursor.read_sint8()),
-                    int(buff_cursor.read_sint8()),
-                    int(buff_cursor.read_sint8()),
-                    int(buff_cursor.read_sint8()),
-                ])
-            elif attr["format"] == 0x0806:
-                attr["format_name"] = "float_32"
-                vertices.append([
-                    buff_cursor.read_float32(),
-                ])
-            elif attr["format"] == 0x0808:
-                attr["format_name"] = "float_16_16"
-                vertices.append([
-                    buff_cursor.read_float16(),
-                    buff_cursor.read_float16()
-                ])
-            elif attr["format"] == 0x080D:
-                attr["format_name"] = "float_32_32"
-                vertices.append([
-                    buff_cursor.read_float32(),
-                    buff_cursor.read_float32()
-                ])
-            elif attr["format"] == 0x080F:
-                attr["format_name"] = "float_16_16_16_16"
-                vertices.append([
-                    buff_cursor.read_float16(),
-                    buff_cursor.read_float16(),
-                    buff_cursor.read_float16(),
-                    buff_cursor.read_float16()
-                ])
-            elif attr["format"] == 0x0811:
-                attr["format_name"] = "float_32_32_32"
-                vertices.append([
-                    buff_cursor.read_float32(),
-                    buff_cursor.read_float32(),
-                    buff_cursor.read_float32()
-                ])
-            elif attr["format"] == 0x0813:
-                attr["format_name"] = "float_32_32_32_32"
-                vertices.append([
-                    buff_cursor.read_float32(),
-                    buff_cursor.read_float32(),
-                    buff_cursor.read_float32(),
-                    buff_cursor.read_float32()
-                ])
         return {
             "name": name,
             "data": {
@@ -200,6 +133,8 @@ class Fvtx:
     def parse_fvtx(self):
         fvtx_sections = {}
         for e in self.header["attributes_dict"]:
+            if not self.context.filters.keep_attribute(e[0]):
+                continue
             fvtx = self.parse_attribute(e[1])
             fvtx_sections[fvtx["name"]] = fvtx["data"]
         return fvtx_sections
@@ -0,0 +1,93 @@
+import hashlib
+import threading
+import weakref
+
+import numpy as np
+
+
+def hash_buffer(*parts):
+    # Parts are bytes-like or anything with a stable str, like formats and counts
+    content_hash = hashlib.blake2b(digest_size=20)
+    for part in parts:
+        if not isinstance(part, (bytes, bytearray, memoryview)):
+            part = str(part).encode("utf-8")
+        content_hash.update(part)
+        content_hash.update(b"\0")
+    return content_hash.hexdigest()
+
+
+def get_bytes(array):
+    # Flat byte view of an array, only copied when it is not contiguous, empty arrays of any shape included
+    return np.ascontiguousarray(array).reshape(-1).view(np.uint8)
+
+
+def hash_array(array):
+    array = np.asarray(array)
+    return hash_buffer(array.dtype.str, array.shape, memoryview(get_bytes(array)))
+
+
+class BufferKeys:
+    # Keys of the GX2 buffers of a section from their header, every buffer is only hashed once even when
+    # interleaved attributes or vis groups share it
+    def __init__(self, binary):
+        self.binary = binary
+        self.keys = {}
+
+    def get(self, buffer_header, start, length):
+        data_offset = buffer_header["data_offset"]
+        if start + length > buffer_header["size"]:
+            # Broken reads past the buffer are keyed by what they read
+            return hash_buffer(memoryview(self.binary)[data_offset + start:data_offset + start + length])
+        if data_offset not in self.keys:
+            self.keys[data_offset] = hash_buffer(memoryview(self.binary)[data_offset:
+                                                                         data_offset + buffer_header["size"]])
+        return self.keys[data_offset]
+
+
+class BufferStore:
+    # Decoded vertex and index buffers by the key of what they are decoded from, identical buffers of every model
+    # and archive share one read-only array as long as one of them is still used, content keys of read-only arrays
+    # are only hashed once
+    def __init__(self):
+        self.arrays = weakref.WeakValueDictionary()
+        self.keys = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.arrays)
+
+    def get(self, key, decode, content_key=None):
+        with self.lock:
+            array = self.arrays.get(key)
+        if array is not None:
+            return array
+        array = decode()
+        array.flags.writeable = False
+        with self.lock:
+            shared = self.arrays.setdefault(key, array)
+        if shared is array and content_key is not None:
+            self.remember(array, content_key)
+        return shared
+
+    def get_key(self, array):
+        key = self.keys.get(id(array))
+        if key is None:
+            key = hash_array(array)
+            if not array.flags.writeable:
+                self.remember(array, key)
+        return key
+
+    def remember(self, array, key):
+        with self.lock:
+            if id(array) in self.keys:
+                return
+            self.keys[id(array)] = key
+        weakref.finalize(array, self.keys.pop, id(array), None)
+
+
+# Shared by every archive of the process
+BUFFERS = BufferStore()
+
+
+def get_array_key(array):
+    return BUFFERS.get_key(array)
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from functools import partial
+
+import numpy as np
+
+from BfresParser.buffers import BUFFERS
+from BfresParser.tools import hash_file, split_arrays, join_arrays
+
+
+# Bumped whenever the parsed output changes, older entries are then never hit again and get evicted
+PARSER_VERSION = 7
+
+
+class ParseCache:
+    # Every entry is a directory holding meta.json, arrays are stored once in blobs/ by content key and loaded back
+    # memory mapped, so buffers shared by several archives only take space once
+    def __init__(self, directory, max_size=2 * 2 ** 30):
+        self.directory = directory
+        self.max_size = max_size
+        self.blob_directory = os.path.join(directory, "blobs")
+        os.makedirs(self.blob_directory, exist_ok=True)
+
+    def get_key(self, filename, as_lists=False, options=""):
+        # Options are any text describing how the archive was parsed, like its filters
+        key = f"{hash_file(filename)}-v{PARSER_VERSION}{'-lists' if as_lists else ''}"
+        if options:
+            key += "-" + hashlib.blake2b(options.encode("utf-8"), digest_size=8).hexdigest()
+        return key
+
+    def load(self, key):
+        path = os.path.join(self.directory, key)
+        try:
+            with open(os.path.join(path, "meta.json"), "r") as f:
+                meta = json.load(f)
+            arrays = [BUFFERS.get("blob:" + blob, partial(np.load, self.get_blob_path(blob), mmap_mode="r"), blob)
+                      for blob in meta["blobs"]]
+        except (OSError, ValueError, KeyError):
+            # A broken entry is removed so the archive is stored again once parsed
+            if os.path.exists(path):
+                shutil.rmtree(path, ignore_errors=True)
+            return None
+        # The modification time is the last use of the entry
+        os.utime(path)
+        return join_arrays(meta["data"], arrays)
+
+    def store(self, key, data):
+        arrays = []
+        meta = {"data": split_arrays(data, arrays), "blobs": [BUFFERS.get_key(array) for array in arrays]}
+        # Written in a temporary directory or file then renamed, readers never see a partial entry or blob
+        temporary_path = tempfile.mkdtemp(prefix=".tmp-", dir=self.directory)
+        try:
+            for blob, array in zip(meta["blobs"], arrays):
+                if not os.path.exists(self.get_blob_path(blob)):
+                    temporary_blob = os.path.join(temporary_path, f"{blob}.npy")
+                    np.save(temporary_blob, np.ascontiguousarray(array))
+                    os.replace(temporary_blob, self.get_blob_path(blob))
+            with open(os.path.join(temporary_path, "meta.json"), "w") as f:
+                json.dump(meta, f)
+            os.rename(temporary_path, os.path.join(self.directory, key))
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(temporary_path, ignore_errors=True)
+            return
+        self.evict()
+
+    def get_blob_path(self, blob):
+        return os.path.join(self.blob_directory, f"{blob}.npy")
+
+    def evict(self):
+        entries = []
+        references = {}
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir() or entry.name.startswith(".tmp-") or entry.path == self.blob_directory:
+                continue
+            size = sum(file.stat().st_size for file in os.scandir(entry.path))
+            try:
+                with open(os.path.join(entry.path, "meta.json"), "r") as f:
+                    blobs = set(json.load(f)["blobs"])
+            except (OSError, ValueError, KeyError):
+                # Entries of older versions hold their own arrays
+                blobs = set()
+            entries.append((entry.stat().st_mtime, size, blobs, entry.path))
+            for blob in blobs:
+                references[blob] = references.get(blob, 0) + 1
+        blob_sizes = {blob.name[:-4]: blob.stat().st_size for blob in os.scandir(self.blob_directory)
+                      if blob.name.endswith(".npy")}
+        total_size = sum(size for _, size, _, _ in entries) + sum(blob_sizes.values())
+        # Least recently used entries are removed first, a blob goes with the last entry using it
+        for _, size, blobs, path in sorted(entries, key=lambda entry: entry[0]):
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total_size -= size
+            for blob in blobs:
+                references[blob] -= 1
+                if references[blob] == 0:
+                    total_size -= blob_sizes.get(blob, 0)
+        # Blobs no entry uses anymore, an entry being stored by another process loads them again if it misses one
+        for blob in blob_sizes:
+            if references.get(blob, 0) == 0:
+                try:
+                    os.remove(self.get_blob_path(blob))
+                except OSError:
+                    pass
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_dir():
+                shutil.rmtree(entry.path, ignore_errors=True)
+        os.makedirs(self.blob_directory, exist_ok=True)
@@ -0,0 +1,58 @@
+from contextlib import nullcontext
+
+from BfresParser.filters import ParseFilter
+from BfresParser.index_group import ENTRY, search_index_group
+from BfresParser.string_table import StringTable
+
+
+class ParseCancelled(Exception):
+    pass
+
+
+class ParseContext:
+    # State shared by every section of a single archive
+    def __init__(self, binary, as_lists=False, decoder=None, stats=None, filters=None, cancel_event=None,
+                 buffers=None):
+        self.binary = binary
+        self.as_lists = as_lists
+        self.decoder = decoder
+        self.stats = stats
+        self.filters = filters if filters is not None else ParseFilter()
+        self.cancel_event = cancel_event
+        # A BufferStore shares identical vertex and index buffers with every other archive using it
+        self.buffers = buffers
+        self.header = None
+        self.strings = StringTable(binary)
+        self.index_groups = {}
+
+    def measure(self, stage, **labels):
+        # Every stage starts here, a cancelled parse stops before the next one
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise ParseCancelled(stage)
+        # Without stats the record is a throwaway dict, instrumented code never has to check
+        if self.stats is None:
+            return nullcontext({})
+        return self.stats.measure(stage, **labels)
+
+    def record(self, record_type, **fields):
+        # Compact records, or plain dicts in as_lists mode
+        if self.as_lists:
+            return fields
+        return record_type(**fields)
+
+    def require(self, end=None):
+        # Streamed archives are decompressed up to end, or completely without end
+        if self.decoder is not None and not self.decoder.done and (end is None or len(self.binary) < end):
+            with self.measure("decompress") as record:
+                start = len(self.binary)
+                self.decoder.decompress_to(end)
+                record["bytes"] = len(self.binary) - start
+
+    def get_index_group(self, offset):
+        if offset not in self.index_groups:
+            self.require(offset + 8)
+            index_group = search_index_group(self.binary, offset, self.strings)
+            if index_group:
+                self.require(offset + 8 + (len(index_group) + 1) * ENTRY.size)
+            self.index_groups[offset] = index_group
+        return self.index_groups[offset]
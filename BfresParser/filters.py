@@ -0,0 +1,71 @@
+import json
+
+
+class Exclude:
+    # Keeps every name except the given ones
+    def __init__(self, *names):
+        self.names = frozenset(names)
+
+    def __call__(self, name):
+        return name not in self.names
+
+    def __repr__(self):
+        return f"Exclude({', '.join(repr(name) for name in sorted(self.names))})"
+
+
+class ParseFilter:
+    # Every filter is None to keep everything, a collection of kept names (indices for LODs) or a predicate,
+    # filtered out sections are never decoded
+    def __init__(self, models=None, shapes=None, attributes=None, lods=None, materials=True, skeleton=True):
+        self.models = models
+        self.shapes = shapes
+        self.attributes = attributes
+        self.lods = lods
+        self.materials = materials
+        self.skeleton = skeleton
+
+    def __repr__(self):
+        fields = []
+        for name in ("models", "shapes", "attributes", "lods"):
+            value = getattr(self, name)
+            if value is not None and not callable(value):
+                value = sorted(value)
+            fields.append(f"{name}={value!r}")
+        return f"ParseFilter({', '.join(fields)}, materials={self.materials}, skeleton={self.skeleton})"
+
+    def get_key(self):
+        # Canonical text of the filters for cache keys, collections are sorted so equal filters give the same key,
+        # None when a predicate has no stable description
+        fields = {}
+        for name in ("models", "shapes", "attributes", "lods"):
+            value = getattr(self, name)
+            if isinstance(value, Exclude):
+                value = {"exclude": sorted(value.names)}
+            elif callable(value):
+                return None
+            elif value is not None:
+                value = sorted(value)
+            fields[name] = value
+        fields["materials"] = bool(self.materials)
+        fields["skeleton"] = bool(self.skeleton)
+        return json.dumps(fields, sort_keys=True)
+
+    def keep_model(self, name):
+        return keep(self.models, name)
+
+    def keep_shape(self, name):
+        return keep(self.shapes, name)
+
+    def keep_attribute(self, name):
+        return keep(self.attributes, name)
+
+    def keep_lod(self, index):
+        return keep(self.lods, index)
+
+
+def keep(selection, value):
+    if selection is None:
+        return True
+    if callable(selection):
+        return selection(value)
+    return value in selection
@@ -1,22 +1,124 @@
-from BfresParser.cursor import Cursor
+import struct
+from collections.abc import Sequence
+from functools import cached_property
+
 from BfresParser.tools import read_string
 
 
-def search_index_group(binary, offset):
+# Reference bit, left index, right index, name offset, data offset
+ENTRY = struct.Struct(">iHHii")
+
+
+class IndexGroup(Sequence):
+    def __init__(self, binary, offset, strings=None):
+        self.binary = binary
+        self.offset = offset
+        self.strings = strings
+        self.count = struct.unpack_from(">i", binary, offset + 4)[0]
+        self.found = {}
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if "entries" in self.__dict__ or isinstance(index, slice):
+            return self.entries[index]
+        # Single entries are decoded on their own until the whole group is needed
+        index = range(self.count)[index]
+        return self.__decode_entry(index + 1)[1:]
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __contains__(self, name):
+        return self.get_index(name, None) is not None
+
+    @cached_property
+    def entries(self):
+        # Skip the root entry, every other entry is decoded in a single pass
+        start = self.offset + 8 + ENTRY.size
+        targets = []
+        for e, (_, _, _, name_pointer, data_pointer) in enumerate(
+                ENTRY.iter_unpack(self.binary[start:start + self.count * ENTRY.size])):
+            entry_offset = start + e * ENTRY.size
+            targets.append([self.__read_name(name_pointer, entry_offset + 8),
+                            data_pointer + entry_offset + 12 if data_pointer != 0 else 0])
+        return targets
+
+    @cached_property
+    def indices(self):
+        return {entry[0]: e for e, entry in enumerate(self.entries)}
+
+    @property
+    def names(self):
+        return [entry[0] for entry in self.entries]
+
+    def tolist(self):
+        return self.entries
+
+    def get(self, name, default=None):
+        index = self.get_index(name, None)
+        if index is None:
+            return default
+        if name in self.found:
+            return self.found[name][2]
+        return self.entries[index][1]
+
+    def get_index(self, name, *default):
+        if "indices" not in self.__dict__ and name not in self.found:
+            entry = self.search(name)
+            if entry is not None:
+                self.found[name] = entry
+        if name in self.found:
+            return self.found[name][0]
+        if name in self.indices:
+            return self.indices[name]
+        if default:
+            return default[0]
+        raise KeyError(name)
+
+    def search(self, name):
+        # Walk the radix tree down from the root until a link points back up, then check the candidate's name
+        key = name.encode("latin-1")
+        parent_reference = -1
+        node = self.__read_entry(0)[1]
+        for _ in range(self.count + 1):
+            if not 0 < node <= self.count:
+                return None
+            reference, left, right, name_pointer, data_pointer = self.__read_entry(node)
+            if reference <= parent_reference:
+                entry = self.__decode_entry(node)
+                return entry if entry[1] == name else None
+            parent_reference = reference
+            node = right if get_bit(key, reference) else left
+        return None
+
+    def __read_entry(self, index):
+        return ENTRY.unpack_from(self.binary, self.offset + 8 + index * ENTRY.size)
+
+    def __decode_entry(self, node):
+        entry_offset = self.offset + 8 + node * ENTRY.size
+        name_pointer, data_pointer = self.__read_entry(node)[3:]
+        return [node - 1, self.__read_name(name_pointer, entry_offset + 8),
+                data_pointer + entry_offset + 12 if data_pointer != 0 else 0]
+
+    def __read_name(self, name_pointer, position):
+        if name_pointer == 0:
+            return ""
+        if self.strings is not None:
+            return self.strings.get(name_pointer + position)
+        return read_string(self.binary, name_pointer + position)
+
+
+def get_bit(key, reference):
+    # Bits are counted from the last character of the name, least significant bit first
+    character = reference >> 3
+    if character >= len(key):
+        return 0
+    return (key[len(key) - 1 - character] >> (reference & 7)) & 1
+
+
+def search_index_group(binary, offset, strings=None):
     if offset == 0:
         return 0
-    cursor = Cursor(binary, offset)
-    cursor.skip_bytes(4)
-    count = cursor.read_sint32()
-    cursor.skip_bytes(24)
-    targets = []
-    for e in range(count):
-        name_pointer = cursor.read_offset()
-        name = ""
-        if name_pointer > 0:
-            name = read_string(binary, name_pointer)
-
-        data_pointer = cursor.read_offset()
-        targets.append([name, data_pointer])
-        cursor.skip_bytes(8)
-    return targets
+    return IndexGroup(binary, offset, strings)
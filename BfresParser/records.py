@@ -0,0 +1,96 @@
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+
+# Name --> record or table type, so cached records can be rebuilt
+RECORD_TYPES = {}
+
+
+class Record(Mapping):
+    # Compact dict-like entity, subclasses list their keys in __slots__
+    __slots__ = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        RECORD_TYPES[cls.__name__] = cls
+
+    def __init__(self, **fields):
+        for key, value in fields.items():
+            self[key] = value
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __iter__(self):
+        return (key for key in self.__slots__ if hasattr(self, key))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{key}={value!r}' for key, value in self.items())})"
+
+    def to_dict(self):
+        return {key: self[key] for key in self}
+
+
+class Table(Sequence):
+    # Struct of arrays for homogeneous entities, an integer gives a row record built from the columns and a
+    # column name gives the whole column
+    __slots__ = ()
+    row_type = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        RECORD_TYPES[cls.__name__] = cls
+
+    def __init__(self, **columns):
+        for key in self.__slots__:
+            setattr(self, key, columns[key])
+
+    def __len__(self):
+        return len(getattr(self, self.__slots__[0]))
+
+    def __getitem__(self, index):
+        if isinstance(index, str):
+            if index not in self.__slots__:
+                raise KeyError(index)
+            return getattr(self, index)
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = range(len(self))[index]
+        return self.row_type(**{key: getattr(self, key)[index] for key in self.__slots__})
+
+    def __repr__(self):
+        return f"{type(self).__name__}({len(self)} rows)"
+
+    def columns(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def tolist(self):
+        # Plain row dicts, every column is converted once
+        columns = [getattr(self, key) for key in self.__slots__]
+        columns = [column.tolist() if isinstance(column, np.ndarray) else column for column in columns]
+        return [dict(zip(self.__slots__, row)) for row in zip(*columns)]
+
+
+def to_dicts(data):
+    # Dict view of parsed data, records become dicts and tables lists of row dicts, arrays are kept
+    if isinstance(data, Table):
+        return [to_dicts(row) for row in data]
+    if isinstance(data, (Record, dict)):
+        return {key: to_dicts(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [to_dicts(value) for value in data]
+    return data
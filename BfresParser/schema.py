@@ -0,0 +1,74 @@
+import re
+import struct
+
+from BfresParser.cursor import FORMATS
+
+
+class Schema:
+    # Fields are (name, type) or (name, type, relative), a type can be prefixed by a count like "4char" or
+    # "3float32", a field without name is padding and relative fields are offsets resolved from their own position
+    def __init__(self, fields, big_endian=True):
+        self.fields = []
+        self.relative = []
+        binary_format = ">" if big_endian else "<"
+        position = 0
+        index = 0
+        for field in fields:
+            name, field_type = field[:2]
+            relative = len(field) > 2 and field[2]
+            count, field_type = re.fullmatch(r"(\d*)(\w+)", field_type).groups()
+            count = int(count or 1)
+            size = struct.calcsize(f"{binary_format[0]}{count}{FORMATS[field_type]}")
+            if name is None:
+                binary_format += f"{size}x"
+            else:
+                binary_format += f"{count}{FORMATS[field_type]}"
+                values = 1 if field_type == "char" else count
+                self.fields.append((name, index, values, field_type == "char"))
+                if relative:
+                    element_size = size // values
+                    self.relative.extend((index + v, position + v * element_size) for v in range(values))
+                index += values
+            position += size
+        self.struct = struct.Struct(binary_format)
+        self.size = self.struct.size
+
+    def read(self, binary, offset):
+        values = list(self.struct.unpack_from(binary, offset))
+        for index, position in self.relative:
+            if values[index] != 0:
+                values[index] += offset + position
+
+        data = {}
+        for name, index, count, chars in self.fields:
+            if chars:
+                data[name] = values[index].decode("ascii")
+            elif count == 1:
+                data[name] = values[index]
+            else:
+                data[name] = values[index:index + count]
+        return data
+
+
+class VersionedSchema:
+    # Layouts are keyed by the first file version using them
+    def __init__(self, layouts):
+        self.layouts = sorted(layouts.items(), reverse=True)
+
+    def get(self, version):
+        for first_version, schema in self.layouts:
+            if version >= first_version:
+                return schema
+        raise KeyError(version)
+
+
+# GX2 buffer header shared by vertex and index buffers
+BUFFER_HEADER = Schema([
+    ("data_pointer", "uint32"),
+    ("size", "uint32"),
+    ("handle", "uint32"),
+    ("stride", "uint16"),
+    ("buffering_count", "uint16"),
+    ("context_pointer", "uint32"),
+    ("data_offset", "sint32", True)
+])
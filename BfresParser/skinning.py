@@ -0,0 +1,106 @@
+import numpy as np
+
+from BfresParser.FMDL.fskl import get_bone_arrays, get_world_matrices, get_skinning_matrices
+
+
+def skin_vertices(positions, normals, indices, weights, matrices, chunk_size=2 ** 16):
+    # Linear blend skinning, every vertex blends the 3x4 matrices it indexes with its weights, normals only use the
+    # blended rotation and scale and are normalized again
+    positions = np.asarray(positions, dtype=np.float32)[:, :3]
+    indices = np.asarray(indices, dtype=np.int64).reshape(len(positions), -1)
+    weights = np.asarray(weights, dtype=np.float32).reshape(len(positions), -1)
+    matrices = np.asarray(matrices, dtype=np.float32)
+    skinned_positions = np.empty_like(positions)
+    skinned_normals = None
+    if normals is not None:
+        normals = np.asarray(normals, dtype=np.float32)[:, :3]
+        skinned_normals = np.empty_like(normals)
+    # Chunks keep the gathered matrices small for large meshes
+    for start in range(0, len(positions), chunk_size):
+        end = start + chunk_size
+        blended = np.einsum("nk,nkij->nij", weights[start:end], matrices[indices[start:end]])
+        skinned_positions[start:end] = np.einsum("nij,nj->ni", blended[:, :, :3], positions[start:end]) + \
+            blended[:, :, 3]
+        if normals is not None:
+            skinned_normals[start:end] = np.einsum("nij,nj->ni", blended[:, :, :3], normals[start:end])
+    if normals is not None:
+        lengths = np.linalg.norm(skinned_normals, axis=1, keepdims=True)
+        np.divide(skinned_normals, lengths, out=skinned_normals, where=lengths > 0)
+    return skinned_positions, skinned_normals
+
+
+def get_vertex_influences(fvtx_attributes, skin_count, vertex_count, matrix_count):
+    # Skinning matrix indices and weights of every vertex, broken indices are clamped and weights normalized
+    if "_i0" not in fvtx_attributes:
+        return np.zeros((vertex_count, 1), dtype=np.int64), np.ones((vertex_count, 1), dtype=np.float32)
+    indices = np.asarray(fvtx_attributes["_i0"]["vertices"]).reshape(vertex_count, -1)
+    used = max(min(indices.shape[1], skin_count), 1)
+    indices = np.clip(indices[:, :used].astype(np.int64), 0, max(matrix_count - 1, 0))
+    if used == 1 or "_w0" not in fvtx_attributes:
+        weights = np.zeros((vertex_count, used), dtype=np.float32)
+        weights[:, 0] = 1
+        return indices, weights
+    weights = np.zeros((vertex_count, used), dtype=np.float32)
+    raw_weights = np.asarray(fvtx_attributes["_w0"]["vertices"], dtype=np.float32).reshape(vertex_count, -1)
+    weights[:, :min(used, raw_weights.shape[1])] = raw_weights[:, :used]
+    totals = weights.sum(axis=1, keepdims=True)
+    np.divide(weights, totals, out=weights, where=totals > 0)
+    # Vertices without any weight follow their first matrix
+    weights[totals[:, 0] <= 0, 0] = 1
+    return indices, weights
+
+
+def skin_shape(shape, fvtx, fskl, world_matrices=None, skinning_matrices=None, chunk_size=2 ** 16):
+    # Positions and normals of a shape in model space for the pose given by world matrices, the bind pose without
+    # them, shapes without skinning follow their bone, rigid ones the bone of their matrix and smooth ones are blended
+    bones = get_bone_arrays(fskl["bones"])
+    if world_matrices is None:
+        world_matrices = get_world_matrices(bones)
+    if skinning_matrices is None:
+        skinning_matrices = get_skinning_matrices(fskl, world_matrices)
+    attributes = fvtx["attributes"]
+    if "_p0" not in attributes:
+        return None
+    vertex_count = fvtx["header"]["vertex_count"]
+    positions = np.asarray(attributes["_p0"]["vertices"], dtype=np.float32).reshape(vertex_count, -1)
+    normals = None
+    if "_n0" in attributes:
+        normals = np.asarray(attributes["_n0"]["vertices"], dtype=np.float32).reshape(vertex_count, -1)
+
+    skin_count = shape["header"]["vtx_skin_count"]
+    if skin_count == 0 or not len(bones) or not len(skinning_matrices):
+        matrices = np.identity(4)[None, :3]
+        if len(bones):
+            matrices = world_matrices[min(shape["header"]["fskl_bone_skin_index"], len(bones) - 1)][None, :3]
+        indices = np.zeros((vertex_count, 1), dtype=np.int64)
+        weights = np.ones((vertex_count, 1), dtype=np.float32)
+    else:
+        indices, weights = get_vertex_influences(attributes, skin_count, vertex_count, len(skinning_matrices))
+        matrices = skinning_matrices
+        if skin_count == 1:
+            # Rigid vertices are in the space of their bone, even when their matrix is a smooth one
+            smooth_indices = np.asarray(fskl["smooth_indices"], dtype=np.int64)
+            matrices = world_matrices[np.clip(smooth_indices, 0, len(bones) - 1)][:, :3]
+    positions, normals = skin_vertices(positions, normals, indices, weights, matrices, chunk_size)
+    return {
+        "positions": positions,
+        "normals": normals
+    }
+
+
+def skin_model(model, world_matrices=None, chunk_size=2 ** 16):
+    # Skinned positions and normals of every shape of a parsed model by shape name, matrices are computed once
+    fskl = model["fskl"] or {"bones": [], "smooth_indices": []}
+    if world_matrices is None:
+        world_matrices = get_world_matrices(fskl["bones"])
+    skinning_matrices = get_skinning_matrices(fskl, world_matrices)
+    fvtx_sections = {fvtx["header"]["section_index"]: fvtx for fvtx in model["fvtx"]}
+    meshes = {}
+    for shape in model["fshp"]:
+        if shape["header"]["fvtx_index"] not in fvtx_sections:
+            continue
+        mesh = skin_shape(shape, fvtx_sections[shape["header"]["fvtx_index"]], fskl, world_matrices,
+                          skinning_matrices, chunk_size)
+        if mesh is not None:
+            meshes[shape["header"]["poly_name"]] = mesh
+    return meshes
@@ -0,0 +1,49 @@
+import sys
+import time
+from contextlib import contextmanager
+
+
+STAGE_TOTALS = ("seconds", "bytes", "elements", "allocated_blocks")
+
+
+class ParseStats:
+    # Every measured stage becomes a flat record, passed to the callback as soon as it is finished, records are only
+    # kept without a callback so long running batches do not grow, the totals of every stage are always kept
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.records = []
+        self.stages = {}
+
+    @contextmanager
+    def measure(self, stage, **labels):
+        record = {"stage": stage, **labels, "seconds": 0.0, "bytes": 0, "elements": 0, "allocated_blocks": 0}
+        # Allocated blocks only count live objects, cheap enough to be left on unlike tracemalloc
+        blocks = sys.getallocatedblocks()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            record["allocated_blocks"] = sys.getallocatedblocks() - blocks
+            self.add_to_totals(record)
+            if self.callback is not None:
+                self.callback(record)
+            else:
+                self.records.append(record)
+
+    def add_to_totals(self, record):
+        totals = self.stages.setdefault(record["stage"], {"count": 0, "seconds": 0.0, "bytes": 0, "elements": 0,
+                                                           "allocated_blocks": 0})
+        totals["count"] += 1
+        for key in STAGE_TOTALS:
+            totals[key] += record[key]
+
+    def to_records(self):
+        return [dict(record) for record in self.records]
+
+    def summary(self):
+        return {stage: dict(totals) for stage, totals in self.stages.items()}
+
+    def clear(self):
+        self.records = []
+        self.stages = {}
@@ -0,0 +1,29 @@
+import struct
+import sys
+
+from BfresParser.tools import read_string
+
+
+class StringTable:
+    def __init__(self, binary):
+        self.binary = binary
+        self.strings = {0: ""}
+
+    def load(self, offset, length):
+        # Entries are a 32 bits length followed by the null terminated string, aligned on 4 bytes
+        table = bytes(self.binary[offset:offset + length])
+        position = 0
+        while position + 4 <= len(table):
+            length = struct.unpack_from(">I", table, position)[0]
+            end = position + 4 + length
+            if end >= len(table) or table[end] != 0:
+                break
+            self.strings[offset + position + 4] = sys.intern(table[position + 4:end].decode("latin-1"))
+            position = (end + 4) & ~3
+
+    def get(self, offset):
+        string = self.strings.get(offset)
+        if string is None:
+            # Strings outside of the table are read once and kept
+            string = self.strings[offset] = sys.intern(read_string(self.binary, offset))
+        return string
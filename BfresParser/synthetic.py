@@ -0,0 +1,461 @@
+import math
+import os
+import random
+import struct
+
+import numpy as np
+
+from BfresParser import yaz0
+from BfresParser.index_group import get_bit
+from BfresParser.FMDL.fmat import MAT_PARAM
+from BfresParser.FMDL.fskl import BoneTable, get_world_matrices
+from BfresParser.FMDL.fvtx import ATTRIBUTE_FORMATS
+
+
+DEFAULT_ATTRIBUTES = {
+    "_p0": 0x0811,
+    "_n0": 0x020B,
+    "_u0": 0x0207,
+    "_i0": 0x010A,
+    "_w0": 0x000A,
+}
+
+
+def get_first_different_bit(name, other):
+    for ref in range(max(len(name), len(other)) * 8):
+        if get_bit(name, ref) != get_bit(other, ref):
+            return ref
+    raise ValueError(f"duplicate index group entry {name!r}")
+
+
+def build_radix_tree(names):
+    nodes = [[-1, 0, 0, b""]]
+    for name in names:
+        parent, child = 0, nodes[0][1]
+        while nodes[parent][0] < nodes[child][0]:
+            parent, child = child, nodes[child][2] if get_bit(name, nodes[child][0]) else nodes[child][1]
+        ref = get_first_different_bit(name, nodes[child][3])
+
+        parent, child = 0, nodes[0][1]
+        while nodes[parent][0] < nodes[child][0] < ref:
+            parent, child = child, nodes[child][2] if get_bit(name, nodes[child][0]) else nodes[child][1]
+
+        index = len(nodes)
+        if get_bit(name, ref):
+            nodes.append([ref, child, index, name])
+        else:
+            nodes.append([ref, index, child, name])
+        if parent != 0 and get_bit(name, nodes[parent][0]):
+            nodes[parent][2] = index
+        else:
+            nodes[parent][1] = index
+    return [(ref & 0xFFFFFFFF, left, right) for ref, left, right, _ in nodes]
+
+
+class FresWriter:
+    def __init__(self):
+        self.data = bytearray()
+        self.strings = {}
+        self.string_fixups = []
+        self.fixups = []
+
+    def alloc(self, size, align=4):
+        self.data.extend(b"\0" * (-len(self.data) % align))
+        offset = len(self.data)
+        self.data.extend(b"\0" * size)
+        return offset
+
+    def put(self, offset, binary_format, *values):
+        struct.pack_into(">" + binary_format, self.data, offset, *values)
+
+    def put_offset(self, position, target):
+        self.put(position, "i", target - position if target else 0)
+
+    def put_string(self, position, string):
+        self.strings.setdefault(string, None)
+        self.string_fixups.append((position, string))
+
+    def string_reference(self, string):
+        self.strings.setdefault(string, None)
+        return lambda: self.strings[string]
+
+    def defer(self, position, resolver):
+        self.fixups.append((position, resolver))
+
+    def index_group(self, entries):
+        names = [name.encode("ascii") for name, _ in entries]
+        tree = build_radix_tree(names)
+        offset = self.alloc(8 + 16 * len(tree))
+        self.put(offset, "Ii", 8 + 16 * len(tree), len(entries))
+        for e, (ref, left, right) in enumerate(tree):
+            self.put(offset + 8 + e * 16, "IHH", ref, left, right)
+        for e, (name, target) in enumerate(entries, 1):
+            entry = offset + 8 + e * 16
+            self.put_string(entry + 8, name)
+            if callable(target):
+                self.defer(entry + 12, target)
+            else:
+                self.put_offset(entry + 12, target)
+        return offset
+
+    def write_string_table(self):
+        start = self.alloc(0)
+        for string in sorted(self.strings):
+            encoded = string.encode("ascii")
+            offset = self.alloc(4 + len(encoded) + 1)
+            self.put(offset, "I", len(encoded))
+            self.data[offset + 4:offset + 4 + len(encoded)] = encoded
+            self.strings[string] = offset + 4
+        self.alloc(0)
+        for position, string in self.string_fixups:
+            self.put_offset(position, self.strings[string])
+        return start, len(self.data) - start
+
+    def resolve(self):
+        for position, resolver in self.fixups:
+            self.put_offset(position, resolver())
+
+
+def create_attribute_data(rng, name, binary_format, vertex_count, positions):
+    format_name, dtype, count = ATTRIBUTE_FORMATS[binary_format]
+    dtype = np.dtype(dtype)
+    kind = format_name.split("_")[0]
+    if name == "_p0" and kind == "float" and count >= 3:
+        values = np.zeros((vertex_count, count), dtype=dtype)
+        values[:, :3] = positions
+        return values
+    if kind == "float":
+        return rng.uniform(-1, 1, (vertex_count, count)).astype(dtype)
+    if format_name == "snorm_10_10_10_2":
+        return rng.integers(0, 2 ** 32, (vertex_count, count), dtype=np.uint64).astype(dtype)
+    info = np.iinfo(dtype)
+    return rng.integers(info.min, int(info.max) + 1, (vertex_count, count)).astype(dtype)
+
+
+def write_bfres(path, compressed=None, **options):
+    # Compressed unless told otherwise when the extension is .sbfres, options are those of generate_bfres
+    data = generate_bfres(**options)
+    if compressed is None:
+        compressed = os.path.splitext(path)[1].startswith(".s")
+    if compressed:
+        data = yaz0.compress(data)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def generate_bfres(models=1, shapes=2, vertices=256, attributes=None, materials=1, bones=4, lods=1,
+                   vis_groups=2, skin_count=2, euler_bones=False, version=(3, 4, 0, 4), seed=0, smooth_matrices=True,
+                   empty_vis_groups=False):
+    # Without smooth matrices every bone has a rigid one, with empty vis groups the first group of every LOD draws
+    # nothing
+    attributes = DEFAULT_ATTRIBUTES if attributes is None else attributes
+    rng = np.random.default_rng(seed)
+    random_source = random.Random(seed)
+    writer = FresWriter()
+    blobs = []
+
+    header = writer.alloc(0x6C)
+    writer.data[header:header + 4] = b"FRES"
+    writer.put(header + 4, "4BHHI", *version, 0xFEFF, 0x10, 0)
+    writer.put(header + 0x10, "I", 0x2000)
+    writer.put_string(header + 0x14, "Synthetic")
+
+    model_offsets = []
+    for m in range(models):
+        model_offsets.append(write_model(writer, rng, random_source, blobs, f"Model_{m:03d}", shapes, vertices,
+                                          attributes, materials, bones, lods, vis_groups, skin_count,
+                                          euler_bones, version, smooth_matrices, empty_vis_groups))
+    # Archives without models have no model dictionary at all
+    if models:
+        fmdl_dict = writer.index_group(list(zip([f"Model_{m:03d}" for m in range(models)], model_offsets)))
+        writer.put_offset(header + 0x20, fmdl_dict)
+    writer.put(header + 0x50, "H", models)
+
+    string_table_offset, string_table_length = writer.write_string_table()
+    writer.put(header + 0x18, "i", string_table_length)
+    writer.put_offset(header + 0x1C, string_table_offset)
+
+    for position, payload in blobs:
+        offset = writer.alloc(len(payload), 0x100)
+        writer.data[offset:offset + len(payload)] = payload
+        writer.put_offset(position, offset)
+    writer.resolve()
+    writer.put(header + 0x0C, "I", len(writer.data))
+    return bytes(writer.data)
+
+
+def write_model(writer, rng, random_source, blobs, name, shape_count, vertex_count, attributes, material_count,
+                 bone_count, lod_count, vis_group_count, skin_count, euler_bones, version, smooth_matrices,
+                 empty_vis_groups):
+    fmdl = writer.alloc(0x30)
+    writer.data[fmdl:fmdl + 4] = b"FMDL"
+    writer.put_string(fmdl + 4, name)
+    writer.put(fmdl + 0x20, "HHHHII", shape_count, shape_count, material_count, 0,
+               shape_count * vertex_count, 0)
+
+    fvtx_array = writer.alloc(0x20 * shape_count)
+    writer.put_offset(fmdl + 0x10, fvtx_array)
+    shape_names = [f"{name}_Shape_{s:03d}" for s in range(shape_count)]
+    shapes = []
+    for s in range(shape_count):
+        positions = rng.uniform(-100, 100, (vertex_count, 3)).astype(np.float32)
+        write_fvtx(writer, rng, blobs, fvtx_array + s * 0x20, s, vertex_count, skin_count, attributes, positions)
+        shapes.append((shape_names[s], write_fshp(writer, rng, blobs, shape_names[s], s, vertex_count,
+                                                   skin_count, lod_count, vis_group_count,
+                                                   fvtx_array + s * 0x20, material_count, positions,
+                                                   empty_vis_groups)))
+    writer.put_offset(fmdl + 0x14, writer.index_group(shapes))
+
+    material_entries = []
+    for m in range(material_count):
+        material_name = f"{name}_Mat_{m:03d}"
+        material_entries.append((material_name, write_fmat(writer, random_source, material_name, m, version)))
+    writer.put_offset(fmdl + 0x18, writer.index_group(material_entries))
+
+    writer.put_offset(fmdl + 0x0C, write_fskl(writer, random_source, name, bone_count, euler_bones,
+                                              smooth_matrices))
+    return fmdl
+
+
+def write_buffer_header(writer, offset, size, stride, payload, blobs):
+    writer.put(offset, "IIIHHI", 0, size, 0, stride, 1, 0)
+    blobs.append((offset + 0x14, payload))
+
+
+def write_fvtx(writer, rng, blobs, fvtx, index, vertex_count, skin_count, attributes, positions):
+    writer.data[fvtx:fvtx + 4] = b"FVTX"
+    writer.put(fvtx + 4, "BBHIB", len(attributes), 1, index, vertex_count, skin_count)
+
+    columns = []
+    stride = 0
+    for attribute_name, binary_format in attributes.items():
+        values = create_attribute_data(rng, attribute_name, binary_format, vertex_count, positions)
+        columns.append((attribute_name, binary_format, stride, values))
+        stride += values.dtype.itemsize * values.shape[1]
+    stride += -stride % 4
+
+    buffer = np.zeros((vertex_count, stride), dtype=np.uint8)
+    for attribute_name, binary_format, buffer_offset, values in columns:
+        raw = values.reshape(vertex_count, -1).view(np.uint8).reshape(vertex_count, -1)
+        buffer[:, buffer_offset:buffer_offset + raw.shape[1]] = raw
+
+    attribute_array = writer.alloc(0x0C * len(columns))
+    entries = []
+    for a, (attribute_name, binary_format, buffer_offset, _) in enumerate(columns):
+        attribute = attribute_array + a * 0x0C
+        writer.put_string(attribute, attribute_name)
+        writer.put(attribute + 4, "BxHI", 0, buffer_offset, binary_format)
+        entries.append((attribute_name, attribute))
+    writer.put_offset(fvtx + 0x10, attribute_array)
+    writer.put_offset(fvtx + 0x14, writer.index_group(entries))
+
+    buffer_array = writer.alloc(0x18)
+    write_buffer_header(writer, buffer_array, buffer.nbytes, stride, buffer.tobytes(), blobs)
+    writer.put_offset(fvtx + 0x18, buffer_array)
+
+
+def write_fshp(writer, rng, blobs, name, index, vertex_count, skin_count, lod_count, vis_group_count,
+                fvtx, material_count, positions, empty_vis_groups=False):
+    fshp = writer.alloc(0x40)
+    writer.data[fshp:fshp + 4] = b"FSHP"
+    writer.put_string(fshp + 4, name)
+    node_count = 2 * vis_group_count - 1
+    radius = float(np.linalg.norm(positions, axis=1).max())
+    writer.put(fshp + 8, "IHHHHHBBBBHf", 2, index, index % max(material_count, 1), 0, index, 0, skin_count,
+               lod_count, 0, 0, node_count, radius)
+    writer.put_offset(fshp + 0x20, fvtx)
+
+    index_format, index_type = (4, ">u2") if vertex_count <= 0xFFFF else (9, ">u4")
+    lod_array = writer.alloc(0x1C * lod_count)
+    writer.put_offset(fshp + 0x24, lod_array)
+    first_lod_groups = None
+    for lod_index in range(lod_count):
+        triangle_count = max(vertex_count >> lod_index, vis_group_count)
+        indices = rng.integers(0, vertex_count, triangle_count * 3).astype(index_type)
+        bounds = np.linspace(0, triangle_count, vis_group_count + 1).astype(int) * 3
+        groups = [(int(bounds[g]), int(bounds[g + 1] - bounds[g])) for g in range(vis_group_count)]
+        if empty_vis_groups and vis_group_count > 1:
+            groups[:2] = [(0, 0), (0, int(bounds[2]))]
+        if first_lod_groups is None:
+            first_lod_groups = [indices[start:start + count].astype(np.int64) for start, count in groups]
+
+        lod = lod_array + lod_index * 0x1C
+        writer.put(lod, "IIIH", 0x04, index_format, indices.size, vis_group_count)
+        vis_group_array = writer.alloc(8 * vis_group_count)
+        for g, (start, count) in enumerate(groups):
+            writer.put(vis_group_array + g * 8, "II", start * indices.itemsize, count)
+        writer.put_offset(lod + 0x10, vis_group_array)
+        index_buffer = writer.alloc(0x18)
+        write_buffer_header(writer, index_buffer, indices.nbytes, indices.itemsize, indices.tobytes(), blobs)
+        writer.put_offset(lod + 0x14, index_buffer)
+
+    nodes = []
+    ranges = []
+
+    def add_node(low, high):
+        node = len(nodes)
+        nodes.append(None)
+        points = positions[np.concatenate(first_lod_groups[low:high])]
+        minimum, maximum = (points.min(axis=0), points.max(axis=0)) if len(points) else (np.zeros(3), np.zeros(3))
+        ranges.append(np.concatenate([(minimum + maximum) / 2, (maximum - minimum) / 2]))
+        if high - low == 1:
+            nodes[node] = [node, node, 0, 0, low, 1]
+        else:
+            middle = (low + high) // 2
+            left = add_node(low, middle)
+            right = add_node(middle, high)
+            nodes[node] = [left, right, 0, 0, low, high - low]
+        return node
+
+    add_node(0, vis_group_count)
+    node_array = writer.alloc(12 * len(nodes))
+    for n, node in enumerate(nodes):
+        writer.put(node_array + n * 12, "6H", *node)
+    range_array = writer.alloc(24 * len(ranges))
+    for n, vis_range in enumerate(ranges):
+        writer.put(range_array + n * 24, "6f", *vis_range)
+    index_array = writer.alloc(2 * len(nodes))
+    for n in range(len(nodes)):
+        writer.put(index_array + n * 2, "H", n)
+    writer.put_offset(fshp + 0x2C, writer.index_group([]))
+    writer.put_offset(fshp + 0x30, node_array)
+    writer.put_offset(fshp + 0x34, range_array)
+    writer.put_offset(fshp + 0x38, index_array)
+    return fshp
+
+
+def write_fmat(writer, random_source, name, index, version):
+    fmat = writer.alloc(0x4C)
+    writer.data[fmat:fmat + 4] = b"FMAT"
+    writer.put_string(fmat + 4, name)
+
+    render_infos = []
+    for r, (info_type, values) in enumerate([(0, [(1, 2)]), (1, [(0.5, 1.5), (2.0, 3.0)]), (2, ["opaque"])]):
+        info_name = f"render_info_{r}"
+        info = writer.alloc(8 + 8 * len(values))
+        writer.put(info, "HBx", len(values), info_type)
+        writer.put_string(info + 4, info_name)
+        for v, value in enumerate(values):
+            if info_type == 0:
+                writer.put(info + 8 + v * 8, "2i", *value)
+            elif info_type == 1:
+                writer.put(info + 8 + v * 8, "2f", *value)
+            else:
+                writer.put_string(info + 8 + v * 4, value)
+        render_infos.append((info_name, info))
+
+    samplers = []
+    sampler_array = writer.alloc(0x18 * 2)
+    for s, sampler_name in enumerate(["_a0", "_n0"]):
+        sampler = sampler_array + s * 0x18
+        writer.put(sampler, "IIII", random_source.getrandbits(32), random_source.getrandbits(32),
+                   random_source.getrandbits(32), 0)
+        writer.put_string(sampler + 0x10, sampler_name)
+        writer.put(sampler + 0x14, "B", s)
+        samplers.append((sampler_name, sampler))
+
+    # Parameters use the layout the reader picks for the version, the name offset comes last in all of them
+    param_size = MAT_PARAM.get(sum(number * 10 ** (len(version) - 1 - i) for i, number in enumerate(version))).size
+    params = []
+    param_array = writer.alloc(param_size * 4)
+    param_data = writer.alloc(4 * 10)
+    data_offset = 0
+    for p, param_type in enumerate([12, 13, 14, 15]):
+        count = param_type - 11
+        param = param_array + p * param_size
+        param_name = f"param_{p}"
+        writer.put(param, "BBH", param_type, count * 4, data_offset)
+        writer.put_string(param + param_size - 4, param_name)
+        writer.put(param_data + data_offset, f"{count}f",
+                   *[round(random_source.uniform(-1, 1), 3) for _ in range(count)])
+        data_offset += count * 4
+        params.append((param_name, param))
+
+    render_state = writer.alloc(0x30)
+    writer.put(render_state, "IIIIfIII4f", 1, 2, 3, 4, 0.5, 5, 6, 7, 1.0, 0.5, 0.25, 1.0)
+
+    options = []
+    for o in range(3):
+        options.append((f"option_{o}", writer.string_reference(str(o))))
+    shader_assign = writer.alloc(0x1C)
+    writer.put_string(shader_assign, "synthetic_archive")
+    writer.put_string(shader_assign + 4, f"model_{index % 2}")
+    writer.put(shader_assign + 8, "IBBH", 0, 0, 0, len(options))
+    writer.put_offset(shader_assign + 0x10, writer.index_group([]))
+    writer.put_offset(shader_assign + 0x14, writer.index_group([]))
+    writer.put_offset(shader_assign + 0x18, writer.index_group(options))
+
+    writer.put(fmat + 8, "IHHBBHHHHH", 1, index, len(render_infos), 0, len(samplers), len(params), 0,
+               data_offset, 0, 0)
+    writer.put_offset(fmat + 0x1C, writer.index_group(render_infos))
+    writer.put_offset(fmat + 0x20, render_state)
+    writer.put_offset(fmat + 0x24, shader_assign)
+    writer.put_offset(fmat + 0x2C, sampler_array)
+    writer.put_offset(fmat + 0x30, writer.index_group(samplers))
+    writer.put_offset(fmat + 0x34, param_array)
+    writer.put_offset(fmat + 0x38, writer.index_group(params))
+    writer.put_offset(fmat + 0x3C, param_data)
+    writer.put_offset(fmat + 0x40, writer.index_group([]))
+    return fmat
+
+
+def write_fskl(writer, random_source, name, bone_count, euler_bones, smooth_matrices=True):
+    fskl = writer.alloc(0x24)
+    writer.data[fskl:fskl + 4] = b"FSKL"
+    rotation_flags = 0x1000 if euler_bones else 0
+    smooth_count = bone_count if smooth_matrices else 0
+    rigid_count = bone_count - smooth_count
+    writer.put(fskl + 4, "IHHH", 0x100 | rotation_flags, bone_count, smooth_count, rigid_count)
+
+    bone_array = writer.alloc(0x40 * bone_count)
+    entries = []
+    parent_indices, rotations, translations = [], [], []
+    for b in range(bone_count):
+        bone = bone_array + b * 0x40
+        bone_name = f"{name}_Bone_{b:03d}"
+        writer.put_string(bone, bone_name)
+        if euler_bones:
+            rotation = [random_source.uniform(-math.pi, math.pi) for _ in range(3)] + [1.0]
+        else:
+            rotation = [random_source.gauss(0, 1) for _ in range(4)]
+            length = math.sqrt(sum(value * value for value in rotation))
+            rotation = [value / length for value in rotation]
+        parent_index = 0xFFFF if b == 0 else random_source.randrange(b)
+        translation = [random_source.uniform(-10, 10) for _ in range(3)]
+        smooth_matrix_index, rigid_matrix_index = (b, -1) if smooth_matrices else (-1, b)
+        writer.put(bone + 4, "HHhhhHI3f4f3f", b, parent_index, smooth_matrix_index, rigid_matrix_index, -1, 0,
+                   1 | rotation_flags, 1.0, 1.0, 1.0, *rotation, *translation)
+        entries.append((bone_name, bone))
+        parent_indices.append(parent_index)
+        rotations.append(rotation)
+        translations.append(translation)
+    writer.put_offset(fskl + 0x10, writer.index_group(entries))
+    writer.put_offset(fskl + 0x14, bone_array)
+
+    # Bone of every smooth then rigid matrix
+    smooth_index = writer.alloc(2 * bone_count)
+    for b in range(bone_count):
+        writer.put(smooth_index + b * 2, "H", b)
+    writer.put_offset(fskl + 0x18, smooth_index)
+    # Inverse of the bind pose of every bone, stored as float32 like the bone transforms
+    bones = BoneTable(
+        name=[entry[0] for entry in entries],
+        index=np.arange(bone_count),
+        parent_index=np.array(parent_indices, dtype=np.uint16),
+        smooth_matrix_index=np.arange(bone_count) if smooth_matrices else np.full(bone_count, -1),
+        rigid_matrix_index=np.full(bone_count, -1) if smooth_matrices else np.arange(bone_count),
+        billboard_index=np.full(bone_count, -1),
+        user_data_count=np.zeros(bone_count),
+        flags=np.full(bone_count, 1 | rotation_flags),
+        scale=np.ones((bone_count, 3), dtype=np.float32),
+        rotation=np.array(rotations, dtype=np.float32).reshape(-1, 4),
+        translation=np.array(translations, dtype=np.float32).reshape(-1, 3),
+        user_data_dict=[0] * bone_count
+    )
+    inverse_matrices = np.linalg.inv(get_world_matrices(bones))[:, :3]
+    smooth_matrix = writer.alloc(48 * smooth_count)
+    for b in range(smooth_count):
+        writer.put(smooth_matrix + b * 48, "12f", *inverse_matrices[b].ravel())
+    writer.put_offset(fskl + 0x1C, smooth_matrix)
+    return fskl
@@ -1,24 +1,96 @@
+import hashlib
+import mmap
 import os
-import oead
+from collections.abc import Sequence
 
+import numpy as np
 
-def open_bfres(path):
-    with open(path, "rb") as f:
-        data = f.read()
+from BfresParser import yaz0
+from BfresParser.records import RECORD_TYPES, Record, Table
+
+
+def open_bfres(path, stream=False):
     extension = os.path.splitext(path)[1]
-    if extension.startswith(".s"):
-        return oead.yaz0.decompress(data)
-    else:
-        return data
+    with open(path, "rb") as f:
+        # Empty files cannot be mapped
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError("Not a BFRES file (empty)")
+        if extension.startswith(".s"):
+            # A streamed archive is returned as its decoder, only decompressed as far as it is read
+            if stream:
+                return yaz0.Yaz0Decoder(f.read())
+            return yaz0.decompress(f.read())
+        # Uncompressed files are mapped rather than read, every section is decoded from the mapping without copies,
+        # the mapping is closed with the parser
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
 
 
-def read_string(binary, offset):
-    next_offset = offset
-    name = ""
+def hash_file(path, chunk_size=2 ** 20):
+    content_hash = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def read_string(binary, offset, chunk_size=64):
+    name = b""
     while True:
-        character = binary[next_offset]
-        if character != 0:
-            name += chr(character)
-        else:
-            return name
-        next_offset += 1
+        chunk = bytes(binary[offset:offset + chunk_size])
+        end = chunk.find(b"\0")
+        if end != -1 or not chunk:
+            return (name + chunk[:end]).decode("latin-1")
+        name += chunk
+        offset += chunk_size
+
+
+class LazyList(Sequence):
+    """Sequence whose items are loaded by index on first access and then kept."""
+
+    __missing = object()
+
+    def __init__(self, count, loader):
+        self.loader = loader
+        self.items = [self.__missing] * count
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = range(len(self))[index]
+        if self.items[index] is self.__missing:
+            self.items[index] = self.loader(index)
+        return self.items[index]
+
+
+def split_arrays(data, arrays):
+    # Arrays are moved to the given list and replaced by {"__array__": index}, records and tables by
+    # {"__record__": type name, "fields": ...}, index groups become plain lists, what remains only holds JSON types
+    if isinstance(data, np.ndarray):
+        arrays.append(data)
+        return {"__array__": len(arrays) - 1}
+    if isinstance(data, Record):
+        return {"__record__": type(data).__name__, "fields": split_arrays(data.to_dict(), arrays)}
+    if isinstance(data, Table):
+        return {"__record__": type(data).__name__, "fields": split_arrays(data.columns(), arrays)}
+    if isinstance(data, dict):
+        return {key: split_arrays(value, arrays) for key, value in data.items()}
+    if hasattr(data, "tolist"):
+        data = data.tolist()
+    if isinstance(data, (list, tuple)):
+        return [split_arrays(value, arrays) for value in data]
+    return data
+
+
+def join_arrays(data, arrays):
+    if isinstance(data, dict):
+        if len(data) == 1 and "__array__" in data:
+            return arrays[data["__array__"]]
+        if len(data) == 2 and "__record__" in data:
+            return RECORD_TYPES[data["__record__"]](**join_arrays(data["fields"], arrays))
+        return {key: join_arrays(value, arrays) for key, value in data.items()}
+    if isinstance(data, list):
+        return [join_arrays(value, arrays) for value in data]
+    return data
@@ -0,0 +1,96 @@
+import struct
+
+try:
+    import oead
+except ImportError:
+    oead = None
+
+
+class Yaz0Decoder:
+    # Decompresses into self.output only as far as requested, whole groups of 8 operations at a time
+    def __init__(self, data):
+        if bytes(data[:4]) != b"Yaz0":
+            raise ValueError("Not a Yaz0 file")
+        self.data = data
+        self.size = struct.unpack_from(">I", data, 4)[0]
+        self.output = bytearray()
+        self.position = 16
+
+    @property
+    def done(self):
+        return len(self.output) >= self.size
+
+    def decompress_to(self, size=None):
+        size = self.size if size is None else min(size, self.size)
+        if len(self.output) >= size:
+            return self.output
+        if size == self.size and oead is not None:
+            # The rest is decompressed by oead, the output object stays the same so existing readers see it
+            self.output += memoryview(oead.yaz0.decompress(self.data))[len(self.output):self.size]
+            return self.output
+
+        data = self.data
+        output = self.output
+        position = self.position
+        while len(output) < size and position < len(data):
+            code = data[position]
+            position += 1
+            if code == 0xFF and position + 8 <= len(data):
+                output += data[position:position + 8]
+                position += 8
+                continue
+            for bit in range(7, -1, -1):
+                if len(output) >= self.size:
+                    break
+                if code >> bit & 1:
+                    output.append(data[position])
+                    position += 1
+                    continue
+                first, second = data[position], data[position + 1]
+                position += 2
+                distance = ((first & 0xF) << 8 | second) + 1
+                count = first >> 4
+                if count == 0:
+                    count = data[position] + 0x12
+                    position += 1
+                else:
+                    count += 2
+                start = len(output) - distance
+                if distance >= count:
+                    output += output[start:start + count]
+                else:
+                    # Overlapping copies repeat the last distance bytes
+                    output += (output[start:] * (count // distance + 1))[:count]
+        self.position = position
+        del output[self.size:]
+        return output
+
+    def iter_decompress(self, chunk_size=2 ** 20):
+        start = len(self.output)
+        while not self.done:
+            self.decompress_to(start + chunk_size)
+            yield bytes(self.output[start:])
+            start = len(self.output)
+
+
+def iter_decompress(data, chunk_size=2 ** 20):
+    # Decompressed chunks of about chunk_size bytes, stopping the iteration stops the decompression
+    yield from Yaz0Decoder(data).iter_decompress(chunk_size)
+
+
+def decompress(data):
+    if oead is not None:
+        return oead.yaz0.decompress(data)
+    return bytes(Yaz0Decoder(data).decompress_to())
+
+
+def compress(data, alignment=0):
+    if oead is not None:
+        return bytes(oead.yaz0.compress(data, data_alignment=alignment))
+    # Without oead every byte is stored as a literal, valid for any decoder but not smaller
+    output = bytearray(b"Yaz0" + struct.pack(">II", len(data), alignment) + bytes(4))
+    for start in range(0, len(data), 8):
+        group = data[start:start + 8]
+        output.append(0xFF << (8 - len(group)) & 0xFF)
+        output += group
+    return bytes(output)
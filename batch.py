@@ -0,0 +1,147 @@
+import argparse
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from bfres_parser import BfresParser
+
+
+EXTENSIONS = (".bfres", ".sbfres")
+
+
+def find_archives(input_dir):
+    archives = []
+    for root, _, files in os.walk(input_dir):
+        for file in files:
+            if file.lower().endswith(EXTENSIONS):
+                archives.append(os.path.join(root, file))
+    return sorted(archives)
+
+
+def get_output_path(archive, input_dir, output_dir, output_format="obj"):
+    # The archive extension is kept so "a.bfres" and "a.sbfres" never write the same file
+    return os.path.join(output_dir, f"{os.path.relpath(archive, input_dir)}.{output_format}")
+
+
+def is_up_to_date(archive, output):
+    return os.path.exists(output) and os.path.getmtime(output) >= os.path.getmtime(archive)
+
+
+def convert(archive, output, output_format="obj", blob_directory=None):
+    # Runs in a worker process, errors are returned so one broken archive never stops the batch
+    start = time.perf_counter()
+    try:
+        with BfresParser(archive) as bfres_file:
+            os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+            # Written next to the output then renamed, an interrupted export is never seen as up to date
+            temporary_output = output + ".tmp"
+            try:
+                if output_format == "glb":
+                    with open(temporary_output, "wb") as glb_file:
+                        bfres_file.to_glb(glb_file)
+                elif output_format == "json":
+                    # Arrays go to a blob directory shared by every archive, identical buffers are only written once
+                    os.makedirs(blob_directory, exist_ok=True)
+                    with open(temporary_output, "w") as json_file:
+                        bfres_file.to_json(json_file, blob_directory=blob_directory)
+                else:
+                    with open(temporary_output, "w") as obj_file:
+                        bfres_file.to_obj(obj_file)
+                os.replace(temporary_output, output)
+            except BaseException:
+                # A failed export leaves nothing behind
+                if os.path.exists(temporary_output):
+                    os.remove(temporary_output)
+                raise
+    except Exception:
+        return archive, time.perf_counter() - start, traceback.format_exc()
+    return archive, time.perf_counter() - start, None
+
+
+def run(input_dir, output_dir, workers=None, force=False, output_format="obj", log=sys.stderr):
+    archives = find_archives(input_dir)
+    jobs = []
+    skipped = 0
+    for archive in archives:
+        output = get_output_path(archive, input_dir, output_dir, output_format)
+        if not force and is_up_to_date(archive, output):
+            skipped += 1
+        else:
+            jobs.append((archive, output))
+
+    # JSON exports of the whole batch share their arrays
+    blob_directory = os.path.join(output_dir, "blobs") if output_format == "json" else None
+    start = time.perf_counter()
+    converted = []
+    failed = []
+    total_bytes = 0
+    done = 0
+    pending = jobs
+    isolate = False
+    while pending:
+        # After a worker died the unfinished archives run one at a time, the first one that does not finish is the
+        # one that killed it, the others then go back to a full pool
+        unfinished = []
+        with ProcessPoolExecutor(max_workers=1 if isolate else workers) as executor:
+            futures = {executor.submit(convert, archive, output, output_format, blob_directory): j
+                       for j, (archive, output) in enumerate(pending)}
+            for future in as_completed(futures):
+                archive = pending[futures[future]][0]
+                try:
+                    _, duration, error = future.result()
+                except BrokenProcessPool:
+                    # Every archive not finished when a worker dies fails with the pool, not only its own
+                    unfinished.append(futures[future])
+                    continue
+                except Exception:
+                    duration, error = 0, traceback.format_exc()
+                done += 1
+                if error is None:
+                    converted.append(archive)
+                    total_bytes += os.path.getsize(archive)
+                    status = f"ok {duration:.2f}s"
+                else:
+                    failed.append((archive, error))
+                    status = "failed\n" + error
+                elapsed = time.perf_counter() - start
+                print(f"[{done}/{len(jobs)}] {archive} {status} "
+                      f"({done / elapsed:.1f} files/s, {total_bytes / elapsed / 2 ** 20:.1f} MB/s)", file=log)
+        unfinished = [pending[j] for j in sorted(unfinished)]
+        if isolate and unfinished:
+            # A single worker runs its archives in order
+            archive = unfinished.pop(0)[0]
+            done += 1
+            failed.append((archive, "The worker process died (crash or killed)\n"))
+            print(f"[{done}/{len(jobs)}] {archive} failed, the worker process died", file=log)
+        isolate = bool(unfinished) and not isolate
+        pending = unfinished
+
+    elapsed = time.perf_counter() - start
+    print(f"{len(converted)} converted, {skipped} up to date, {len(failed)} failed in {elapsed:.2f}s", file=log)
+    return {
+        "converted": converted,
+        "skipped": skipped,
+        "failed": failed,
+        "seconds": elapsed,
+        "bytes": total_bytes
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert every .bfres and .sbfres archive of a directory tree")
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--format", choices=["obj", "glb", "json"], default="obj", help="output format")
+    parser.add_argument("-f", "--force", action="store_true", help="convert archives even when up to date")
+    args = parser.parse_args(argv)
+
+    summary = run(args.input_dir, args.output_dir, args.workers, args.force, args.format)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bfres_parser import BfresParser
+from BfresParser.synthetic import write_bfres
+
+
+SIZES = {
+    "small": {"models": 1, "shapes": 2, "vertices": 1000, "materials": 2, "bones": 8},
+    "medium": {"models": 2, "shapes": 8, "vertices": 20000, "materials": 4, "bones": 50, "lods": 2},
+    "large": {"models": 4, "shapes": 16, "vertices": 100000, "materials": 8, "bones": 200, "lods": 2,
+              "vis_groups": 8}
+}
+
+STAGES = ["header", "fmdl", "fvtx", "fmat", "fskl", "fshp", "dict", "obj", "total"]
+
+
+def time_stages(path, as_lists=False):
+    timings = {}
+    start = time.perf_counter()
+
+    def lap(stage):
+        nonlocal start
+        now = time.perf_counter()
+        timings[stage] = now - start
+        start = now
+
+    # Each stage is forced through the lazy API so it is timed on its own
+    bfres_file = BfresParser(path, as_lists=as_lists, lazy=True)
+    lap("header")
+    models = list(bfres_file.models)
+    lap("fmdl")
+    for model in models:
+        list(model.fvtx_sections)
+    lap("fvtx")
+    for model in models:
+        list(model.fmat_sections)
+    lap("fmat")
+    for model in models:
+        _ = model.fskl_section
+    lap("fskl")
+    for model in models:
+        list(model.fshp_sections)
+    lap("fshp")
+    _ = bfres_file.dict
+    lap("dict")
+    with open(os.devnull, "w") as obj_file:
+        bfres_file.to_obj(obj_file)
+    lap("obj")
+
+    with open(os.devnull, "w") as obj_file:
+        BfresParser(path, as_lists=as_lists).to_obj(obj_file)
+    lap("total")
+    return timings
+
+
+def measure_memory(path, as_lists=False):
+    tracemalloc.start()
+    try:
+        bfres_file = BfresParser(path, as_lists=as_lists)
+        with open(os.devnull, "w") as obj_file:
+            bfres_file.to_obj(obj_file)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(sizes, repeat=3, compressed=False, as_lists=False, memory=True, log=sys.stdout):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            path = write_bfres(os.path.join(directory, f"{size}.{'s' if compressed else ''}bfres"), **SIZES[size])
+            file_size = os.path.getsize(path)
+            # The best of every repetition is kept, it is the least disturbed by the rest of the machine
+            runs = [time_stages(path, as_lists) for _ in range(repeat)]
+            timings = {stage: min(timing[stage] for timing in runs) for stage in STAGES}
+            result = {
+                "size": size,
+                "file_size": file_size,
+                "compressed": compressed,
+                "as_lists": as_lists,
+                "seconds": timings,
+                "throughput": file_size / timings["total"] / 2 ** 20,
+                "peak_memory": measure_memory(path, as_lists) if memory else None
+            }
+            results.append(result)
+
+            print(f"{size} ({file_size / 2 ** 20:.1f} MB{', yaz0' if compressed else ''})", file=log)
+            for stage in STAGES:
+                print(f"    {stage:<8}{timings[stage] * 1000:10.1f} ms", file=log)
+            print(f"    {result['throughput']:.1f} MB/s", end="", file=log)
+            if memory:
+                print(f", peak memory {result['peak_memory'] / 2 ** 20:.1f} MB", end="", file=log)
+            print(file=log)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark BfresParser on generated archives")
+    parser.add_argument("sizes", nargs="*", choices=list(SIZES), default=["small", "medium"])
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("-c", "--compressed", action="store_true", help="benchmark Yaz0 compressed archives")
+    parser.add_argument("--as-lists", action="store_true", help="parse into plain lists")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced peak memory run")
+    parser.add_argument("-o", "--output", help="write the results to a JSON file")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.repeat, args.compressed, args.as_lists, not args.no_memory)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
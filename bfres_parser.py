@@ -1,57 +1,211 @@
-from BfresParser.cursor import Cursor
-from BfresParser.tools import open_bfres, read_string
-from BfresParser.index_group import search_index_group
+import asyncio
+import mmap
+import threading
+from contextlib import nullcontext
+from functools import cached_property, partial
+
+from BfresParser.buffers import BUFFERS
+from BfresParser.cache import ParseCache
+from BfresParser.context import ParseContext, ParseCancelled
+from BfresParser.filters import ParseFilter
+from BfresParser.records import Table
+from BfresParser.schema import Schema
+from BfresParser.skinning import skin_model
+from BfresParser.tools import open_bfres, LazyList
+from BfresParser.yaz0 import Yaz0Decoder
 from BfresParser.Converter.wavefront_obj import ObjConverter
+from BfresParser.Converter.gltf import GlbConverter
+from BfresParser.Converter.json_export import JsonConverter
 from BfresParser.FMDL.fmdl import Fmdl
 
 
+HEADER = Schema([
+    ("magic", "4char"),
+    ("version", "4uint8"),
+    ("bom", "uint16"),
+    ("header_length", "uint16"),
+    ("file_size", "uint32"),
+    ("file_alignment", "uint32"),
+    ("name", "sint32", True),
+    ("string_table_length", "sint32"),
+    ("string_table_offset", "sint32", True),
+    ("file_offsets", "12sint32", True),
+    ("file_counts", "12uint16"),
+    ("user_pointer", "uint32")
+])
+
+
 class BfresParser:
-    def __init__(self, filename):
-        self.binary = open_bfres(filename)
-        self.__header = self.__parse_header()
-        self.__fmdl = self.__parse_fmdl()
+    def __init__(self, filename, as_lists=False, lazy=False, cache_dir=None, cache_size=2 * 2 ** 30, stats=None,
+                 filters=None, cancel_event=None, dedup=False):
+        self.filename = filename
+        self.as_lists = as_lists
+        self.lazy = lazy
+        # A ParseStats records the time, bytes, elements and allocations of every stage
+        self.stats = stats
+        # A ParseFilter restricts the models, shapes, attributes, LODs and sections that are decoded
+        self.filters = filters if filters is not None else ParseFilter()
+        # Setting this threading.Event stops the parse with ParseCancelled before its next stage
+        self.cancel_event = cancel_event
+        # With dedup, vertex and index buffers are hashed and identical ones of every archive of the process are
+        # decoded once and shared as read-only arrays
+        self.dedup = dedup
+        # Archives parsed with a predicate filter are never cached, there is no stable key for them
+        filter_key = self.filters.get_key() if filters is not None else ""
+        self.cache = ParseCache(cache_dir, cache_size) if cache_dir is not None and filter_key is not None else None
+
+        # On a cache hit the archive is not even decompressed, it is only opened again if models are accessed
+        cached = None
+        if self.cache is not None:
+            with self.__measure("cache") as record:
+                self.cache_key = self.cache.get_key(filename, as_lists, filter_key)
+                cached = self.cache.load(self.cache_key)
+                record["elements"] = int(cached is not None)
+        if cached is not None:
+            self.__header = cached["header"]
+            self.data = cached
+        else:
+            self.__open()
+        if not lazy:
+            self.__parse_all()
+
+    def __open(self):
+        # In lazy mode compressed archives are streamed, header queries only decompress up to the string table
+        with self.__measure("open") as record:
+            binary = open_bfres(self.filename, stream=self.lazy)
+            decoder = None
+            if isinstance(binary, Yaz0Decoder):
+                decoder, binary = binary, binary.output
+            record["bytes"] = len(binary)
+        self.binary = binary
+        # Kept to be closed with the parser, only uncompressed archives are mapped
+        if isinstance(binary, memoryview) and isinstance(binary.obj, mmap.mmap):
+            self.mapping = binary.obj
+        self.context = ParseContext(self.binary, self.as_lists, decoder, self.stats, self.filters,
+                                    self.cancel_event, BUFFERS if self.dedup else None)
+        with self.__measure("header") as record:
+            self.__header = self.__parse_header()
+            record["elements"] = len(self.__header["file_offsets"][0])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        # Unmaps an uncompressed archive, parsed data stays usable but sections that were not parsed yet are gone
+        mapping = self.__dict__.pop("mapping", None)
+        if mapping is None:
+            return
+        try:
+            self.binary.release()
+            mapping.close()
+        except BufferError:
+            # Views still in use keep the mapping alive, it is unmapped once they are freed
+            pass
+
+    def __parse_all(self):
+        # Outside of lazy mode everything is parsed up front, the cached properties keep the results
+        _ = self.data
+        _ = self.dict
+
+    @classmethod
+    async def open_async(cls, filename, executor=None, **options):
+        # Reading, decompression and parsing run in the executor (the loop's default thread pool without one),
+        # cancelling the awaiting task stops the parse at its next stage
+        loop = asyncio.get_running_loop()
+        cancel_event = threading.Event()
+        try:
+            return await loop.run_in_executor(executor, partial(cls, filename, cancel_event=cancel_event, **options))
+        except asyncio.CancelledError:
+            cancel_event.set()
+            raise
+
+    @classmethod
+    async def open_many_async(cls, filenames, concurrency=4, executor=None, return_exceptions=False, **options):
+        # At most concurrency archives are parsed at once, results keep the order of the filenames
+        semaphore = asyncio.Semaphore(concurrency)
 
-        self.data = {
+        async def open_bounded(filename):
+            async with semaphore:
+                return await cls.open_async(filename, executor, **options)
+
+        tasks = [asyncio.ensure_future(open_bounded(filename)) for filename in filenames]
+        try:
+            return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+        except BaseException:
+            # The first failure stops every other parse at its next stage, waiting ones never start
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    @cached_property
+    def models(self):
+        # In lazy mode, models and their sections are only parsed when first accessed
+        if "context" not in self.__dict__:
+            self.__open()
+        self.context.require()
+        return LazyList(len(self.__header["file_offsets"][0]), self.__parse_fmdl)
+
+    @property
+    def header(self):
+        return self.__header
+
+    @property
+    def model_names(self):
+        return [entry[0] for entry in self.__header["file_offsets"][0]]
+
+    def get_model(self, name):
+        # Opening the archive after a cache hit replaces the cached header with one holding index groups
+        models = self.models
+        if not len(models):
+            raise KeyError(f"{name} (the archive has no models)")
+        return models[self.__header["file_offsets"][0].get_index(name)]
+
+    @cached_property
+    def data(self):
+        data = {
             "header": self.__header,
-            "fmdl": self.__fmdl
+            "fmdl": [self.models[m].get_parsed_data() for m, name in enumerate(self.model_names)
+                     if self.filters.keep_model(name)]
         }
+        if self.cache is not None:
+            self.cache.store(self.cache_key, data)
+        return data
+
+    @cached_property
+    def dict(self):
+        with self.__measure("dict") as record:
+            friendly_dict = self.__create_friendly_dict()
+            record["elements"] = len(friendly_dict["models"])
+        return friendly_dict
 
-        self.dict = self.__create_friendly_dict()
+    def __measure(self, stage, **labels):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise ParseCancelled(stage)
+        if self.stats is None:
+            return nullcontext({})
+        return self.stats.measure(stage, **labels)
 
     def __parse_header(self):
-        cursor = Cursor(self.binary, 0)
-        header = {}
-        header["magic"] = cursor.read_chars(4)
-        header["version"] = []
-        for i in range(4):
-            header["version"].append(cursor.read_uint8())
-        header["bom"] = cursor.read_uint16()
-        header["header_length"] = cursor.read_uint16()
-        header["file_size"] = cursor.read_uint32()
-        header["file_alignment"] = cursor.read_uint32()
-        header["name"] = read_string(self.binary, cursor.read_offset())
-        header["string_table_length"] = cursor.read_sint32()
-        header["string_table_offset"] = cursor.read_offset()
-        header["file_offsets"] = []
-        header["file_counts"] = []
-        for i in range(12):
-            index_group_offset = cursor.read_offset()
-            if index_group_offset != 0:
-                header["file_offsets"].append(search_index_group(self.binary, index_group_offset))
-            else:
-                header["file_offsets"].append([])
-        for i in range(12):
-            header["file_counts"].append(cursor.read_uint16())
-        header["user_pointer"] = cursor.read_uint32()
+        self.context.require(HEADER.size)
+        if len(self.binary) < HEADER.size or bytes(self.binary[:4]) != b"FRES":
+            raise ValueError("Not a BFRES file")
+        header = HEADER.read(self.binary, 0)
+        strings = self.context.strings
+        self.context.require(header["string_table_offset"] + header["string_table_length"])
+        strings.load(header["string_table_offset"], header["string_table_length"])
+        header["name"] = strings.get(header["name"])
+        header["file_offsets"] = [self.context.get_index_group(index_group_offset) if index_group_offset != 0
+                                  else [] for index_group_offset in header["file_offsets"]]
+        self.context.header = header
 
         return header
 
-    def __parse_fmdl(self):
-        fmdl_sections = []
-        for entry in self.__header["file_offsets"][0]:
-            fmdl_entry = Fmdl(self.binary, self.__header, entry[1])
-            fmdl_sections.append(fmdl_entry.get_parsed_data())
-        return fmdl_sections
+    def __parse_fmdl(self, index):
+        return Fmdl(self.context, self.__header["file_offsets"][0][index][1], self.lazy)
 
     def __create_friendly_dict(self):
         infos = {
@@ -62,7 +216,7 @@ class BfresParser:
             },
             "models": []
         }
-        for group in self.__fmdl:
+        for group in self.data["fmdl"]:
             infos["models"].append({
                 "infos": {
                     "name": group["header"]["name"],
@@ -75,8 +229,10 @@ class BfresParser:
                         "flags": group["fskl"]["header"]["flags"],
                     },
                     "bones": []
-                }
+                } if group["fskl"] is not None else None
             })
+            # Objects by vertex buffer index, filtered out buffers leave gaps
+            objects = {}
             for o in range(len(group["fvtx"])):
                 infos["models"][-1]["objects"].append({
                     "infos": {
@@ -88,6 +244,7 @@ class BfresParser:
                     "vertex_buffer": {},
                     "lod_models": []
                 })
+                objects[group["fvtx"][o]["header"]["section_index"]] = infos["models"][-1]["objects"][-1]
                 infos["models"][-1]["infos"]["total_vertex_count"] += group["fvtx"][o]["header"]["vertex_count"]
                 for attribute in group["fvtx"][o]["attributes"].keys():
                     infos["models"][-1]["objects"][-1]["vertex_buffer"][attribute] = {
@@ -131,35 +288,71 @@ class BfresParser:
                         "name": option[0],
                         "value": option[1]
                     })
-            for b in range(len(group["fskl"]["bones"])):
+            # Bone rows are built from plain values, every column of the skeleton table is converted once
+            bones = group["fskl"]["bones"] if group["fskl"] is not None else []
+            for bone in bones.tolist() if isinstance(bones, Table) else bones:
                 infos["models"][-1]["skeleton"]["bones"].append({
                     "infos": {
-                        "name": group["fskl"]["bones"][b]["name"],
-                        "index": group["fskl"]["bones"][b]["index"],
-                        "parent_index": group["fskl"]["bones"][b]["parent_index"],
-                        "flags": group["fskl"]["bones"][b]["flags"],
+                        "name": bone["name"],
+                        "index": bone["index"],
+                        "parent_index": bone["parent_index"],
+                        "flags": bone["flags"],
                         "transform": {
-                            "scale": group["fskl"]["bones"][b]["scale"],
-                            "roation": group["fskl"]["bones"][b]["rotation"],
-                            "translation": group["fskl"]["bones"][b]["translation"],
+                            "scale": bone["scale"],
+                            "roation": bone["rotation"],
+                            "translation": bone["translation"],
                         }
                     }
                 })
             for s in range(len(group["fshp"])):
                 for lod in group["fshp"][s]["lod_models"]:
-                    infos["models"][-1]["objects"][group["fshp"][s]["header"]["fvtx_index"]]["lod_models"].append({
+                    objects[group["fshp"][s]["header"]["fvtx_index"]]["lod_models"].append({
                         "infos": {
+                            "index": lod["index"],
                             "primitive_type": lod["primitive_type_name"],
                             "index_format": lod["index_format_name"],
                         },
                         "primitives": []
                     })
                     for vis in lod["vis_groups"]:
-                        infos["models"][-1]["objects"][group["fshp"][s]["header"]["fvtx_index"]]["lod_models"][-1][
+                        objects[group["fshp"][s]["header"]["fvtx_index"]]["lod_models"][-1][
                             "primitives"].append(
                             vis["primitives"]
                         )
         return infos
 
-    def to_obj(self):
-        return ObjConverter(self.dict).create_wavefront()
+    def skin(self, poses=None):
+        # Skinned positions and normals of every shape by model and shape name, poses maps model names to the world
+        # matrices of their bones (see fskl.get_world_matrices), models without one are in their bind pose
+        data = self.data
+        poses = poses or {}
+        with self.__measure("skinning") as record:
+            meshes = {model["header"]["name"]: skin_model(model, poses.get(model["header"]["name"]))
+                      for model in data["fmdl"]}
+            record["elements"] = sum(len(mesh["positions"]) for model in meshes.values() for mesh in model.values())
+        return meshes
+
+    def to_obj(self, file=None):
+        # Streams the models to the file object when given, otherwise returns the whole text
+        friendly_dict = self.dict
+        with self.__measure("obj"):
+            if file is None:
+                return ObjConverter(friendly_dict).create_wavefront()
+            ObjConverter(friendly_dict).write_wavefront(file)
+
+    def to_glb(self, file=None):
+        # Binary glTF built from the raw data, the file object must be opened in binary mode
+        data = self.data
+        with self.__measure("glb"):
+            if file is None:
+                return GlbConverter(data).create_glb()
+            GlbConverter(data).write_glb(file)
+
+    def to_json(self, file=None, sidecar_file=None, blob_directory=None):
+        # Compact friendly dict, arrays are written to the binary sidecar file or to the blob directory (shared by
+        # every export, one file per distinct array) when given, base64 otherwise
+        friendly_dict = self.dict
+        with self.__measure("json"):
+            if file is None:
+                return JsonConverter(friendly_dict).create_json()
+            JsonConverter(friendly_dict).write_json(file, sidecar_file, blob_directory)
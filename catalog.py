@@ -0,0 +1,290 @@
+import argparse
+import os
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from bfres_parser import BfresParser
+from batch import find_archives
+from BfresParser.filters import ParseFilter
+from BfresParser.tools import hash_file
+
+
+# Dictionaries, headers and shader assigns are read, no vertex or index buffer is decoded
+CATALOG_FILTER = ParseFilter(attributes=[], lods=[])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archives (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    name TEXT,
+    version TEXT
+);
+CREATE TABLE IF NOT EXISTS models (
+    id INTEGER PRIMARY KEY,
+    archive_id INTEGER NOT NULL REFERENCES archives(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    vertex_count INTEGER
+);
+CREATE TABLE IF NOT EXISTS shapes (
+    id INTEGER PRIMARY KEY,
+    archive_id INTEGER NOT NULL REFERENCES archives(id) ON DELETE CASCADE,
+    model_id INTEGER NOT NULL REFERENCES models(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    material TEXT,
+    vertex_count INTEGER,
+    skin_count INTEGER
+);
+CREATE TABLE IF NOT EXISTS materials (
+    id INTEGER PRIMARY KEY,
+    archive_id INTEGER NOT NULL REFERENCES archives(id) ON DELETE CASCADE,
+    model_id INTEGER NOT NULL REFERENCES models(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    shader_archive TEXT,
+    shader_model TEXT
+);
+CREATE TABLE IF NOT EXISTS shader_options (
+    material_id INTEGER NOT NULL REFERENCES materials(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS bones (
+    id INTEGER PRIMARY KEY,
+    archive_id INTEGER NOT NULL REFERENCES archives(id) ON DELETE CASCADE,
+    model_id INTEGER NOT NULL REFERENCES models(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    parent TEXT
+);
+CREATE INDEX IF NOT EXISTS models_name ON models(name);
+CREATE INDEX IF NOT EXISTS shapes_name ON shapes(name);
+CREATE INDEX IF NOT EXISTS materials_name ON materials(name);
+CREATE INDEX IF NOT EXISTS materials_shader_model ON materials(shader_model);
+CREATE INDEX IF NOT EXISTS materials_shader_archive ON materials(shader_archive);
+CREATE INDEX IF NOT EXISTS shader_options_name ON shader_options(name);
+CREATE INDEX IF NOT EXISTS bones_name ON bones(name);
+CREATE INDEX IF NOT EXISTS models_archive ON models(archive_id);
+CREATE INDEX IF NOT EXISTS shapes_archive ON shapes(archive_id);
+CREATE INDEX IF NOT EXISTS materials_archive ON materials(archive_id);
+CREATE INDEX IF NOT EXISTS bones_archive ON bones(archive_id);
+CREATE INDEX IF NOT EXISTS shader_options_material ON shader_options(material_id);
+"""
+
+# Searchable tables --> columns that can be filtered on
+SEARCH_COLUMNS = {
+    "models": ["name"],
+    "shapes": ["name", "material"],
+    "materials": ["name", "shader_archive", "shader_model"],
+    "bones": ["name", "parent"]
+}
+
+
+def extract_archive(path):
+    # Plain records only, so archives can be read in worker processes
+    with BfresParser(path, lazy=True, filters=CATALOG_FILTER) as bfres_file:
+        archive = {
+            "name": bfres_file.header["name"],
+            "version": ".".join(str(number) for number in bfres_file.header["version"]),
+            "models": []
+        }
+        for m, model_name in enumerate(bfres_file.model_names):
+            data = bfres_file.models[m].get_parsed_data()
+            material_names = [material[0] for material in data["header"]["fmat_dict"] or []]
+            fvtx_sections = {fvtx["header"]["section_index"]: fvtx["header"] for fvtx in data["fvtx"]}
+            bones = data["fskl"]["bones"] if data["fskl"] is not None else []
+            archive["models"].append({
+                "name": model_name,
+                "vertex_count": data["header"]["vertex_count"],
+                "shapes": [{
+                    "name": shape["header"]["poly_name"],
+                    "material": material_names[shape["header"]["fmat_index"]]
+                    if shape["header"]["fmat_index"] < len(material_names) else None,
+                    "vertex_count": fvtx_sections.get(shape["header"]["fvtx_index"], {}).get("vertex_count"),
+                    "skin_count": shape["header"]["vtx_skin_count"]
+                } for shape in data["fshp"]],
+                "materials": [{
+                    "name": material_names[f],
+                    "shader_archive": fmat["shader_assign"]["archive_name"],
+                    "shader_model": fmat["shader_assign"]["model_name"],
+                    "shader_options": [(option[0], option[1]) for option in fmat["shader_assign"]["param_dict"]]
+                } for f, fmat in enumerate(data["fmat"])],
+                "bones": [{
+                    "name": bone["name"],
+                    "parent": bones[bone["parent_index"]]["name"] if bone["parent_index"] < len(bones) else None
+                } for bone in bones]
+            })
+        return archive
+
+
+def extract_archive_safely(path):
+    try:
+        return path, extract_archive(path), None
+    except Exception as error:
+        return path, None, f"{type(error).__name__}: {error}"
+
+
+class Catalog:
+    def __init__(self, database):
+        self.connection = sqlite3.connect(database)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def index(self, paths, workers=1, prune_directory=None, log=None):
+        # Archives are skipped when their mtime and size did not change, or when their content hash is the same
+        known = {row["path"]: row for row in self.connection.execute("SELECT path, mtime, size, hash FROM archives")}
+        changed = []
+        skipped = 0
+        for path in paths:
+            stat = os.stat(path)
+            row = known.get(path)
+            if row is not None and row["mtime"] == stat.st_mtime and row["size"] == stat.st_size:
+                skipped += 1
+                continue
+            content_hash = hash_file(path)
+            if row is not None and row["hash"] == content_hash:
+                self.connection.execute("UPDATE archives SET mtime = ?, size = ? WHERE path = ?",
+                                        (stat.st_mtime, stat.st_size, path))
+                skipped += 1
+                continue
+            changed.append((path, stat, content_hash))
+
+        if workers > 1 and len(changed) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(extract_archive_safely, [path for path, _, _ in changed], chunksize=16)
+                failed = self.__store_all(changed, results, log)
+        else:
+            failed = self.__store_all(changed, map(extract_archive_safely, [path for path, _, _ in changed]), log)
+
+        removed = 0
+        if prune_directory is not None:
+            # Archives of the directory that no longer exist are forgotten
+            present = set(paths)
+            prefix = os.path.join(prune_directory, "")
+            for path in known:
+                if path.startswith(prefix) and path not in present:
+                    self.connection.execute("DELETE FROM archives WHERE path = ?", (path,))
+                    removed += 1
+        self.connection.commit()
+        return {"indexed": len(changed) - len(failed), "skipped": skipped, "removed": removed, "failed": failed}
+
+    def index_directory(self, directory, workers=1, log=None):
+        return self.index(find_archives(directory), workers, directory, log)
+
+    def __store_all(self, changed, results, log):
+        failed = []
+        for (path, stat, content_hash), (_, archive, error) in zip(changed, results):
+            if error is not None:
+                failed.append((path, error))
+                if log is not None:
+                    print(f"{path} failed: {error}", file=log)
+                continue
+            self.__store(path, stat, content_hash, archive)
+        return failed
+
+    def __store(self, path, stat, content_hash, archive):
+        execute = self.connection.execute
+        execute("DELETE FROM archives WHERE path = ?", (path,))
+        archive_id = execute("INSERT INTO archives (path, mtime, size, hash, name, version) VALUES (?, ?, ?, ?, ?, ?)",
+                             (path, stat.st_mtime, stat.st_size, content_hash, archive["name"],
+                              archive["version"])).lastrowid
+        for model in archive["models"]:
+            model_id = execute("INSERT INTO models (archive_id, name, vertex_count) VALUES (?, ?, ?)",
+                               (archive_id, model["name"], model["vertex_count"])).lastrowid
+            self.connection.executemany(
+                "INSERT INTO shapes (archive_id, model_id, name, material, vertex_count, skin_count) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(archive_id, model_id, shape["name"], shape["material"], shape["vertex_count"], shape["skin_count"])
+                 for shape in model["shapes"]])
+            self.connection.executemany(
+                "INSERT INTO bones (archive_id, model_id, name, parent) VALUES (?, ?, ?, ?)",
+                [(archive_id, model_id, bone["name"], bone["parent"]) for bone in model["bones"]])
+            for material in model["materials"]:
+                material_id = execute(
+                    "INSERT INTO materials (archive_id, model_id, name, shader_archive, shader_model) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (archive_id, model_id, material["name"], material["shader_archive"],
+                     material["shader_model"])).lastrowid
+                self.connection.executemany(
+                    "INSERT INTO shader_options (material_id, name, value) VALUES (?, ?, ?)",
+                    [(material_id, name, value) for name, value in material["shader_options"]])
+
+    def find(self, table, like=False, **conditions):
+        # Rows of the table matching every condition, with the archive path and model name they belong to,
+        # with like the values are SQL LIKE patterns
+        if table not in SEARCH_COLUMNS:
+            raise ValueError(f"Unknown table {table}")
+        clauses = []
+        values = []
+        for column, value in conditions.items():
+            if column not in SEARCH_COLUMNS[table]:
+                raise ValueError(f"Unknown column {column} of {table}")
+            clauses.append(f"t.{column} {'LIKE' if like else '='} ?")
+            values.append(value)
+        model_column = "t.name AS model" if table == "models" else "m.name AS model"
+        model_join = "" if table == "models" else "JOIN models m ON m.id = t.model_id"
+        query = (f"SELECT a.path AS archive, {model_column}, t.* FROM {table} t "
+                 f"JOIN archives a ON a.id = t.archive_id {model_join}")
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        return [dict(row) for row in self.connection.execute(query + " ORDER BY a.path", values)]
+
+    def find_archives(self, table, like=False, **conditions):
+        return sorted({row["archive"] for row in self.find(table, like, **conditions)})
+
+    def find_shader_option(self, name, value=None):
+        query = ("SELECT a.path AS archive, m.name AS model, t.name AS material, o.name, o.value "
+                 "FROM shader_options o JOIN materials t ON t.id = o.material_id "
+                 "JOIN archives a ON a.id = t.archive_id JOIN models m ON m.id = t.model_id WHERE o.name = ?")
+        values = [name]
+        if value is not None:
+            query += " AND o.value = ?"
+            values.append(value)
+        return [dict(row) for row in self.connection.execute(query + " ORDER BY a.path", values)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Catalog of archive contents in a SQLite database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    index_parser = subparsers.add_parser("index", help="index or update every archive of a directory")
+    index_parser.add_argument("database")
+    index_parser.add_argument("directory")
+    index_parser.add_argument("-j", "--workers", type=int, default=1)
+    find_parser = subparsers.add_parser("find", help="find rows, like: find catalog.db bones name=Head")
+    find_parser.add_argument("database")
+    find_parser.add_argument("table", choices=list(SEARCH_COLUMNS))
+    find_parser.add_argument("conditions", nargs="*", metavar="COLUMN=VALUE")
+    find_parser.add_argument("--like", action="store_true", help="values are SQL LIKE patterns")
+    find_parser.add_argument("--archives", action="store_true", help="only list the archives")
+    args = parser.parse_args(argv)
+
+    with Catalog(args.database) as catalog:
+        if args.command == "index":
+            summary = catalog.index_directory(args.directory, args.workers, sys.stderr)
+            print(f"{summary['indexed']} indexed, {summary['skipped']} up to date, {summary['removed']} removed, "
+                  f"{len(summary['failed'])} failed")
+            return 1 if summary["failed"] else 0
+
+        conditions = dict(condition.split("=", 1) for condition in args.conditions)
+        if args.archives:
+            for archive in catalog.find_archives(args.table, args.like, **conditions):
+                print(archive)
+        else:
+            for row in catalog.find(args.table, args.like, **conditions):
+                print(f"{row['archive']} {row['model']} {row['name']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,4 @@
 from bfres_parser import BfresParser
-import json
 
 
 bfres_file = BfresParser('Animal_Moose.sbfres')
@@ -8,16 +7,18 @@ bfres_file = BfresParser('Animal_Moose.sbfres')
 # bfres_file.binary
 
 # Friendly formatted data, way easier to read and to extract data from
+# Vertices are NumPy arrays of shape (vertex_count, components)
+# BfresParser('Animal_Moose.sbfres', as_lists=True) gives plain lists instead
 # bfres_file.dict
 
 # Raw data, contain almost everything that has been parsed
 # bfres_file.data
 
-# Write data to json (can be quite large, more than 30 MB depending on the file opened)
-with open('output.json', 'w') as output_file:
-    output_file.write(json.dumps(bfres_file.dict, indent=4))
+# Write data to compact json, vertices and primitives are written to the binary sidecar file
+# BfresParser.Converter.json_export.load_json(open('output.json'), 'output.bin') reads both back
+with open('output.json', 'w') as output_file, open('output.bin', 'wb') as sidecar_file:
+    bfres_file.to_json(output_file, sidecar_file)
 
-# Export every models to .obj format
-obj_models = bfres_file.to_obj()
+# Export every models to .obj format, streamed to the file
 with open('models.obj', 'w') as obj_file:
-    obj_file.write(obj_models)
+    bfres_file.to_obj(obj_file)
@@ -0,0 +1,184 @@
+import argparse
+from contextlib import ExitStack
+
+import numpy as np
+
+from bfres_parser import BfresParser
+from BfresParser.filters import ParseFilter
+
+
+# Only FSHP headers and vis trees are decoded to get the bounds of a shape
+BOUNDS_FILTER = ParseFilter(attributes=[], lods=[], materials=False, skeleton=False)
+POSITIONS_FILTER = ParseFilter(attributes=["_p0"], lods=[], materials=False, skeleton=False)
+
+
+def get_archive_bounds(filename):
+    # Bounds of every shape from the root of its vis tree and its radius, positions are only decoded without tree
+    with BfresParser(filename, lazy=True, filters=BOUNDS_FILTER) as bfres_file, ExitStack() as stack:
+        positions_file = None
+        bounds = []
+        for m, model_name in enumerate(bfres_file.model_names):
+            model = bfres_file.models[m]
+            for shape in model.fshp_sections:
+                shape_name = shape["header"]["poly_name"]
+                ranges = shape["vis_tree"]["ranges"]
+                radius = shape["header"]["radius"]
+                if len(ranges):
+                    center = ranges["center"][0]
+                    extent = ranges["extent"][0]
+                else:
+                    if positions_file is None:
+                        positions_file = stack.enter_context(BfresParser(filename, lazy=True,
+                                                                         filters=POSITIONS_FILTER))
+                    fvtx = positions_file.models[m].fvtx_sections[shape["header"]["fvtx_index"]]
+                    if "_p0" not in fvtx["attributes"] or not fvtx["header"]["vertex_count"]:
+                        continue
+                    positions = fvtx["attributes"]["_p0"]["vertices"][:, :3]
+                    minimum, maximum = positions.min(axis=0), positions.max(axis=0)
+                    center, extent = (minimum + maximum) / 2, (maximum - minimum) / 2
+                    radius = float(np.linalg.norm(positions - center, axis=1).max())
+                if radius <= 0:
+                    radius = float(np.linalg.norm(extent))
+                bounds.append((model_name, shape_name, center - extent, center + extent, center, radius))
+        return bounds
+
+
+class SpatialIndex:
+    # Packed BVH over the bounding boxes of every shape, nodes are stored depth first so the left child of a node
+    # is the next one, leaves hold a range of the item order
+    leaf_size = 4
+
+    def __init__(self, archives, models, shapes, minimum, maximum, centers, radii, nodes=None):
+        self.archives = np.asarray(archives, dtype=str)
+        self.models = np.asarray(models, dtype=str)
+        self.shapes = np.asarray(shapes, dtype=str)
+        self.minimum = np.asarray(minimum, dtype=np.float32).reshape(-1, 3)
+        self.maximum = np.asarray(maximum, dtype=np.float32).reshape(-1, 3)
+        self.centers = np.asarray(centers, dtype=np.float32).reshape(-1, 3)
+        self.radii = np.asarray(radii, dtype=np.float32)
+        if nodes is None:
+            nodes = self.build()
+        self.order, self.node_minimum, self.node_maximum, self.node_start, self.node_count, self.node_right = nodes
+
+    def __len__(self):
+        return len(self.archives)
+
+    @classmethod
+    def from_archives(cls, filenames):
+        columns = [[] for _ in range(7)]
+        for filename in filenames:
+            for bounds in get_archive_bounds(filename):
+                for column, value in zip(columns, (filename, *bounds)):
+                    column.append(value)
+        return cls(*columns)
+
+    def build(self):
+        order = np.arange(len(self), dtype=np.int64)
+        box_centers = (self.minimum + self.maximum) / 2
+        node_minimum, node_maximum, node_start, node_count, node_right = [], [], [], [], []
+
+        def build_node(start, end):
+            node = len(node_start)
+            items = order[start:end]
+            node_minimum.append(self.minimum[items].min(axis=0))
+            node_maximum.append(self.maximum[items].max(axis=0))
+            node_start.append(start)
+            node_count.append(end - start)
+            node_right.append(-1)
+            if end - start <= self.leaf_size:
+                return node
+            # Median split along the axis where box centers are the most spread
+            points = box_centers[items]
+            axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+            middle = (end - start) // 2
+            order[start:end] = items[np.argpartition(points[:, axis], middle)]
+            node_count[node] = 0
+            build_node(start, start + middle)
+            node_right[node] = build_node(start + middle, end)
+            return node
+
+        if len(self):
+            build_node(0, len(self))
+        return (order, np.array(node_minimum, dtype=np.float32).reshape(-1, 3),
+                np.array(node_maximum, dtype=np.float32).reshape(-1, 3), np.array(node_start, dtype=np.int64),
+                np.array(node_count, dtype=np.int64), np.array(node_right, dtype=np.int64))
+
+    def query_aabb(self, minimum, maximum):
+        minimum = np.asarray(minimum, dtype=np.float32)
+        maximum = np.asarray(maximum, dtype=np.float32)
+        return self.__query(lambda low, high: (low <= maximum).all(axis=-1) & (high >= minimum).all(axis=-1))
+
+    def query_sphere(self, center, radius):
+        # Shapes must overlap the sphere with both their box and their own bounding sphere
+        center = np.asarray(center, dtype=np.float32)
+
+        def overlaps(low, high):
+            return ((np.clip(center, low, high) - center) ** 2).sum(axis=-1) <= radius * radius
+
+        return [i for i in self.__query(overlaps)
+                if ((self.centers[i] - center) ** 2).sum() <= (radius + self.radii[i]) ** 2]
+
+    def records(self, indices):
+        return [{
+            "archive": str(self.archives[i]),
+            "model": str(self.models[i]),
+            "shape": str(self.shapes[i]),
+            "minimum": self.minimum[i].tolist(),
+            "maximum": self.maximum[i].tolist(),
+            "center": self.centers[i].tolist(),
+            "radius": float(self.radii[i])
+        } for i in indices]
+
+    def __query(self, overlaps):
+        found = []
+        stack = [0] if len(self.node_start) else []
+        while stack:
+            node = stack.pop()
+            if not overlaps(self.node_minimum[node], self.node_maximum[node]):
+                continue
+            if self.node_count[node]:
+                items = self.order[self.node_start[node]:self.node_start[node] + self.node_count[node]]
+                found.extend(items[overlaps(self.minimum[items], self.maximum[items])].tolist())
+            else:
+                stack.append(self.node_right[node])
+                stack.append(node + 1)
+        return sorted(found)
+
+    def save(self, filename):
+        np.savez(filename, archives=self.archives, models=self.models, shapes=self.shapes, minimum=self.minimum,
+                 maximum=self.maximum, centers=self.centers, radii=self.radii, order=self.order,
+                 node_minimum=self.node_minimum, node_maximum=self.node_maximum, node_start=self.node_start,
+                 node_count=self.node_count, node_right=self.node_right)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as arrays:
+            nodes = tuple(arrays[name] for name in ("order", "node_minimum", "node_maximum", "node_start",
+                                                    "node_count", "node_right"))
+            return cls(arrays["archives"], arrays["models"], arrays["shapes"], arrays["minimum"], arrays["maximum"],
+                       arrays["centers"], arrays["radii"], nodes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query a spatial index of shape bounding boxes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build")
+    build_parser.add_argument("index")
+    build_parser.add_argument("archives", nargs="+")
+    query_parser = subparsers.add_parser("query")
+    query_parser.add_argument("index")
+    query_parser.add_argument("bounds", nargs=6, type=float, metavar="MIN_X MIN_Y MIN_Z MAX_X MAX_Y MAX_Z")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        index = SpatialIndex.from_archives(args.archives)
+        index.save(args.index)
+        print(f"{len(index)} shapes indexed")
+    else:
+        index = SpatialIndex.load(args.index)
+        for record in index.records(index.query_aabb(args.bounds[:3], args.bounds[3:])):
+            print(f"{record['archive']} {record['model']} {record['shape']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import asyncio
+import threading
+
+import pytest
+
+from bfres_parser import BfresParser
+from BfresParser.context import ParseCancelled
+from BfresParser.synthetic import write_bfres
+
+
+def test_failure_cancels_other_parses(tmp_path):
+    path = str(tmp_path / "model.bfres")
+    write_bfres(path)
+    started = threading.Event()
+    cancel_events = []
+
+    class SlowParser(BfresParser):
+        def __init__(self, filename, cancel_event=None, **options):
+            if filename == "broken":
+                started.wait(5)
+                raise ValueError(filename)
+            cancel_events.append(cancel_event)
+            started.set()
+            # Stands for a long parse, it stops as soon as it is cancelled
+            cancel_event.wait(5)
+            super().__init__(filename, cancel_event=cancel_event, **options)
+
+    async def open_all():
+        with pytest.raises(ValueError):
+            await SlowParser.open_many_async([path, "broken", path, path], concurrency=2)
+        # Checked before asyncio.run cancels what is left
+        return [cancel_event.is_set() for cancel_event in cancel_events]
+
+    # Parses that started are cancelled, the last one never starts
+    cancelled = asyncio.run(open_all())
+    assert 1 <= len(cancelled) <= 2
+    assert all(cancelled)
+
+
+def test_cancelled_parse_raises(tmp_path):
+    path = str(tmp_path / "model.bfres")
+    write_bfres(path)
+    cancel_event = threading.Event()
+    cancel_event.set()
+    with pytest.raises(ParseCancelled):
+        BfresParser(path, cancel_event=cancel_event)
@@ -0,0 +1,44 @@
+import os
+
+import batch
+from BfresParser.synthetic import write_bfres
+
+
+def crashing_convert(archive, output, *args):
+    # Stands for a crash inside a native decoder, the worker dies without raising
+    if os.path.basename(archive).startswith("crash"):
+        os._exit(1)
+    return batch_convert(archive, output, *args)
+
+
+batch_convert = batch.convert
+
+
+def write_archives(input_dir, names, **options):
+    for name in names:
+        os.makedirs(os.path.dirname(input_dir / name), exist_ok=True)
+        write_bfres(str(input_dir / name), **options)
+
+
+def test_batch_converts_archives(tmp_path):
+    input_dir = tmp_path / "input"
+    write_archives(input_dir, ["a.bfres", "nested/b.sbfres"])
+    (input_dir / "broken.bfres").write_bytes(b"not an archive")
+    summary = batch.run(str(input_dir), str(tmp_path / "output"), workers=2, log=open(os.devnull, "w"))
+    assert sorted(os.path.basename(archive) for archive in summary["converted"]) == ["a.bfres", "b.sbfres"]
+    assert [os.path.basename(archive) for archive, _ in summary["failed"]] == ["broken.bfres"]
+    assert os.path.exists(tmp_path / "output" / "nested" / "b.sbfres.obj")
+    assert not any(name.endswith(".tmp") for _, _, files in os.walk(tmp_path / "output") for name in files)
+    # Converted archives are up to date on the next run
+    summary = batch.run(str(input_dir), str(tmp_path / "output"), workers=2, log=open(os.devnull, "w"))
+    assert summary["skipped"] == 2
+
+
+def test_dead_worker_only_fails_its_archive(tmp_path, monkeypatch):
+    input_dir = tmp_path / "input"
+    write_archives(input_dir, ["a.bfres", "b.bfres", "crash.bfres", "d.bfres", "e.bfres"], vertices=64)
+    monkeypatch.setattr(batch, "convert", crashing_convert)
+    summary = batch.run(str(input_dir), str(tmp_path / "output"), workers=2, log=open(os.devnull, "w"))
+    assert [os.path.basename(archive) for archive, _ in summary["failed"]] == ["crash.bfres"]
+    assert sorted(os.path.basename(archive) for archive in summary["converted"]) == \
+        ["a.bfres", "b.bfres", "d.bfres", "e.bfres"]
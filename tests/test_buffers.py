@@ -0,0 +1,84 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+from bfres_parser import BfresParser
+from BfresParser.buffers import BUFFERS, get_bytes, hash_array
+from BfresParser.Converter.json_export import JsonConverter, load_json
+from BfresParser.synthetic import write_bfres
+
+
+@pytest.fixture
+def empty_arrays_path(tmp_path):
+    # A skeleton without smooth matrices has (0, 3, 4) inverse matrices, the first vis group has (0, 3) primitives
+    path = str(tmp_path / "empty_arrays.bfres")
+    write_bfres(path, skin_count=1, smooth_matrices=False, vis_groups=3, empty_vis_groups=True)
+    return path
+
+
+@pytest.mark.parametrize("shape", [(0,), (0, 3), (0, 3, 4), (5, 0)])
+def test_empty_arrays_are_hashed(shape):
+    array = np.zeros(shape, dtype=np.float32)
+    assert len(get_bytes(array)) == 0
+    assert hash_array(array) != hash_array(np.zeros((0,), dtype=np.float32)) or shape == (0,)
+
+
+def test_hash_array_follows_content():
+    array = np.arange(12, dtype=np.float32).reshape(3, 4)
+    assert hash_array(array) == hash_array(array.copy())
+    assert hash_array(array.T) == hash_array(np.ascontiguousarray(array.T))
+    assert hash_array(array) != hash_array(array.reshape(4, 3))
+    assert hash_array(array) != hash_array(array.astype(">f4"))
+
+
+def test_empty_arrays_with_cache_and_dedup(tmp_path, empty_arrays_path):
+    cache_dir = str(tmp_path / "cache")
+    parsed = BfresParser(empty_arrays_path, cache_dir=cache_dir, dedup=True)
+    cached = BfresParser(empty_arrays_path, cache_dir=cache_dir, dedup=True)
+    assert "context" not in cached.__dict__
+    for bfres_file in (parsed, cached):
+        model = bfres_file.data["fmdl"][0]
+        assert model["fskl"]["inverse_matrices"].shape == (0, 3, 4)
+        assert model["fshp"][0]["lod_models"][0]["vis_groups"][0]["primitives"].shape == (0, 3)
+
+
+def test_empty_arrays_are_exported(tmp_path, empty_arrays_path):
+    bfres_file = BfresParser(empty_arrays_path)
+    primitives = json.loads(bfres_file.to_json())["models"][0]["objects"][0]["lod_models"][0]["primitives"]
+    assert primitives[0]["__array__"]["shape"] == [0, 3]
+    with open(tmp_path / "model.json", "w") as file, open(tmp_path / "model.bin", "wb") as sidecar_file:
+        bfres_file.to_json(file, sidecar_file)
+    with open(tmp_path / "model.json") as file:
+        loaded = load_json(file, str(tmp_path / "model.bin"))
+    assert loaded["models"][0]["objects"][0]["lod_models"][0]["primitives"][0].shape == (0, 3)
+    assert bfres_file.to_glb()[:4] == b"glTF"
+
+
+def test_dedup_shares_identical_buffers(tmp_path):
+    first_path, second_path = str(tmp_path / "first.bfres"), str(tmp_path / "second.bfres")
+    write_bfres(first_path, seed=3)
+    write_bfres(second_path, seed=3)
+    first = BfresParser(first_path, dedup=True).data["fmdl"][0]
+    second = BfresParser(second_path, dedup=True).data["fmdl"][0]
+    positions = first["fvtx"][0]["attributes"]["_p0"]["vertices"]
+    assert positions is second["fvtx"][0]["attributes"]["_p0"]["vertices"]
+    assert not positions.flags.writeable
+    assert first["fshp"][0]["lod_models"][0]["vis_groups"][0]["primitives"] is \
+        second["fshp"][0]["lod_models"][0]["vis_groups"][0]["primitives"]
+    # Without dedup every archive has its own writable arrays
+    unshared = BfresParser(first_path).data["fmdl"][0]["fvtx"][0]["attributes"]["_p0"]["vertices"]
+    assert unshared is not positions and unshared.flags.writeable
+    np.testing.assert_array_equal(unshared, positions)
+    assert len(BUFFERS) > 0
+
+
+def test_json_export_writes_identical_arrays_once():
+    array = np.arange(24, dtype=np.float32).reshape(8, 3)
+    sidecar_file = io.BytesIO()
+    file = io.StringIO()
+    JsonConverter({"first": array, "second": array.copy(), "other": array[:4]}).write_json(file, sidecar_file)
+    references = json.loads(file.getvalue())
+    assert references["first"] == references["second"] != references["other"]
+    assert len(sidecar_file.getvalue()) == array.nbytes + array[:4].nbytes
@@ -0,0 +1,99 @@
+import json
+import os
+
+import numpy as np
+
+from bfres_parser import BfresParser
+from BfresParser.cache import ParseCache
+from BfresParser.synthetic import write_bfres
+
+
+def get_entries(cache_dir):
+    return sorted(entry.name for entry in os.scandir(cache_dir) if entry.is_dir() and entry.name != "blobs")
+
+
+def test_cache_hit_and_miss(tmp_path):
+    path = str(tmp_path / "model.sbfres")
+    write_bfres(path)
+    cache_dir = str(tmp_path / "cache")
+    parsed = BfresParser(path, cache_dir=cache_dir)
+    cached = BfresParser(path, cache_dir=cache_dir)
+    # A hit never opens the archive
+    assert "context" not in cached.__dict__
+    assert cached.to_obj() == parsed.to_obj()
+    positions = cached.data["fmdl"][0]["fvtx"][0]["attributes"]["_p0"]["vertices"]
+    assert isinstance(positions.base, np.memmap) or isinstance(positions, np.memmap)
+    assert cached.get_model("Model_000").header["name"] == "Model_000"
+    # as_lists and changed archives have their own entries
+    assert "context" in BfresParser(path, cache_dir=cache_dir, as_lists=True).__dict__
+    write_bfres(path, seed=1)
+    assert "context" in BfresParser(path, cache_dir=cache_dir).__dict__
+    assert len(get_entries(cache_dir)) == 3
+
+
+def test_corrupt_entry_is_parsed_again(tmp_path):
+    path = str(tmp_path / "model.bfres")
+    write_bfres(path)
+    cache_dir = str(tmp_path / "cache")
+    expected = BfresParser(path, cache_dir=cache_dir).to_obj()
+    entry, = get_entries(cache_dir)
+    with open(os.path.join(cache_dir, entry, "meta.json"), "w") as f:
+        f.write("{broken")
+    reparsed = BfresParser(path, cache_dir=cache_dir)
+    assert "context" in reparsed.__dict__
+    assert reparsed.to_obj() == expected
+    # The entry was stored again
+    assert "context" not in BfresParser(path, cache_dir=cache_dir).__dict__
+
+
+def test_missing_blob_is_parsed_again(tmp_path):
+    path = str(tmp_path / "model.bfres")
+    write_bfres(path)
+    cache_dir = str(tmp_path / "cache")
+    expected = BfresParser(path, cache_dir=cache_dir).to_obj()
+    for blob in os.scandir(os.path.join(cache_dir, "blobs")):
+        os.remove(blob.path)
+    assert BfresParser(path, cache_dir=cache_dir).to_obj() == expected
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    paths = []
+    for seed in range(3):
+        paths.append(str(tmp_path / f"model_{seed}.bfres"))
+        write_bfres(paths[-1], seed=seed)
+    BfresParser(paths[0], cache_dir=cache_dir)
+    entry_size = sum(os.path.getsize(os.path.join(root, name))
+                     for root, _, names in os.walk(cache_dir) for name in names)
+    # Room for two entries
+    cache_size = int(entry_size * 2.5)
+    BfresParser(paths[1], cache_dir=cache_dir, cache_size=cache_size)
+    keys = [ParseCache(cache_dir).get_key(path) for path in paths]
+    assert get_entries(cache_dir) == sorted(keys[:2])
+    # Using the first entry makes the second one the oldest
+    os.utime(os.path.join(cache_dir, keys[1]), (0, 0))
+    assert "context" not in BfresParser(paths[0], cache_dir=cache_dir, cache_size=cache_size).__dict__
+    BfresParser(paths[2], cache_dir=cache_dir, cache_size=cache_size)
+    assert get_entries(cache_dir) == sorted([keys[0], keys[2]])
+    # Blobs of the evicted entry went with it
+    blobs = {blob.name for blob in os.scandir(os.path.join(cache_dir, "blobs"))}
+    assert len(blobs) == len({blob for key in (keys[0], keys[2])
+                              for blob in get_blobs(cache_dir, key)})
+
+
+def test_shared_blobs_are_kept(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    first, second = str(tmp_path / "first.bfres"), str(tmp_path / "second.sbfres")
+    write_bfres(first)
+    write_bfres(second)
+    BfresParser(first, cache_dir=cache_dir)
+    blobs = set(os.listdir(os.path.join(cache_dir, "blobs")))
+    # The same archive compressed holds the same arrays, they are only stored once
+    BfresParser(second, cache_dir=cache_dir)
+    assert set(os.listdir(os.path.join(cache_dir, "blobs"))) == blobs
+    assert len(get_entries(cache_dir)) == 2
+
+
+def get_blobs(cache_dir, key):
+    with open(os.path.join(cache_dir, key, "meta.json")) as f:
+        return [blob + ".npy" for blob in json.load(f)["blobs"]]
@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+from bfres_parser import BfresParser
+from BfresParser.synthetic import write_bfres
+from catalog import Catalog, main
+
+
+def write_archives(directory, count=3):
+    paths = []
+    for seed in range(count):
+        paths.append(os.path.join(directory, "sub" if seed else "", f"model_{seed}.sbfres" if seed else "model.bfres"))
+        os.makedirs(os.path.dirname(paths[-1]), exist_ok=True)
+        write_bfres(paths[-1], seed=seed, models=seed + 1, materials=2, bones=3)
+    return paths
+
+
+def test_index_and_find(tmp_path):
+    paths = write_archives(str(tmp_path / "dump"))
+    with Catalog(str(tmp_path / "catalog.db")) as catalog:
+        summary = catalog.index_directory(str(tmp_path / "dump"))
+        assert summary == {"indexed": 3, "skipped": 0, "removed": 0, "failed": []}
+        assert len(catalog.find("models")) == 6
+        shapes = catalog.find("shapes", name="Model_001_Shape_001")
+        assert [(row["archive"], row["model"], row["material"]) for row in shapes] == [
+            (paths[1], "Model_001", "Model_001_Mat_001"), (paths[2], "Model_001", "Model_001_Mat_001")]
+        for path in paths:
+            # Parents are the bones at the parent indices of the archive
+            model = BfresParser(path).data["fmdl"][0]
+            bones = model["fskl"]["bones"]
+            parents = [bones.name[parent] if parent < len(bones) else None for parent in bones.parent_index]
+            rows = [row for row in catalog.find("bones") if row["archive"] == path and row["model"] == "Model_000"]
+            assert [(row["name"], row["parent"]) for row in rows] == list(zip(bones.name, parents))
+        assert catalog.find_archives("materials", shader_model="model_1", name="Model_002_Mat_001") == [paths[2]]
+        assert catalog.find_archives("shapes", like=True, name="Model_002%") == [paths[2]]
+        assert catalog.find("bones", name="Head") == []
+        options = catalog.find_shader_option("option_1", "1")
+        assert len(options) == 12 and {row["value"] for row in options} == {"1"}
+        assert catalog.find_shader_option("option_1", "2") == []
+        with pytest.raises(ValueError):
+            catalog.find("textures")
+        with pytest.raises(ValueError):
+            catalog.find("shapes", shader_model="model_1")
+
+
+def test_updates(tmp_path):
+    directory = str(tmp_path / "dump")
+    paths = write_archives(directory)
+    database = str(tmp_path / "catalog.db")
+    with Catalog(database) as catalog:
+        catalog.index_directory(directory)
+    with Catalog(database) as catalog:
+        assert catalog.index_directory(directory) == {"indexed": 0, "skipped": 3, "removed": 0, "failed": []}
+        # Same content with a new modification time is only hashed
+        os.utime(paths[0], (0, 0))
+        assert catalog.index_directory(directory)["skipped"] == 3
+        assert catalog.index_directory(directory)["skipped"] == 3
+        # Changed and deleted archives
+        write_bfres(paths[0], seed=5, models=1, shapes=5)
+        os.remove(paths[2])
+        assert catalog.index_directory(directory) == {"indexed": 1, "skipped": 1, "removed": 1, "failed": []}
+        assert catalog.find_archives("models") == sorted(paths[:2])
+        assert len(catalog.find("shapes", like=True, name="Model_000_%")) == 5 + 2
+        assert catalog.find("bones", name="Model_002_Bone_000") == []
+        # Rows of the deleted archive went with it
+        assert catalog.connection.execute("SELECT COUNT(*) FROM shader_options o LEFT JOIN materials t "
+                                          "ON t.id = o.material_id WHERE t.id IS NULL").fetchone()[0] == 0
+
+
+def test_broken_archive(tmp_path):
+    directory = str(tmp_path / "dump")
+    paths = write_archives(directory, 2)
+    with open(os.path.join(directory, "broken.bfres"), "wb") as file:
+        file.write(b"FRES")
+    with Catalog(str(tmp_path / "catalog.db")) as catalog:
+        summary = catalog.index_directory(directory, workers=2)
+        assert summary["indexed"] == 2
+        assert [path for path, _ in summary["failed"]] == [os.path.join(directory, "broken.bfres")]
+        assert catalog.find_archives("models") == sorted(paths)
+
+
+def test_cli(tmp_path, capsys):
+    directory = str(tmp_path / "dump")
+    paths = write_archives(directory, 2)
+    database = str(tmp_path / "catalog.db")
+    assert main(["index", database, directory]) == 0
+    assert capsys.readouterr().out == "2 indexed, 0 up to date, 0 removed, 0 failed\n"
+    main(["find", database, "bones", "name=Model_000_Bone_001"])
+    assert capsys.readouterr().out.splitlines() == [f"{path} Model_000 Model_000_Bone_001" for path in paths]
+    main(["find", "--like", "--archives", database, "materials", "shader_model=%_1", "name=Model_001%"])
+    assert capsys.readouterr().out.splitlines() == [paths[1]]
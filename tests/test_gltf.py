@@ -0,0 +1,84 @@
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from bfres_parser import BfresParser
+from BfresParser.synthetic import write_bfres
+
+
+COMPONENT_DTYPES = {5121: np.uint8, 5123: np.uint16, 5125: np.uint32, 5126: np.float32}
+COMPONENT_COUNTS = {"SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4, "MAT4": 16}
+
+
+def read_glb(glb):
+    json_length = struct.unpack_from("<I", glb, 12)[0]
+    gltf = json.loads(glb[20:20 + json_length])
+    return gltf, glb[28 + json_length:]
+
+
+def read_accessor(gltf, binary, index):
+    accessor = gltf["accessors"][index]
+    view = gltf["bufferViews"][accessor["bufferView"]]
+    count = COMPONENT_COUNTS[accessor["type"]]
+    array = np.frombuffer(binary, COMPONENT_DTYPES[accessor["componentType"]], accessor["count"] * count,
+                          view["byteOffset"])
+    return array.reshape(accessor["count"], count)
+
+
+def get_node_matrix(node):
+    x, y, z, w = node.get("rotation", [0, 0, 0, 1])
+    matrix = np.identity(4)
+    matrix[:3, :3] = [[1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+                      [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+                      [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)]]
+    matrix[:3, :3] *= node.get("scale", [1, 1, 1])
+    matrix[:3, 3] = node.get("translation", [0, 0, 0])
+    return matrix
+
+
+def get_bind_positions(glb):
+    # Positions of every mesh node in the scene, skinned ones blended from their joints
+    gltf, binary = read_glb(glb)
+    world_matrices = {}
+
+    def visit(n, parent_matrix):
+        world_matrices[n] = parent_matrix @ get_node_matrix(gltf["nodes"][n])
+        for child in gltf["nodes"][n].get("children", []):
+            visit(child, world_matrices[n])
+
+    for root in gltf["scenes"][0]["nodes"]:
+        visit(root, np.identity(4))
+    meshes = {}
+    for n, node in enumerate(gltf["nodes"]):
+        if "mesh" not in node:
+            continue
+        attributes = gltf["meshes"][node["mesh"]]["primitives"][0]["attributes"]
+        positions = read_accessor(gltf, binary, attributes["POSITION"]).astype(np.float64)
+        positions = np.hstack([positions, np.ones((len(positions), 1))])
+        if "skin" in node:
+            skin = gltf["skins"][node["skin"]]
+            inverse_matrices = read_accessor(gltf, binary, skin["inverseBindMatrices"]).reshape(-1, 4, 4)
+            joint_matrices = np.array([world_matrices[joint] for joint in skin["joints"]]) @ \
+                inverse_matrices.transpose(0, 2, 1)
+            joints = read_accessor(gltf, binary, attributes["JOINTS_0"]).astype(np.int64)
+            weights = read_accessor(gltf, binary, attributes["WEIGHTS_0"]).astype(np.float64)
+            matrices = np.einsum("nk,nkij->nij", weights, joint_matrices[joints])
+        else:
+            matrices = np.broadcast_to(world_matrices[n], (len(positions), 4, 4))
+        meshes[node["name"]] = np.einsum("nij,nj->ni", matrices, positions)[:, :3]
+    return meshes
+
+
+@pytest.mark.parametrize("euler_bones", [False, True])
+@pytest.mark.parametrize("skin_count", [0, 1, 2])
+def test_bind_pose_matches_skinning(tmp_path, skin_count, euler_bones):
+    path = str(tmp_path / "skinned.bfres")
+    write_bfres(path, shapes=3, bones=6, skin_count=skin_count, euler_bones=euler_bones)
+    bfres_file = BfresParser(path)
+    skinned = bfres_file.skin()["Model_000"]
+    positions = get_bind_positions(bfres_file.to_glb())
+    assert set(positions) == set(skinned)
+    for name, mesh in skinned.items():
+        np.testing.assert_allclose(positions[name], mesh["positions"], atol=1e-3)
@@ -0,0 +1,64 @@
+import pytest
+
+from bfres_parser import BfresParser
+from BfresParser.index_group import IndexGroup, search_index_group
+from BfresParser.synthetic import FresWriter, write_bfres
+
+
+def build_group(names):
+    writer = FresWriter()
+    # An offset of 0 means no group
+    writer.alloc(0x20)
+    offset = writer.index_group([(name, 0x100 + n * 4) for n, name in enumerate(names)])
+    writer.write_string_table()
+    writer.resolve()
+    return bytes(writer.data), offset
+
+
+@pytest.mark.parametrize("names", [
+    [],
+    ["a"],
+    ["Mat", "Mat_", "Mat_0", "Mat_00", "aMat", "b", "ba", "ab"],
+    [f"Bone_{n}" for n in range(300)],
+])
+def test_search_finds_every_name(names):
+    binary, offset = build_group(names)
+    group = search_index_group(binary, offset)
+    assert len(group) == len(names)
+    for n, name in enumerate(names):
+        # A new group for each name, found by walking the tree and not from the decoded entries
+        found = IndexGroup(binary, offset)
+        assert found.search(name) == [n, name, found[n][1]]
+        assert found.get_index(name) == n and "entries" not in found.__dict__
+        assert name in found
+    for name in ["", "c", "Mat_000", "Bone_", "Bone_3000", "Bone_1a"]:
+        if name not in names:
+            found = IndexGroup(binary, offset)
+            assert found.search(name) is None
+            assert name not in found and found.get(name, "default") == "default"
+            with pytest.raises(KeyError):
+                found.get_index(name)
+    assert group.names == names
+    assert [group.get(name) for name in names] == [entry[1] for entry in group]
+
+
+def test_search_index_group_without_offset():
+    assert search_index_group(b"", 0) == 0
+
+
+def test_archive_dictionaries(tmp_path):
+    path = str(tmp_path / "model.bfres")
+    write_bfres(path, models=3, shapes=40, bones=60)
+    bfres_file = BfresParser(path, lazy=True)
+    for m, model_name in enumerate(bfres_file.model_names):
+        model = bfres_file.get_model(model_name)
+        shape_dict = model.header["fshp_dict"]
+        for s in range(40):
+            name = f"{model_name}_Shape_{s:03d}"
+            assert shape_dict.get_index(name) == s
+        assert "Model_000_Shape_040" not in shape_dict
+        bone_dict = model.fskl_section["header"]["bone_dict"]
+        assert [bone_dict.get_index(f"{model_name}_Bone_{b:03d}") for b in range(60)] == list(range(60))
+        # Lookups agree with the fully decoded dictionaries
+        parsed = BfresParser(path).data["fmdl"][m]
+        assert [entry[1] for entry in shape_dict] == [entry[1] for entry in parsed["header"]["fshp_dict"]]
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from bfres_parser import BfresParser
+from BfresParser.filters import ParseFilter, Exclude
+from BfresParser.synthetic import write_bfres
+from BfresParser.FMDL.fshp import query_vis_groups
+
+
+def test_zero_models(tmp_path):
+    path = str(tmp_path / "empty.bfres")
+    write_bfres(path, models=0)
+    for lazy in (False, True):
+        bfres_file = BfresParser(path, lazy=lazy)
+        assert bfres_file.model_names == []
+        assert len(bfres_file.models) == 0
+        assert bfres_file.dict["models"] == []
+        with pytest.raises(KeyError):
+            bfres_file.get_model("Model_000")
+
+
+def test_filtered_lods_keep_their_index(tmp_path):
+    path = str(tmp_path / "lods.bfres")
+    write_bfres(path, lods=3)
+    shape = BfresParser(path).data["fmdl"][0]["fshp"][0]
+    filtered_shape = BfresParser(path, filters=ParseFilter(lods=[2])).data["fmdl"][0]["fshp"][0]
+    assert [lod["index"] for lod in filtered_shape["lod_models"]] == [2]
+    assert query_vis_groups(filtered_shape, lod=2) == query_vis_groups(shape, lod=2)
+    assert query_vis_groups(filtered_shape, lod=0)["index_ranges"] == []
+
+
+def test_cache_keys_of_filters(tmp_path):
+    path = str(tmp_path / "cached.bfres")
+    write_bfres(path, shapes=3)
+    cache_dir = str(tmp_path / "cache")
+    BfresParser(path, cache_dir=cache_dir, filters=ParseFilter(shapes=Exclude("Model_000_Shape_001")))
+    cached = BfresParser(path, cache_dir=cache_dir, filters=ParseFilter(shapes=Exclude("Model_000_Shape_001")))
+    assert "context" not in cached.__dict__
+    assert len(cached.data["fmdl"][0]["fshp"]) == 2
+    # Predicates have no stable key, archives parsed with them are never cached
+    filtered = BfresParser(path, cache_dir=cache_dir, filters=ParseFilter(shapes=lambda name: name != "Model_000_Shape_001"))
+    assert filtered.cache is None
+    assert [shape["header"]["poly_name"] for shape in filtered.data["fmdl"][0]["fshp"]] == \
+        [shape["header"]["poly_name"] for shape in cached.data["fmdl"][0]["fshp"]]
+
+
+def test_friendly_bones_are_plain_values(tmp_path):
+    path = str(tmp_path / "bones.bfres")
+    write_bfres(path, bones=5)
+    skeleton = BfresParser(path).dict["models"][0]["skeleton"]
+    assert json.loads(json.dumps(skeleton)) == BfresParser(path, as_lists=True).dict["models"][0]["skeleton"]
+
+
+@pytest.mark.parametrize("name", ["empty.bfres", "empty.sbfres"])
+def test_empty_file(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(b"")
+    with pytest.raises(ValueError):
+        BfresParser(str(path))
+
+
+def test_close_unmaps_archive(tmp_path):
+    path = str(tmp_path / "mapped.bfres")
+    write_bfres(path)
+    with BfresParser(path) as bfres_file:
+        mapping = bfres_file.mapping
+    assert mapping.closed
+    # Parsed data stays usable
+    assert len(bfres_file.dict["models"]) == 1
+    with BfresParser(path, lazy=True) as bfres_file:
+        mapping = bfres_file.mapping
+        assert bfres_file.model_names == ["Model_000"]
+    assert mapping.closed
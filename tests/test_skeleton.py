@@ -0,0 +1,19 @@
+import numpy as np
+
+from BfresParser.FMDL.fskl import euler_to_matrices, matrices_to_quaternions, quaternions_to_matrices
+
+
+def test_quaternions_round_trip():
+    rng = np.random.default_rng(0)
+    quaternions = rng.normal(size=(500, 4))
+    # Half turns around one or two axes have a zero w
+    quaternions[:6] = [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0], [1, 1, 0, 0], [0, 1, -1, 0], [0, 0, 0, 1]]
+    quaternions /= np.linalg.norm(quaternions, axis=1, keepdims=True)
+    matrices = quaternions_to_matrices(quaternions)
+    np.testing.assert_allclose(quaternions_to_matrices(matrices_to_quaternions(matrices)), matrices, atol=1e-12)
+
+
+def test_euler_quaternions_match_matrices():
+    rotations = np.random.default_rng(1).uniform(-np.pi, np.pi, (500, 3))
+    matrices = euler_to_matrices(rotations)
+    np.testing.assert_allclose(quaternions_to_matrices(matrices_to_quaternions(matrices)), matrices, atol=1e-12)
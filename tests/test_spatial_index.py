@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from bfres_parser import BfresParser
+from BfresParser.synthetic import write_bfres
+from spatial_index import SpatialIndex, get_archive_bounds, main
+
+
+def get_random_index(count, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(-100, 100, (count, 3)).astype(np.float32)
+    extents = rng.uniform(0, 10, (count, 3)).astype(np.float32)
+    radii = np.linalg.norm(extents, axis=1) * rng.uniform(0.5, 1, count)
+    names = [f"Shape_{i:03d}" for i in range(count)]
+    return SpatialIndex(["archive.bfres"] * count, ["Model_000"] * count, names, centers - extents,
+                        centers + extents, centers, radii)
+
+
+def brute_force_aabb(index, minimum, maximum):
+    return np.flatnonzero((index.minimum <= maximum).all(axis=1) & (index.maximum >= minimum).all(axis=1)).tolist()
+
+
+def brute_force_sphere(index, center, radius):
+    closest = np.clip(center, index.minimum, index.maximum)
+    inside_box = ((closest - center) ** 2).sum(axis=1) <= radius * radius
+    inside_sphere = ((index.centers - center) ** 2).sum(axis=1) <= (radius + index.radii) ** 2
+    return np.flatnonzero(inside_box & inside_sphere).tolist()
+
+
+@pytest.mark.parametrize("count", [0, 1, 4, 5, 300])
+def test_queries_match_brute_force(tmp_path, count):
+    index = get_random_index(count)
+    rng = np.random.default_rng(1)
+    loaded = None
+    if count:
+        index.save(str(tmp_path / "index.npz"))
+        loaded = SpatialIndex.load(str(tmp_path / "index.npz"))
+    for _ in range(50):
+        corners = rng.uniform(-120, 120, (2, 3)).astype(np.float32)
+        minimum, maximum = corners.min(axis=0), corners.max(axis=0)
+        center, radius = corners[0], float(rng.uniform(0, 80))
+        expected_aabb = brute_force_aabb(index, minimum, maximum)
+        expected_sphere = brute_force_sphere(index, center, radius)
+        assert index.query_aabb(minimum, maximum) == expected_aabb
+        assert index.query_sphere(center, radius) == expected_sphere
+        if loaded is not None:
+            assert loaded.query_aabb(minimum, maximum) == expected_aabb
+            assert loaded.query_sphere(center, radius) == expected_sphere
+    assert index.query_aabb([-200] * 3, [200] * 3) == list(range(count))
+
+
+def test_archive_bounds(tmp_path):
+    path = str(tmp_path / "model.sbfres")
+    write_bfres(path, models=2, shapes=3, vis_groups=4)
+    bounds = get_archive_bounds(path)
+    shapes = [(model["header"]["name"], shape) for model in BfresParser(path).data["fmdl"]
+              for shape in model["fshp"]]
+    assert len(bounds) == len(shapes) == 6
+    for (model_name, shape_name, minimum, maximum, center, radius), (expected_model, shape) in zip(bounds, shapes):
+        assert (model_name, shape_name) == (expected_model, shape["header"]["poly_name"])
+        # The root of the vis tree holds every vis group
+        ranges = shape["vis_tree"]["ranges"]
+        np.testing.assert_allclose(center, ranges["center"][0])
+        np.testing.assert_allclose(maximum - minimum, 2 * ranges["extent"][0], rtol=1e-6)
+        assert radius == shape["header"]["radius"]
+
+
+def test_archives_and_cli(tmp_path, capsys):
+    paths = []
+    for seed in range(3):
+        paths.append(str(tmp_path / f"model_{seed}.bfres"))
+        write_bfres(paths[-1], seed=seed, shapes=seed + 1, vis_groups=2)
+    index = SpatialIndex.from_archives(paths)
+    assert len(index) == 6
+    records = index.records(index.query_aabb([-1e6] * 3, [1e6] * 3))
+    assert [(record["archive"], record["shape"]) for record in records] == [
+        (path, f"Model_000_Shape_{s:03d}") for p, path in enumerate(paths) for s in range(p + 1)]
+    assert records[0]["minimum"] == index.minimum[0].tolist()
+
+    index_path = str(tmp_path / "shapes.npz")
+    main(["build", index_path, *paths])
+    assert capsys.readouterr().out == "6 shapes indexed\n"
+    main(["query", index_path, *["1000000"] * 3, *["2000000"] * 3])
+    assert capsys.readouterr().out == ""
+    main(["query", index_path, *["-1000000"] * 3, *["1000000"] * 3])
+    assert capsys.readouterr().out.splitlines() == [f"{record['archive']} {record['model']} {record['shape']}"
+                                                    for record in records]
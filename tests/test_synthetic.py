@@ -0,0 +1,13 @@
+import pytest
+
+from bfres_parser import BfresParser
+from BfresParser.synthetic import write_bfres
+
+
+@pytest.mark.parametrize("version", [(3, 2, 0, 0), (3, 3, 0, 0), (3, 4, 0, 4)])
+def test_material_parameters_of_every_layout(tmp_path, version):
+    path = str(tmp_path / "version.bfres")
+    write_bfres(path, version=version)
+    parameters = BfresParser(path).dict["models"][0]["materials"][0]["parameters"]
+    assert [parameter["name"] for parameter in parameters] == ["param_0", "param_1", "param_2", "param_3"]
+    assert [len(parameter["value"]) for parameter in parameters] == [1, 2, 3, 4]
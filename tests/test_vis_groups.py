@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from bfres_parser import BfresParser
+from BfresParser.filters import ParseFilter
+from BfresParser.FMDL.fshp import query_vis_groups
+from BfresParser.synthetic import write_bfres
+
+
+def get_shapes(path, **options):
+    model = BfresParser(path, **options).data["fmdl"][0]
+    for shape in model["fshp"]:
+        positions = np.asarray(model["fvtx"][shape["header"]["fvtx_index"]]["attributes"]["_p0"]["vertices"])
+        yield shape, positions[:, :3]
+
+
+def get_box_planes(minimum, maximum):
+    # Inside where a * x + b * y + c * z + d >= 0
+    planes = []
+    for axis in range(3):
+        normal = np.identity(3)[axis]
+        planes.append([*normal, -minimum[axis]])
+        planes.append([*-normal, maximum[axis]])
+    return planes
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / "model.bfres")
+    write_bfres(path, shapes=3, vertices=500, lods=2, vis_groups=7)
+    return path
+
+
+def test_everything_and_nothing(path):
+    for shape, positions in get_shapes(path):
+        minimum, maximum = positions.min(axis=0), positions.max(axis=0)
+        everything = query_vis_groups(shape, aabb=(minimum, maximum))
+        assert everything["vis_groups"] == list(range(7))
+        assert query_vis_groups(shape) == everything
+        for lod in range(2):
+            lod_model = shape["lod_models"][lod]
+            assert query_vis_groups(shape, aabb=(minimum, maximum), lod=lod)["index_ranges"] == [
+                (vis_group["offset"] // 2, vis_group["count"]) for vis_group in lod_model["vis_groups"]]
+        far = query_vis_groups(shape, aabb=(maximum + 100, maximum + 200))
+        assert far == {"vis_groups": [], "index_ranges": []}
+        # Every box is behind the plane x <= minimum - 1
+        assert query_vis_groups(shape, frustum=[[-1, 0, 0, minimum[0] - 1]])["vis_groups"] == []
+
+
+def test_queries_match_triangles(path):
+    rng = np.random.default_rng(0)
+    for shape, positions in get_shapes(path):
+        groups = shape["lod_models"][0]["vis_groups"]
+        low, high = positions.min(axis=0), positions.max(axis=0)
+        for _ in range(20):
+            corners = rng.uniform(low, high, (2, 3))
+            minimum, maximum = corners.min(axis=0), corners.max(axis=0)
+            result = query_vis_groups(shape, aabb=(minimum, maximum))
+            # Groups with a vertex inside the box are always found, found groups have their bounds overlap it
+            points = [positions[group["primitives"].reshape(-1)] for group in groups]
+            inside = [g for g, p in enumerate(points) if ((p >= minimum) & (p <= maximum)).all(axis=1).any()]
+            overlapping = [g for g, p in enumerate(points)
+                           if (p.min(axis=0) <= maximum).all() and (p.max(axis=0) >= minimum).all()]
+            assert set(inside) <= set(result["vis_groups"]) <= set(overlapping)
+            assert result["index_ranges"] == [(groups[g]["offset"] // 2, groups[g]["count"])
+                                              for g in result["vis_groups"]]
+            # Planes of the box cull the same boxes
+            assert query_vis_groups(shape, frustum=get_box_planes(minimum, maximum)) == result
+            frustum = get_box_planes(minimum, maximum)[:3]
+            both = query_vis_groups(shape, aabb=(minimum, maximum), frustum=frustum)
+            assert both == result
+
+
+def test_as_lists_and_filtered_lods(path):
+    aabb = ([-1, -1, -1], [1, 1, 1])
+    expected = [query_vis_groups(shape, aabb=aabb, lod=1) for shape, _ in get_shapes(path)]
+    assert [query_vis_groups(shape, aabb=aabb, lod=1) for shape, _ in get_shapes(path, as_lists=True)] == expected
+    for shape, _ in get_shapes(path, filters=ParseFilter(lods=[1])):
+        assert query_vis_groups(shape, aabb=aabb, lod=1) == expected.pop(0)
+        # Filtered out LODs have no index ranges
+        assert query_vis_groups(shape, aabb=aabb)["index_ranges"] == []
+
+
+def test_empty_vis_groups(tmp_path):
+    path = str(tmp_path / "model.bfres")
+    write_bfres(path, vis_groups=3, empty_vis_groups=True)
+    for shape, positions in get_shapes(path):
+        result = query_vis_groups(shape, aabb=(positions.min(axis=0), positions.max(axis=0)))
+        assert result["vis_groups"] == [0, 1, 2]
+        assert result["index_ranges"][0] == (0, 0)
@@ -0,0 +1,57 @@
+import struct
+
+import pytest
+
+from bfres_parser import BfresParser
+from BfresParser.synthetic import generate_bfres, write_bfres
+from BfresParser.yaz0 import Yaz0Decoder, compress, decompress, iter_decompress
+
+
+def get_stream():
+    # Literals, an overlapping copy, a long copy (count in a third byte) and a literal again
+    expected = b"abc" + b"abcabc" + b"c" * 20 + b"x"
+    groups = bytes([0b11100100]) + b"abc" + bytes([0x40, 0x02]) + bytes([0x00, 0x00, 20 - 0x12]) + b"x"
+    return b"Yaz0" + struct.pack(">II", len(expected), 0) + bytes(4) + groups, expected
+
+
+def test_copies():
+    data, expected = get_stream()
+    assert decompress(data) == expected
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 2 ** 20])
+def test_streamed_decode_matches_full_decode(chunk_size):
+    data, expected = get_stream()
+    assert b"".join(iter_decompress(data, chunk_size)) == expected
+
+    archive = generate_bfres(shapes=3, vertices=100)
+    compressed = compress(archive)
+    assert b"".join(iter_decompress(compressed, 4096)) == decompress(compressed) == archive
+
+
+def test_partial_decode():
+    archive = generate_bfres()
+    decoder = Yaz0Decoder(compress(archive))
+    output = decoder.decompress_to(100)
+    # Whole groups are decompressed, never more than the size of the archive
+    assert 100 <= len(output) < len(archive) and not decoder.done
+    assert output == archive[:len(output)]
+    assert decoder.decompress_to() is output and decoder.done
+    assert output == archive
+
+
+def test_lazy_header_queries_only_decompress_part(tmp_path):
+    path = str(tmp_path / "model.sbfres")
+    write_bfres(path, models=2, shapes=4, vertices=2000)
+    bfres_file = BfresParser(path, lazy=True)
+    decoder = bfres_file.context.decoder
+    assert bfres_file.model_names == ["Model_000", "Model_001"]
+    assert not decoder.done
+    # Models decompress the rest as they are read
+    assert bfres_file.to_obj() == BfresParser(path).to_obj()
+    assert decoder.done
+
+
+def test_not_yaz0():
+    with pytest.raises(ValueError):
+        Yaz0Decoder(b"FRES" + bytes(12))